@@ -0,0 +1,18 @@
+import sys
+
+from twon_lss.utility import runlog
+from twon_lss.benchmarks import micro, mock_server, e2e
+
+
+COMMANDS = {
+    "compact": runlog.main,
+    "bench": micro.main,
+    "mock-server": mock_server.main,
+    "load-test": e2e.main,
+}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+        sys.exit(f"usage: python -m twon_lss {{{','.join(COMMANDS)}}} ...")
+    COMMANDS[sys.argv[1]](sys.argv[2:])
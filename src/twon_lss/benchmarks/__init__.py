@@ -0,0 +1,19 @@
+from twon_lss.benchmarks import data
+from twon_lss.benchmarks.micro import Scale, SCALES, Result, measure, run, compare
+from twon_lss.benchmarks.mock_server import MockLLMServer, MockServerConfig, Latency
+from twon_lss.benchmarks import e2e
+
+
+__all__ = [
+    "data",
+    "e2e",
+    "Scale",
+    "SCALES",
+    "Result",
+    "measure",
+    "run",
+    "compare",
+    "MockLLMServer",
+    "MockServerConfig",
+    "Latency",
+]
@@ -0,0 +1,86 @@
+import typing
+
+import numpy as np
+import networkx
+
+from twon_lss.schemas import User, Post, Feed, Network
+
+
+NETWORKS = ("erdos_renyi", "barabasi_albert", "complete")
+
+
+def users(n: int, prefix: str = "bench-user") -> typing.List[User]:
+    """`n` users with stable ids."""
+    return [User(id=f"{prefix}-{i}") for i in range(n)]
+
+
+def network(
+    users: typing.List[User],
+    kind: typing.Literal["erdos_renyi", "barabasi_albert", "complete"] = "erdos_renyi",
+    degree: int = 10,
+    seed: int = 0,
+) -> Network:
+    """
+    Network over `users` with a mean degree of about `degree`. The complete network has
+    n * (n - 1) / 2 edges and is only feasible for a few thousand users.
+    """
+    n = len(users)
+    if kind == "erdos_renyi":
+        graph = networkx.fast_gnp_random_graph(
+            n, min(1.0, degree / max(1, n - 1)), seed=seed
+        )
+    elif kind == "barabasi_albert":
+        graph = networkx.barabasi_albert_graph(
+            n, max(1, min(n - 1, degree // 2)), seed=seed
+        )
+    elif kind == "complete":
+        graph = networkx.complete_graph(n)
+    else:
+        raise ValueError(f"unknown network kind {kind!r}, expected one of {NETWORKS}")
+    return Network.from_graph(graph, users)
+
+
+def feed(
+    users: typing.List[User],
+    posts_per_user: int = 2,
+    steps: int = 10,
+    dim: int = 384,
+    reads_per_post: int = 5,
+    like_fraction: float = 0.2,
+    seed: int = 0,
+) -> Feed:
+    """
+    Feed of `posts_per_user` posts per user spread over `steps` timestamps, with
+    unit-norm float32 embeddings of `dim` (None if 0), `reads_per_post` random readers
+    per post of which `like_fraction` like it, and opinions in [-1, 1] as content (as
+    the BCM simulation writes them).
+    """
+    rng = np.random.default_rng(seed)
+    n = len(users) * posts_per_user
+
+    authors = np.repeat(np.arange(len(users)), posts_per_user)
+    timestamps = np.sort(rng.integers(0, steps, size=n))
+    opinions = rng.uniform(-1.0, 1.0, size=n)
+    readers = rng.integers(0, len(users), size=(n, reads_per_post))
+    likes = rng.random(size=(n, reads_per_post)) < like_fraction
+
+    embeddings = None
+    if dim:
+        embeddings = rng.standard_normal(size=(n, dim), dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    # validating every field would dominate building large feeds, the generated values
+    # are valid by construction
+    posts = [
+        Post.model_construct(
+            user=users[authors[i]],
+            content=f"{opinions[i]:.4f}",
+            reads={users[r] for r in readers[i].tolist()},
+            likes={users[r] for r in readers[i][likes[i]].tolist()},
+            id=f"bench-post-{i}",
+            timestamp=int(timestamps[i]),
+            embedding=None if embeddings is None else embeddings[i],
+        )
+        for i in rng.permutation(n).tolist()
+    ]
+    return Feed._from_posts(posts)
@@ -0,0 +1,306 @@
+import typing
+import pathlib
+import json
+import time
+import tempfile
+import argparse
+import logging
+
+from twon_lss.utility import LLM, RetryPolicy
+from twon_lss.benchmarks import data
+from twon_lss.benchmarks.mock_server import MockLLMServer, MockServerConfig, Latency
+
+
+def _simulation(
+    kind: str,
+    server: MockLLMServer,
+    agents: int,
+    steps: int,
+    execution: str,
+    workers: typing.Optional[int],
+    rate: float,
+    concurrency: int,
+    output_path: pathlib.Path,
+    seed: int,
+) -> typing.Any:
+    from twon_lss.simulations import twon_base, wp3_simulation as wp3
+
+    users = data.users(agents, prefix="load-user")
+    network = data.network(users, "barabasi_albert", degree=10, seed=seed)
+    # embeddings of the initial feed are requested by the simulation, as in a real run
+    feed = data.feed(users, posts_per_user=1, steps=1, dim=0, seed=seed)
+
+    client = dict(
+        api_key="mock",
+        max_requests_per_second=rate,
+        max_concurrency=concurrency,
+        retry=RetryPolicy(base_delay=0.1, max_delay=2.0),
+    )
+    embeddings = LLM(url=f"{server.url}/embed", **client)
+
+    if kind == "twon_base":
+        chat = LLM(url=f"{server.url}/v1/chat/completions", **client)
+        instructions = twon_base.AgentInstructions(
+            persona="You are a social media user.",
+            read_and_like_prompt="Read the post.",
+            post_prompt="Write a post.",
+            read_confirmation="read",
+            read_and_like_confirmation="like",
+        )
+        return twon_base.Simulation(
+            args=twon_base.SimulationArgs(
+                num_steps=steps,
+                execution=execution,
+                num_workers=workers,
+                checkpoint="log",
+                compact_on_finish=False,
+            ),
+            ranker=twon_base.SemanticSimilarityRanker(llm=embeddings),
+            individuals={
+                user: twon_base.Agent(llm=chat, instructions=instructions)
+                for user in users
+            },
+            network=network,
+            feed=feed,
+            output_path=output_path,
+        )
+
+    chat = wp3.WP3LLM(url=f"{server.url}/runsync", **client)
+    instructions = wp3.AgentInstructions(
+        read_prompt="Your feed:\n{feed}",
+        post_prompt="Write a post.",
+        feed_placeholder="[feed]",
+        cognition_update="Update your views.",
+        profile_format="{bio} {cognition}",
+    )
+    return wp3.Simulation(
+        args=wp3.SimulationArgs(
+            num_steps=steps,
+            execution=execution,
+            num_workers=workers,
+            checkpoint="log",
+            compact_on_finish=False,
+        ),
+        ranker=wp3.SemanticSimilarityRanker(
+            llm=embeddings, args=wp3.RankerArgs(persistence=3)
+        ),
+        individuals={
+            user: wp3.WP3Agent(
+                llm=chat,
+                instructions=instructions,
+                activation_probability=0.5,
+                posting_probability=0.5,
+                read_amount=5,
+            )
+            for user in users
+        },
+        network=network,
+        feed=feed,
+        output_path=output_path,
+    )
+
+
+def summarize(
+    records: typing.List[typing.Dict[str, typing.Any]],
+) -> typing.Dict[str, typing.Any]:
+    """Totals and per-step means of the `metrics.jsonl` records of a run."""
+    seconds = sum(record["seconds"] for record in records)
+    phases: typing.Dict[str, float] = {}
+    for record in records:
+        for name, value in record["phases"].items():
+            phases[name] = phases.get(name, 0.0) + value
+
+    llm = {
+        name: sum(record["llm"][name] for record in records)
+        for name in ("calls", "retries", "throttled", "failures", "tokens")
+    }
+    latencies = [
+        record["llm"]["latency"]
+        for record in records
+        if record["llm"]["latency"]["count"]
+    ]
+    if latencies:
+        count = sum(latency["count"] for latency in latencies)
+        llm["latency"] = {
+            "count": count,
+            "mean": sum(latency["mean"] * latency["count"] for latency in latencies)
+            / count,
+            "max": max(latency["max"] for latency in latencies),
+        }
+
+    return {
+        "steps": len(records),
+        "seconds": seconds,
+        "steps_per_second": len(records) / seconds if seconds else 0.0,
+        "agent_steps_per_second": sum(
+            record["counts"].get("agents", 0) for record in records
+        )
+        / seconds
+        if seconds
+        else 0.0,
+        "phases": {
+            name: {
+                "total": total,
+                "mean": total / len(records),
+                "share": total / seconds if seconds else 0.0,
+            }
+            for name, total in phases.items()
+        },
+        "llm": llm,
+    }
+
+
+def run(
+    simulation: typing.Literal["wp3", "twon_base"] = "wp3",
+    agents: int = 100,
+    steps: int = 5,
+    config: typing.Optional[MockServerConfig] = None,
+    execution: typing.Literal["phased", "pipelined"] = "phased",
+    workers: typing.Optional[int] = None,
+    rate: float = 1000.0,
+    concurrency: int = 64,
+    output_path: typing.Optional[pathlib.Path] = None,
+    seed: int = 0,
+) -> typing.Dict[str, typing.Any]:
+    """
+    Runs a `simulation` of `agents` agents for `steps` steps against a local
+    `MockLLMServer` and reports setup and run seconds, steps and agent steps per second,
+    per-phase timings and LLM request statistics from the run's metrics, and the
+    requests the server answered. Output goes to a temporary directory unless
+    `output_path` is given.
+    """
+    config = config or MockServerConfig()
+
+    with tempfile.TemporaryDirectory() as temporary, MockLLMServer(config) as server:
+        output_path = pathlib.Path(output_path or temporary)
+        output_path.mkdir(parents=True, exist_ok=True)
+
+        start = time.perf_counter()
+        sim = _simulation(
+            simulation,
+            server,
+            agents,
+            steps,
+            execution,
+            workers,
+            rate,
+            concurrency,
+            output_path,
+            seed,
+        )
+        setup = time.perf_counter() - start
+
+        logging.debug(
+            f">f load test: {simulation} with {agents} agents for {steps} steps against {server.url}"
+        )
+        start = time.perf_counter()
+        sim()
+        wall = time.perf_counter() - start
+
+        with open(output_path / "metrics.jsonl") as f:
+            records = [json.loads(line) for line in f]
+
+        return {
+            "simulation": simulation,
+            "agents": agents,
+            "execution": execution,
+            "setup_seconds": setup,
+            "wall_seconds": wall,
+            **summarize(records),
+            "server": dict(server.stats),
+            "config": config.model_dump(),
+        }
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m twon_lss load-test",
+        description="Runs a full simulation offline against a local mock LLM server and reports its throughput.",
+    )
+    parser.add_argument("--simulation", choices=["wp3", "twon_base"], default="wp3")
+    parser.add_argument("--agents", type=int, default=100)
+    parser.add_argument("--steps", type=int, default=5)
+    parser.add_argument(
+        "--execution", choices=["phased", "pipelined"], default="phased"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="ranker worker processes"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=1000.0,
+        help="admitted requests per second of the clients",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=64, help="requests in flight per client"
+    )
+    parser.add_argument(
+        "--config",
+        type=pathlib.Path,
+        default=None,
+        help="JSON file of a MockServerConfig",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=None, help="mean chat latency in seconds"
+    )
+    parser.add_argument(
+        "--latency-distribution",
+        choices=["constant", "uniform", "exponential", "lognormal"],
+        default=None,
+    )
+    parser.add_argument("--error-rate", type=float, default=None)
+    parser.add_argument("--burst-probability", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output",
+        type=pathlib.Path,
+        default=None,
+        help="file to write the JSON report to",
+    )
+    args = parser.parse_args(argv)
+
+    config = (
+        MockServerConfig.model_validate_json(args.config.read_text())
+        if args.config
+        else MockServerConfig()
+    )
+    latency = {
+        name: value
+        for name, value in (
+            ("mean", args.latency),
+            ("distribution", args.latency_distribution),
+        )
+        if value is not None
+    }
+    if latency:
+        config.chat_latency = Latency(**{**config.chat_latency.model_dump(), **latency})
+    if args.error_rate is not None:
+        config.error_rate = args.error_rate
+    if args.burst_probability is not None:
+        config.burst_probability = args.burst_probability
+
+    report = run(
+        args.simulation,
+        args.agents,
+        args.steps,
+        config,
+        args.execution,
+        args.workers,
+        args.rate,
+        args.concurrency,
+        seed=args.seed,
+    )
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+    print(
+        f"{report['simulation']} {report['agents']} agents, {report['steps']} steps: "
+        f"{report['steps_per_second']:.3f} steps/s, {report['agent_steps_per_second']:.1f} agent steps/s"
+    )
+    for name, phase in report["phases"].items():
+        print(f"  {name:<12} {phase['mean']:>9.3f} s/step {phase['share']:>7.1%}")
+    print(f"  llm {json.dumps(report['llm'])}")
+    print(f"  server {json.dumps(report['server'])}")
@@ -0,0 +1,490 @@
+import typing
+import pathlib
+import json
+import time
+import fnmatch
+import platform
+import datetime
+import tracemalloc
+import argparse
+import logging
+import sys
+
+import pydantic
+
+import numpy as np
+
+from twon_lss.schemas import User, Feed, Network, Rankings
+from twon_lss.interfaces import RankerInterface, SimulationInterface
+from twon_lss.utility import LLM, WorkerPool, Noise
+from twon_lss.benchmarks import data
+
+
+class Scale(pydantic.BaseModel):
+    """
+    Size of the synthetic data of a benchmark run.
+
+    Attributes:
+        users (int): Users of feed and network.
+        posts_per_user (int): Posts every user wrote.
+        steps (int): Timestamps the posts are spread over.
+        dim (int): Embedding dimension.
+        degree (int): Mean degree of the network.
+        sample (int): Users queried by the per-user benchmarks.
+        ranker_users (int): Users ranked by the ranker benchmarks.
+    """
+
+    users: int
+    posts_per_user: int = 2
+    steps: int = 10
+    dim: int = 384
+    degree: int = 10
+    sample: int = 1000
+    ranker_users: int = 1000
+
+
+SCALES: typing.Dict[str, Scale] = {
+    "1k": Scale(users=1_000),
+    "10k": Scale(users=10_000),
+    "100k": Scale(users=100_000),
+}
+
+
+class Result(pydantic.BaseModel):
+    """
+    Measurement of one benchmark: `ops` operations (e.g. queried users) per run, the
+    median and best seconds of the timed runs and the traced peak memory of one run.
+    """
+
+    name: str
+    params: typing.Dict[str, typing.Any] = pydantic.Field(default_factory=dict)
+    ops: int
+    runs: int
+    seconds: float
+    seconds_min: float
+    throughput: float
+    peak_memory: int
+
+
+class Case(typing.NamedTuple):
+    name: str
+    run: typing.Callable[[], typing.Any]
+    ops: int
+
+
+def measure(
+    case: Case,
+    repeat: int = 5,
+    params: typing.Optional[typing.Dict[str, typing.Any]] = None,
+) -> Result:
+    """
+    Times `repeat` runs of `case` after a warm-up run, then traces the allocations of
+    one more run. Timing and tracing are separate, tracemalloc slows allocation heavy
+    code down. Allocations of worker processes are not traced.
+    """
+    case.run()
+
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        case.run()
+        seconds.append(time.perf_counter() - start)
+
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    case.run()
+    peak = tracemalloc.get_traced_memory()[1]
+    if started:
+        tracemalloc.stop()
+
+    median = float(np.median(seconds))
+    return Result(
+        name=case.name,
+        params=params or {},
+        ops=case.ops,
+        runs=repeat,
+        seconds=median,
+        seconds_min=min(seconds),
+        throughput=case.ops / median if median > 0 else float("inf"),
+        peak_memory=peak,
+    )
+
+
+def rankers() -> typing.Dict[str, typing.Tuple[RankerInterface, bool]]:
+    """
+    The bundled rankers that run offline, by name, and whether they rank agents instead
+    of users. Noise is disabled, it would only add random draws.
+    """
+    from twon_lss.simulations import bcm, twon_base, wp3_simulation
+
+    llm = LLM(api_key="benchmark")
+    noise = Noise(low=1.0, high=1.0)
+    return {
+        f"bcm.{kind}": (bcm.Ranker(type=kind, args=bcm.RankerArgs(noise=noise)), False)
+        for kind in ("random", "positivity", "negativity")
+    } | {
+        "twon_base.RandomRanker": (
+            twon_base.RandomRanker(args=twon_base.RankerArgs(noise=noise)),
+            False,
+        ),
+        "twon_base.LikeRanker": (
+            twon_base.LikeRanker(args=twon_base.RankerArgs(noise=noise)),
+            False,
+        ),
+        "twon_base.SemanticSimilarityRanker": (
+            twon_base.SemanticSimilarityRanker(
+                llm=llm, args=twon_base.RankerArgs(noise=noise)
+            ),
+            False,
+        ),
+        "wp3_simulation.RandomRanker": (
+            wp3_simulation.RandomRanker(args=wp3_simulation.RankerArgs(noise=noise)),
+            True,
+        ),
+        "wp3_simulation.SemanticSimilarityRanker": (
+            wp3_simulation.SemanticSimilarityRanker(
+                llm=llm, args=wp3_simulation.RankerArgs(noise=noise)
+            ),
+            True,
+        ),
+    }
+
+
+def _agents(users: typing.List[User], feed: Feed) -> typing.Dict[User, typing.Any]:
+    # WP3 agents with their 10 most recent posts, the only agent state the WP3 rankers
+    # read
+    from twon_lss.simulations.wp3_simulation import WP3Agent, AgentInstructions
+
+    llm = LLM(api_key="benchmark")
+    instructions = AgentInstructions(
+        read_prompt="",
+        post_prompt="",
+        feed_placeholder="",
+        cognition_update="",
+        profile_format="",
+    )
+    return {
+        user: WP3Agent(
+            llm=llm,
+            instructions=instructions,
+            activation_probability=1.0,
+            posting_probability=1.0,
+            read_amount=10,
+            posts=list(feed.get_items_by_user(user))[-10:],
+        )
+        for user in users
+    }
+
+
+def feed_cases(feed: Feed, sample: typing.List[User], steps: int) -> typing.List[Case]:
+    return [
+        Case(
+            "feed.get_items_by_user",
+            lambda: [feed.get_items_by_user(user) for user in sample],
+            len(sample),
+        ),
+        Case(
+            "feed.get_unread_items_by_user",
+            lambda: [feed.get_unread_items_by_user(user) for user in sample],
+            len(sample),
+        ),
+        Case(
+            "feed.filter_by_timestamp",
+            lambda: [feed.filter_by_timestamp(n, 3) for n in range(steps)],
+            steps,
+        ),
+        # post fields and dumps of the stored posts, and the indexes of a feed of them
+        # rebuilt from the store's columns
+        Case("feed.content", lambda: [post.content for post in feed], len(feed)),
+        Case("feed.reads", lambda: [len(post.reads) for post in feed], len(feed)),
+        Case("feed.records", feed.records, len(feed)),
+        Case("feed.model_dump", feed.model_dump, len(feed)),
+        Case("feed.build", lambda: Feed._from_posts(list(feed)), len(feed)),
+    ]
+
+
+def network_cases(network: Network, sample: typing.List[User]) -> typing.List[Case]:
+    network.snapshot()
+    return [
+        Case(
+            "network.get_neighbors",
+            lambda: [network.get_neighbors(user) for user in sample],
+            len(sample),
+        )
+    ]
+
+
+def ranker_cases(
+    feed: Feed,
+    network: Network,
+    users: typing.List[User],
+    pool: typing.Optional[WorkerPool],
+) -> typing.List[Case]:
+    # agents are built on first use, in the untimed warm-up run
+    agents: typing.Dict[User, typing.Any] = {}
+
+    def subjects(by_agent: bool) -> typing.Any:
+        if by_agent and not agents:
+            agents.update(_agents(users, feed))
+        return agents if by_agent else users
+
+    cases = []
+    for name, (ranker, by_agent) in rankers().items():
+        for mode, case_pool in (("batched", None), ("pairwise", pool)):
+            if mode == "pairwise" and pool is None:
+                continue
+            ranker = ranker.model_copy(
+                update={"args": ranker.args.model_copy(update={"mode": mode})}
+            )
+
+            def run(ranker=ranker, by_agent=by_agent, case_pool=case_pool):
+                return ranker(subjects(by_agent), feed, network, case_pool)
+
+            cases.append(
+                Case(
+                    f"ranker.{name}.{'batched' if case_pool is None else 'pool'}",
+                    run,
+                    len(users),
+                )
+            )
+    return cases
+
+
+def simulation_cases(
+    feed: Feed, network: Network, sample: typing.List[User]
+) -> typing.List[Case]:
+    from twon_lss.simulations import twon_base, bcm
+
+    ranker = twon_base.LikeRanker(
+        args=twon_base.RankerArgs(noise=Noise(low=1.0, high=1.0), mode="batched")
+    )
+    rankings: typing.List[Rankings] = []
+
+    def run():
+        if not rankings:
+            rankings.append(ranker(sample, feed, network))
+        return [
+            SimulationInterface._filter_posts_by_user(rankings[0], user)
+            for user in sample
+        ]
+
+    # every run is a further step of the same engine, the window keeps the steps
+    # comparable
+    engines: typing.List[bcm.Engine] = []
+
+    def engine_step():
+        if not engines:
+            individuals = {
+                user: bcm.Agent(memory=[float(i % 200) / 100 - 1])
+                for i, user in enumerate(network)
+            }
+            ranker = bcm.Ranker(type="random")
+            engines.append(
+                bcm.Engine(individuals, network, feed, ranker, window=1, seed=0)
+            )
+        engines[0].step()
+
+    return [
+        Case("simulation.filter_posts_by_user", run, len(sample)),
+        Case("simulation.bcm_engine_step", engine_step, len(network)),
+    ]
+
+
+def run(
+    scale: typing.Union[str, Scale] = "1k",
+    networks: typing.Sequence[str] = ("erdos_renyi",),
+    patterns: typing.Sequence[str] = ("*",),
+    repeat: int = 5,
+    workers: typing.Optional[int] = None,
+    seed: int = 0,
+) -> typing.Dict[str, typing.Any]:
+    """
+    Runs the benchmarks whose names match one of `patterns` (fnmatch) on synthetic data
+    of `scale`, the network dependent ones once per kind in `networks`. Returns the
+    report: run metadata and one `Result` per benchmark.
+    """
+    scale_name = scale if isinstance(scale, str) else "custom"
+    scale = SCALES[scale] if isinstance(scale, str) else scale
+
+    def selected(name: str) -> bool:
+        return any(fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+    rng = np.random.default_rng(seed)
+    users = data.users(scale.users)
+    feed = data.feed(users, scale.posts_per_user, scale.steps, scale.dim, seed=seed)
+
+    def pick(k: int) -> typing.List[User]:
+        return [
+            users[i]
+            for i in np.sort(
+                rng.choice(len(users), size=min(k, len(users)), replace=False)
+            )
+        ]
+
+    sample, ranked = pick(scale.sample), pick(scale.ranker_users)
+    logging.debug(f">f benchmark data: {len(users)} users, {len(feed)} posts")
+
+    results: typing.List[Result] = []
+
+    def execute(cases: typing.List[Case], **params: typing.Any) -> None:
+        for case in cases:
+            if selected(case.name):
+                logging.debug(f">f benchmark {case.name} {params}")
+                results.append(measure(case, repeat, params))
+
+    execute(feed_cases(feed, sample, scale.steps))
+
+    # the pairwise rankers score on a worker pool as in a simulation, its start-up is
+    # not measured
+    pool = (
+        WorkerPool(workers)
+        if any(selected(f"ranker.{name}.pool") for name in rankers())
+        else None
+    )
+    try:
+        for kind in networks:
+            network = data.network(users, kind, scale.degree, seed=seed)
+            execute(network_cases(network, sample), network=kind)
+            execute(ranker_cases(feed, network, ranked, pool), network=kind)
+            execute(simulation_cases(feed, network, sample), network=kind)
+    finally:
+        if pool is not None:
+            pool.close()
+
+    return {
+        "meta": {
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "scale": scale_name,
+            **scale.model_dump(),
+            "feed_size": len(feed),
+            "repeat": repeat,
+            "seed": seed,
+        },
+        "results": [result.model_dump() for result in results],
+    }
+
+
+def compare(
+    baseline: typing.Dict[str, typing.Any],
+    current: typing.Dict[str, typing.Any],
+    tolerance: float = 0.1,
+) -> typing.List[typing.Dict[str, typing.Any]]:
+    """
+    Throughput and peak memory of the benchmarks of `current` relative to `baseline`. A
+    benchmark regressed if its throughput dropped or its memory grew by more than
+    `tolerance` (a fraction).
+    """
+
+    def key(result: typing.Dict[str, typing.Any]) -> typing.Tuple[str, str]:
+        return result["name"], json.dumps(result["params"], sort_keys=True)
+
+    previous = {key(result): result for result in baseline["results"]}
+
+    rows = []
+    for result in current["results"]:
+        before = previous.get(key(result))
+        if before is None:
+            continue
+        throughput = (
+            result["throughput"] / before["throughput"]
+            if before["throughput"]
+            else float("inf")
+        )
+        memory = (
+            result["peak_memory"] / before["peak_memory"]
+            if before["peak_memory"]
+            else 1.0
+        )
+        rows.append(
+            {
+                "name": result["name"],
+                "params": result["params"],
+                "throughput": throughput,
+                "memory": memory,
+                "regression": throughput < 1.0 - tolerance or memory > 1.0 + tolerance,
+            }
+        )
+    return rows
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m twon_lss bench",
+        description="Microbenchmarks of the feed, network, ranker and simulation hot paths on synthetic data.",
+    )
+    parser.add_argument(
+        "--scale", choices=SCALES, default="1k", help="size of the synthetic data"
+    )
+    parser.add_argument(
+        "--network",
+        nargs="+",
+        choices=data.NETWORKS,
+        default=["erdos_renyi"],
+        help="network kinds",
+    )
+    parser.add_argument(
+        "--filter",
+        nargs="+",
+        default=["*"],
+        help="fnmatch patterns of the benchmarks to run",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="timed runs per benchmark"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="worker processes of the pairwise pool rankers",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output",
+        type=pathlib.Path,
+        default=None,
+        help="file to write the JSON report to",
+    )
+    parser.add_argument(
+        "--compare",
+        type=pathlib.Path,
+        default=None,
+        help="JSON report to compare against",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="relative change counted as regression",
+    )
+    args = parser.parse_args(argv)
+
+    report = run(
+        args.scale, args.network, args.filter, args.repeat, args.workers, args.seed
+    )
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+    for result in report["results"]:
+        params = " ".join(f"{name}={value}" for name, value in result["params"].items())
+        print(
+            f"{result['name']:<55} {params:<22} {result['throughput']:>14,.1f} ops/s"
+            f" {result['seconds'] * 1e3:>10.2f} ms {result['peak_memory'] / 2**20:>9.1f} MiB"
+        )
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            rows = compare(json.load(f), report, args.tolerance)
+        for row in rows:
+            flag = "REGRESSION" if row["regression"] else ""
+            print(
+                f"{row['name']:<55} throughput x{row['throughput']:.2f} memory x{row['memory']:.2f} {flag}"
+            )
+        if any(row["regression"] for row in rows):
+            sys.exit(1)
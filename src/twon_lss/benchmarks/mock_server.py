@@ -0,0 +1,314 @@
+import typing
+import json
+import time
+import random
+import hashlib
+import threading
+import argparse
+import logging
+import http.server
+
+import pydantic
+
+import numpy as np
+
+
+class Latency(pydantic.BaseModel):
+    """
+    Distribution of the response time of an endpoint in seconds: "constant" (`mean`),
+    "uniform" (`mean` +- `spread`), "exponential" (`mean`) or "lognormal" (median
+    `mean`, shape `spread`).
+    """
+
+    distribution: typing.Literal["constant", "uniform", "exponential", "lognormal"] = (
+        "lognormal"
+    )
+    mean: float = pydantic.Field(0.5, ge=0)
+    spread: float = pydantic.Field(0.5, ge=0)
+
+    def sample(self, rng: random.Random) -> float:
+        if self.distribution == "constant":
+            return self.mean
+        if self.distribution == "uniform":
+            return max(
+                0.0, rng.uniform(self.mean - self.spread, self.mean + self.spread)
+            )
+        if self.distribution == "exponential":
+            return rng.expovariate(1.0 / self.mean) if self.mean > 0 else 0.0
+        return (
+            rng.lognormvariate(np.log(self.mean), self.spread) if self.mean > 0 else 0.0
+        )
+
+
+class MockServerConfig(pydantic.BaseModel):
+    """
+    Behaviour of a `MockLLMServer`.
+
+    Attributes:
+        chat_latency (Latency): Response time of chat completions (OpenAI and RunPod
+            format).
+        embedding_latency (Latency): Response time of feature extraction and sentence
+            similarity requests.
+        error_rate (float): Fraction of requests answered with 500.
+        burst_probability (float): Probability that a request starts a throttling burst.
+        burst_duration (float): Seconds of a burst, every request meanwhile is answered
+            with 429.
+        retry_after (Optional[float]): `Retry-After` seconds sent with 429, no header if
+            None.
+        dim (int): Dimension of the embeddings.
+        responses (List[str]): Chat responses, picked by the hash of the conversation.
+        seed (int): Seed of latencies, errors and bursts.
+    """
+
+    chat_latency: Latency = pydantic.Field(default_factory=Latency)
+    embedding_latency: Latency = pydantic.Field(
+        default_factory=lambda: Latency(distribution="constant", mean=0.05)
+    )
+    error_rate: float = pydantic.Field(0.0, ge=0, le=1)
+    burst_probability: float = pydantic.Field(0.0, ge=0, le=1)
+    burst_duration: float = pydantic.Field(1.0, ge=0)
+    retry_after: typing.Optional[float] = 1.0
+    dim: int = pydantic.Field(384, gt=0)
+    responses: typing.List[str] = pydantic.Field(
+        default_factory=lambda: [
+            "read",
+            "like",
+            "Interesting point, I had not thought about it that way.",
+            "I disagree, the evidence points the other way.",
+            "Just saw the news, what a day.",
+        ]
+    )
+    seed: int = 0
+
+
+def embed(text: str, dim: int) -> typing.List[float]:
+    """Deterministic unit-norm embedding of `text`."""
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def _tokens(text: str) -> int:
+    return len(text.split())
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    # requests are told apart by their payload, any path is accepted
+    protocol_version = "HTTP/1.1"
+    server: "MockLLMServer"
+
+    def do_POST(self):
+        try:
+            payload = json.loads(
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            )
+        except (ValueError, json.JSONDecodeError):
+            return self._send(400, {"error": "invalid JSON"})
+
+        if "input" in payload:
+            kind, messages = "runpod", payload["input"].get("messages", [])
+        elif "messages" in payload:
+            kind, messages = "chat", payload["messages"]
+        elif "inputs" in payload:
+            kind, messages = "embedding", None
+        else:
+            return self._send(400, {"error": "unknown request format"})
+
+        status, delay = self.server.admit(kind)
+        time.sleep(delay)
+        if status == 429:
+            headers = (
+                {}
+                if self.server.config.retry_after is None
+                else {"Retry-After": str(self.server.config.retry_after)}
+            )
+            return self._send(429, {"error": "rate limited"}, headers)
+        if status != 200:
+            return self._send(status, {"error": "mock failure"})
+
+        if kind == "embedding":
+            return self._send(200, self.server.embedding_response(payload["inputs"]))
+        return self._send(200, self.server.chat_response(kind, messages))
+
+    def _send(
+        self,
+        status: int,
+        body: typing.Any,
+        headers: typing.Optional[typing.Dict[str, str]] = None,
+    ) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class MockLLMServer(http.server.ThreadingHTTPServer):
+    """
+    Local stand-in for the LLM endpoints, to run simulations offline. Requests are told
+    apart by their payload: OpenAI-style chat completions (`messages`, as sent by
+    `LLM`), RunPod jobs (`input`, as sent by `WP3LLM`) and feature extraction (`inputs`,
+    a text or list of texts, as sent by `LLM.extract`; a `source_sentence` and
+    `sentences` are answered with cosine similarities). Responses and embeddings are
+    deterministic functions of the request; latency, errors and 429 bursts follow
+    `config`.
+
+    Attributes:
+        config (MockServerConfig): Behaviour of the server.
+        stats (Dict[str, int]): Answered requests by kind, errors and throttled
+            requests.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        config: typing.Optional[MockServerConfig] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        super().__init__((host, port), _Handler)
+        self.config = config or MockServerConfig()
+        self.stats: typing.Dict[str, int] = {
+            "chat": 0,
+            "runpod": 0,
+            "embedding": 0,
+            "errors": 0,
+            "throttled": 0,
+        }
+
+        self._rng = random.Random(self.config.seed)
+        self._burst_until = 0.0
+        self._lock = threading.Lock()
+        self._thread: typing.Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "MockLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def start(self) -> "MockLLMServer":
+        """Serves on a background thread."""
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="mock-llm-server", daemon=True
+        )
+        self._thread.start()
+        logging.debug(f">f mock LLM server listening on {self.url}")
+        return self
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
+
+    def admit(self, kind: str) -> typing.Tuple[int, float]:
+        """Status and delay of a request of `kind`."""
+        config = self.config
+        with self._lock:
+            now = time.monotonic()
+            if (
+                now >= self._burst_until
+                and self._rng.random() < config.burst_probability
+            ):
+                self._burst_until = now + config.burst_duration
+            if now < self._burst_until:
+                self.stats["throttled"] += 1
+                return 429, 0.0
+
+            latency = (
+                config.embedding_latency if kind == "embedding" else config.chat_latency
+            ).sample(self._rng)
+            if self._rng.random() < config.error_rate:
+                self.stats["errors"] += 1
+                return 500, latency
+
+            self.stats[kind] += 1
+            return 200, latency
+
+    def chat_response(
+        self, kind: str, messages: typing.List[typing.Dict[str, str]]
+    ) -> typing.Dict[str, typing.Any]:
+        conversation = json.dumps(messages, sort_keys=True)
+        digest = hashlib.sha256(conversation.encode()).digest()
+        text = self.config.responses[
+            int.from_bytes(digest[:4], "little") % len(self.config.responses)
+        ]
+
+        prompt_tokens = sum(_tokens(message.get("content", "")) for message in messages)
+        if kind == "runpod":
+            return {
+                "status": "COMPLETED",
+                "output": [
+                    {
+                        "choices": [{"tokens": [text]}],
+                        "usage": {"input": prompt_tokens, "output": _tokens(text)},
+                    }
+                ],
+            }
+        return {
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": _tokens(text),
+                "total_tokens": prompt_tokens + _tokens(text),
+            },
+        }
+
+    def embedding_response(self, inputs: typing.Any) -> typing.Any:
+        dim = self.config.dim
+        if isinstance(inputs, dict) and "source_sentence" in inputs:
+            source = np.array(embed(inputs["source_sentence"], dim))
+            return [
+                float(source @ np.array(embed(text, dim)))
+                for text in inputs.get("sentences", [])
+            ]
+        if isinstance(inputs, str):
+            return embed(inputs, dim)
+        return [embed(text, dim) for text in inputs]
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m twon_lss mock-server",
+        description="Serves mock chat completion, RunPod and feature extraction endpoints until interrupted.",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--config", default=None, help="JSON file of a MockServerConfig"
+    )
+    args = parser.parse_args(argv)
+
+    config = MockServerConfig()
+    if args.config is not None:
+        with open(args.config) as f:
+            config = MockServerConfig.model_validate_json(f.read())
+
+    server = MockLLMServer(config, args.host, args.port)
+    print(f"mock LLM server on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -1,13 +1,18 @@
 import abc
 import typing
 import logging
+import contextlib
+import weakref
 
 import pydantic
 
-from twon_lss.utility import Noise
-from twon_lss.schemas import User, Post, Feed, Network
+import numpy as np
 
-from concurrent.futures import ProcessPoolExecutor
+from twon_lss.utility import Noise, WorkerPool, FeedSnapshot, RandomStreams
+from twon_lss.utility.pool import attached_snapshot
+from twon_lss.schemas import User, Post, Feed, Network, Rankings
+
+from concurrent.futures import as_completed
 
 
 class RankerInterfaceWeights(pydantic.BaseModel):
@@ -22,41 +27,198 @@ class RankerArgsInterface(abc.ABC, pydantic.BaseModel):
     noise: Noise = pydantic.Field(default_factory=Noise)
     persistence: int = 1
 
+    # "pairwise" scores every (user, post) pair in worker processes,
+    # "batched" scores whole columns/matrices via the *_batch methods
+    mode: typing.Literal["pairwise", "batched"] = "pairwise"
+    batch_size: int = pydantic.Field(default=1024, gt=0)
+
 
 class RankerInterface(abc.ABC, pydantic.BaseModel):
     args: RankerArgsInterface = pydantic.Field(default_factory=RankerArgsInterface)
 
+    # rankers implementing `_snapshot_context`/`_compute_individual_snapshot` opt in to
+    # scoring snapshots on the pool
+    supports_snapshot: typing.ClassVar[bool] = False
+
+    # called with (rankings, user) once the ranking of a user is final, see `streaming`
+    _on_ranked: typing.Optional[typing.Callable[[Rankings, User], None]] = (
+        pydantic.PrivateAttr(default=None)
+    )
+    # random streams of the running step, see `seeded`
+    _streams: typing.Optional[RandomStreams] = pydantic.PrivateAttr(default=None)
+    _step: int = pydantic.PrivateAttr(default=0)
+    _generators: typing.Dict[typing.Tuple[str, typing.Any], np.random.Generator] = (
+        pydantic.PrivateAttr(default_factory=dict)
+    )
+    # rankers without snapshot support warn once when they run on the pool
+    _warned_pool: bool = pydantic.PrivateAttr(default=False)
+    # pool of the calls without one, created on first use and kept for the following
+    # calls
+    _own_pool: typing.Optional[WorkerPool] = pydantic.PrivateAttr(default=None)
+
+    def __getstate__(self) -> typing.Dict[str, typing.Any]:
+        # the callback stays in the simulation process, workers only score
+        state = super().__getstate__()
+        state["__pydantic_private__"] = {
+            **state["__pydantic_private__"],
+            "_on_ranked": None,
+            "_generators": {},
+            "_own_pool": None,
+        }
+        return state
+
+    def close(self) -> None:
+        """Stops the worker pool the ranker started for calls without a pool, if any."""
+        if self._own_pool is not None:
+            self._own_pool.close()
+            self._own_pool = None
+
+    @contextlib.contextmanager
+    def seeded(self, streams: RandomStreams, step: int) -> typing.Iterator[None]:
+        """
+        Within the context, random scores and noise come from the streams of `step` (see
+        `RandomStreams`): the draws for a user come from its own streams over its
+        candidate posts in feed order, draws shared by all users (e.g. random network
+        scores) from the step's streams over the feed. Rankings are the same in every
+        mode, with or without the worker pool. Outside, rankers draw from the global
+        generators.
+        """
+        self._streams, self._step = streams, step
+        self._generators.clear()
+        try:
+            yield
+        finally:
+            self._streams, self._step = None, 0
+            self._generators.clear()
+
+    def _generator(self, purpose: str, user: typing.Any = None) -> typing.Any:
+        """
+        Generator of `user` (a user, its id or None for draws shared by all users) for
+        `purpose` in the running step; successive draws continue the stream until
+        `_generators` is cleared. `numpy.random` if not `seeded`.
+        """
+        if self._streams is None:
+            return np.random
+
+        key = (purpose, getattr(user, "id", user))
+        if key not in self._generators:
+            self._generators[key] = self._streams.generator(self._step, user, purpose)
+        return self._generators[key]
+
+    def _draw_batch(
+        self,
+        purpose: str,
+        users: typing.Sequence[typing.Any],
+        mask: np.ndarray,
+        low: float = 0.0,
+        high: float = 1.0,
+    ) -> np.ndarray:
+        """
+        (users x posts) matrix of uniform draws at the cells of `mask`, zero elsewhere;
+        the draws of a row come from the stream of its user for `purpose`, as
+        `_compute_individual` draws them pair by pair.
+        """
+        draws = np.zeros(mask.shape)
+        for row, user in enumerate(users):
+            cols = np.flatnonzero(mask[row])
+            draws[row, cols] = self._generator(purpose, user).uniform(
+                low, high, size=len(cols)
+            )
+        return draws
+
+    @contextlib.contextmanager
+    def streaming(
+        self, on_ranked: typing.Callable[[Rankings, User], None]
+    ) -> typing.Iterator[None]:
+        """
+        Within the context, rankings on the worker pool call `on_ranked(rankings, user)`
+        as soon as the ranking of `user` is final, before the ranker returns. The pool
+        path scores a frozen snapshot of the feed, so its results do not depend on what
+        happens to the feed meanwhile; other paths read the live feed and do not stream.
+        """
+        self._on_ranked = on_ranked
+        try:
+            yield
+        finally:
+            self._on_ranked = None
+
     def __call__(
-        self, users: typing.List[User], feed: Feed, network: Network
-        ) -> typing.Dict[typing.Tuple[User, Post], float]:
+        self,
+        users: typing.List[User],
+        feed: Feed,
+        network: Network,
+        pool: typing.Optional[WorkerPool] = None,
+    ) -> Rankings:
         logging.debug(f"{len(feed)=}")
 
+        if self.args.mode == "batched":
+            return self._rank_batched(users, feed, network)
+
+        if pool is None:
+            if self._own_pool is None:
+                self._own_pool = WorkerPool()
+                # workers and shared memory outlive no ranker, see `close`
+                weakref.finalize(self, self._own_pool.close)
+            pool = self._own_pool
+
+        if self.supports_snapshot:
+            return self._rank_pool(users, feed, network, pool)
+
         # compute global scores
-        global_scores: typing.Dict[str, float] = {}
-        for post in feed:
-            global_scores[post.id] = self._compute_network(post)
-
-        # parallelize user processing
-        with ProcessPoolExecutor() as executor:
-            user_results = executor.map(
-                self._process_user,
-                [(user, feed, network, global_scores) for user in users]
+        users = list(users)
+        posts = list(feed)
+        network_scores = np.asarray(
+            self.compute_network_batch(posts), dtype=float
+        ).tolist()
+        global_scores = dict(
+            zip((post.id for post in posts), network_scores, strict=True)
+        )
+
+        # parallelize user processing in chunks of users; without snapshot support every
+        # task carries the feed, so there are only a few tasks per worker
+        if not self._warned_pool:
+            logging.warning(
+                f">w {type(self).__name__} has no snapshot support, the feed is copied to the workers every step"
             )
+            self._warned_pool = True
 
-        user_lookup = {user.id: user for user in users}
-        post_lookup = {post.id: post for post in feed}
+        chunksize = pool.chunksize(len(users))
+        tasks = [
+            (users[start : start + chunksize], feed, network, global_scores)
+            for start in range(0, len(users), chunksize)
+        ]
+        user_results = [
+            result
+            for results in pool.map(self._process_users, tasks)
+            for result in results
+        ]
 
-        # merge results
-        final_scores = {}
-        for user_score_dict in user_results:
-            mapped_dict = {
-                (user_lookup[user_id], post_lookup[post_id]): score
-                for (user_id, post_id), score in user_score_dict.items()
-            }
+        position_lookup = {
+            post.id: pos
+            for post, pos in zip(
+                feed, Rankings.positions_of(feed).tolist(), strict=True
+            )
+        }
 
-            final_scores.update(mapped_dict)
+        # merge results, every result holds the scores of one user
+        rankings = Rankings(feed)
+        for user, user_score_dict in zip(users, user_results, strict=True):
+            rankings.add(
+                user,
+                [position_lookup[post_id] for _, post_id in user_score_dict.keys()],
+                list(user_score_dict.values()),
+            )
 
-        return final_scores
+        return rankings
+
+    def _process_users(
+        self,
+        args: typing.Tuple[typing.List[User], Feed, Network, typing.Dict[str, float]],
+    ) -> typing.List[typing.Dict[typing.Tuple[str, str], float]]:
+        users, feed, network, global_scores = args
+        return [
+            self._process_user((user, feed, network, global_scores)) for user in users
+        ]
 
     def _process_user(
         self, args: typing.Tuple[User, Feed, Network, typing.Dict[str, float]]
@@ -64,7 +226,14 @@ class RankerInterface(abc.ABC, pydantic.BaseModel):
         user, feed, network, global_scores = args
         scores = {}
 
-        for post in self.get_individual_posts(user, feed, network):
+        # draws of other users never continue in this user's streams
+        self._generators.clear()
+        posts = self.get_individual_posts(user, feed, network)
+        noise = self.args.noise.draw_array(
+            len(posts), self._generator("noise", user)
+        ).tolist()
+
+        for post, post_noise in zip(posts, noise, strict=True):
             individual_score = self._compute_individual(user, post, feed)
             global_score = global_scores[post.id]
 
@@ -73,17 +242,232 @@ class RankerInterface(abc.ABC, pydantic.BaseModel):
                 + self.args.weights.network * global_score
             )
 
-            scores[(user.id, post.id)] = self.args.noise() * combined_score
+            scores[(user.id, post.id)] = post_noise * combined_score
 
         return scores
 
+    def _rank_batched(
+        self,
+        users: typing.Iterable[User],
+        feed: Feed,
+        network: Network,
+        subjects: typing.Optional[typing.Iterable[typing.Any]] = None,
+        noise: bool = True,
+    ) -> Rankings:
+        """
+        Scores all visible (user, post) pairs as array operations over chunks of
+        `args.batch_size` users. `subjects` replaces the users passed to
+        `compute_individual_batch` (e.g. agents instead of users).
+        """
+        users = list(users)
+        subjects = users if subjects is None else list(subjects)
+        posts = list(feed)
+
+        rankings = Rankings(feed)
+        if not users or not posts:
+            return rankings
+
+        network_scores = np.asarray(self.compute_network_batch(posts), dtype=float)
+        visibility = self._visibility(users, feed, network)
+        positions = Rankings.positions_of(feed)
+
+        for start in range(0, len(users), self.args.batch_size):
+            stop = start + self.args.batch_size
+            mask = visibility(start, stop)
+
+            individual_scores = np.asarray(
+                self.compute_individual_batch(subjects[start:stop], posts, feed, mask),
+                dtype=float,
+            )
+            combined_scores = (
+                self.args.weights.individual * individual_scores
+                + self.args.weights.network * network_scores[np.newaxis, :]
+            )
+
+            for row, visible in enumerate(mask):
+                cols = np.flatnonzero(visible)
+                user_scores = combined_scores[row, cols]
+                if noise:
+                    user_scores *= self.args.noise.draw_array(
+                        len(cols), self._generator("noise", users[start + row])
+                    )
+                rankings.add(users[start + row], positions[cols], user_scores)
+            self._generators.clear()
+
+        return rankings
+
+    def _rank_pool(
+        self,
+        users: typing.Iterable[User],
+        feed: Feed,
+        network: Network,
+        pool: WorkerPool,
+        subjects: typing.Optional[typing.Iterable[typing.Any]] = None,
+        noise: bool = True,
+    ) -> Rankings:
+        """
+        Scores all visible (user, post) pairs on the worker pool. The feed is published
+        once as a shared memory snapshot, workers only receive the candidate post
+        indices and the `_snapshot_context` of their users.
+        """
+        users = list(users)
+        subjects = users if subjects is None else list(subjects)
+        posts = list(feed)
+
+        rankings = Rankings(feed)
+        if not users or not posts:
+            return rankings
+
+        snapshot = pool.publish(
+            posts,
+            {user: idx for idx, user in enumerate(network.snapshot().users)},
+            network_scores=np.asarray(self.compute_network_batch(posts), dtype=float),
+        )
+        handle = snapshot.handle
+        visibility = self._visibility(users, feed, network)
+
+        chunksize = pool.chunksize(len(users))
+        futures = {}
+        for start in range(0, len(users), chunksize):
+            stop = start + chunksize
+            tasks = [
+                (
+                    np.flatnonzero(row).astype(np.int32),
+                    self._snapshot_context(subject, feed),
+                    user.id,
+                )
+                for row, subject, user in zip(
+                    visibility(start, stop),
+                    subjects[start:stop],
+                    users[start:stop],
+                    strict=True,
+                )
+            ]
+            futures[pool.submit(self._process_users_snapshot, handle, tasks, noise)] = (
+                start
+            )
+
+        positions = Rankings.positions_of(feed)
+        on_ranked = self._on_ranked
+        if on_ranked is not None:
+            # chunks are taken as they finish, entries keep the user order of the
+            # non-streaming path
+            for user in users:
+                rankings.add(user, [], [])
+
+        for future in futures if on_ranked is None else as_completed(futures):
+            start = futures[future]
+            for offset, (candidates, scores) in enumerate(future.result()):
+                rankings.add(users[start + offset], positions[candidates], scores)
+                if on_ranked is not None:
+                    on_ranked(rankings, users[start + offset])
+
+        return rankings
+
+    def _process_users_snapshot(
+        self,
+        handle: typing.Dict[str, typing.Tuple[str, tuple, str]],
+        tasks: typing.List[typing.Tuple[np.ndarray, typing.Any, str]],
+        noise: bool,
+    ) -> typing.List[typing.Tuple[np.ndarray, np.ndarray]]:
+        snapshot = attached_snapshot(handle)
+        results = []
+
+        for candidates, context, user_id in tasks:
+            self._generators.clear()
+            individual_scores = np.asarray(
+                self._compute_individual_snapshot(snapshot, context, candidates),
+                dtype=float,
+            )
+            combined_scores = (
+                self.args.weights.individual * individual_scores
+                + self.args.weights.network * snapshot.network_scores[candidates]
+            )
+            if noise:
+                combined_scores *= self.args.noise.draw_array(
+                    len(candidates), self._generator("noise", user_id)
+                )
+
+            results.append((candidates, combined_scores))
+
+        return results
+
+    @staticmethod
+    def _visibility(
+        users: typing.List[User], feed: Feed, network: Network
+    ) -> typing.Callable[[int, int], np.ndarray]:
+        """
+        Returns a function producing the (users[start:stop] x posts) mask of posts
+        authored by a neighbor and not yet read.
+        """
+        posts = list(feed)
+        snapshot = network.snapshot()
+        user_rows = snapshot.rows_of(users)
+        post_cols = snapshot.rows_of(post.user for post in posts)
+
+        read_indices = [feed.get_read_indices(user) for user in users]
+
+        def mask(start: int, stop: int) -> np.ndarray:
+            visible = snapshot.neighbor_mask(user_rows[start:stop], post_cols)
+            for row, read in enumerate(read_indices[start:stop]):
+                visible[row, read] = False
+            return visible
+
+        return mask
+
     def get_individual_posts(self, user: User, feed: Feed, network: Network):
 
-        return [
-            post
-            for neighbor in network.get_neighbors(user)
-            for post in feed.get_items_by_user(neighbor).get_unread_items_by_user(user)
-        ]
+        return feed.get_unread_items_by_authors(user, network.get_neighbors(user))
+
+    def compute_network_batch(self, posts: typing.Sequence[Post]) -> np.ndarray:
+        """
+        Network scores of `posts` as a column; falls back to `_compute_network` per
+        post.
+        """
+        return np.fromiter(
+            (self._compute_network(post) for post in posts),
+            dtype=float,
+            count=len(posts),
+        )
+
+    def compute_individual_batch(
+        self,
+        users: typing.Sequence[User],
+        posts: typing.Sequence[Post],
+        feed: Feed,
+        mask: typing.Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Individual scores as a (users x posts) matrix; falls back to
+        `_compute_individual` for each pair selected by `mask`.
+        """
+        scores = np.zeros((len(users), len(posts)))
+        rows, cols = np.nonzero(
+            mask if mask is not None else np.ones_like(scores, dtype=bool)
+        )
+
+        for row, col in zip(rows.tolist(), cols.tolist(), strict=True):
+            scores[row, col] = self._compute_individual(users[row], posts[col], feed)
+
+        return scores
+
+    def _snapshot_context(self, user: User, feed: Feed) -> typing.Any:
+        """
+        Per-user data shipped to the workers next to the candidate indices (e.g. profile
+        embeddings).
+        """
+        return None
+
+    def _compute_individual_snapshot(
+        self, snapshot: FeedSnapshot, context: typing.Any, candidates: np.ndarray
+    ) -> np.ndarray:
+        """
+        Individual scores of the `candidates` rows of `snapshot`, computed inside a
+        worker process; only called if `supports_snapshot`. Other rankers are run on the
+        pool with the pairwise `_process_users`, which copies the feed to the workers
+        with every chunk of users.
+        """
+        raise NotImplementedError
 
     @abc.abstractmethod
     def _compute_network(self, post: Post) -> float:
@@ -5,18 +5,75 @@ import pathlib
 import json
 import itertools
 import time
+import contextlib
+from concurrent.futures import Future, ThreadPoolExecutor
 
 import pydantic
 
+import numpy as np
+
 from rich.progress import track
 
 from twon_lss.interfaces import AgentInterface, RankerInterface
-from twon_lss.schemas import User, Network, Feed, Post
+from twon_lss.schemas import User, Network, Feed, FeedView, Post, Rankings
+from twon_lss.utility import WorkerPool, EmbeddingBatcher, RankingsSink, RandomStreams
+from twon_lss.utility.runlog import RunLog, LoggedRun, compact, load
+from twon_lss.utility.writer import BackgroundWriter
+from twon_lss.utility.metrics import (
+    Instrumentation,
+    StepHook,
+    CProfileHook,
+    TracemallocHook,
+)
 
 
 class SimulationInterfaceArgs(pydantic.BaseModel):
     num_steps: int = 100
     num_posts_to_interact_with: int = 5
+    num_workers: typing.Optional[int] = None
+    # agents mostly wait on LLM requests, their number in flight is bounded by the LLM
+    # client
+    max_concurrent_agents: int = pydantic.Field(256, gt=0)
+    # new posts are embedded in batches while the agents are still stepping
+    embedding_batch_size: int = pydantic.Field(100, gt=0)
+    embedding_batch_delay: float = pydantic.Field(0.05, ge=0)
+    # "phased" ranks all users before any agent steps, "pipelined" starts each agent
+    # once its ranking is final
+    execution: typing.Literal["phased", "pipelined"] = "phased"
+    # "json" rewrites the full JSON files every 10 steps, "log" appends every step to a
+    # run log (see `RunLog`)
+    checkpoint: typing.Literal["log", "json"] = "json"
+    # sync the run log to disk after every step, so a completed step also survives a
+    # crash of the machine
+    log_fsync: bool = False
+    # materialize network.json, feed.json and individuals.json from the run log once the
+    # run finished
+    compact_on_finish: bool = True
+    # rankings of every step as columnar arrays in rankings/step_{n}.npz (see
+    # `RankingsSink`), in the run log or as rankings/step_{n}_ranking.json; top-k
+    # retention and user sampling apply to "npz"
+    rankings_format: typing.Literal["npz", "log", "json"] = "npz"
+    rankings_top_k: typing.Optional[int] = pydantic.Field(None, gt=0)
+    rankings_sample: typing.Optional[float] = pydantic.Field(None, gt=0, le=1)
+    # output is written on a background thread, the step loop blocks once this many
+    # writes are pending
+    max_pending_writes: int = pydantic.Field(8, gt=0)
+    # continue the run logged in this directory from its last completed step: network,
+    # feed, agent states and generator states are restored from the log; the log is
+    # continued in place if it is the output_path
+    resume_from: typing.Optional[pathlib.Path] = None
+    # per-step phase timings, LLM request statistics and counters are appended to
+    # metrics.jsonl (see `Instrumentation`)
+    metrics: bool = True
+    # steps run under the profilers: "cprofile" writes profiles/step_{n}.prof,
+    # "tracemalloc" adds memory to the metrics
+    profile_steps: typing.List[int] = pydantic.Field(default_factory=list)
+    profilers: typing.List[typing.Literal["cprofile", "tracemalloc"]] = pydantic.Field(
+        default_factory=lambda: ["cprofile"]
+    )
+    # root seed of the random streams per (step, agent, purpose), see `RandomStreams`;
+    # fresh entropy if None, the seed is logged and reused when the run is resumed
+    seed: typing.Optional[int] = None
 
 
 class SimulationInterface(abc.ABC, pydantic.BaseModel):
@@ -34,6 +91,24 @@ class SimulationInterface(abc.ABC, pydantic.BaseModel):
         default_factory=lambda: pathlib.Path.cwd() / "output/"
     )
 
+    # ranker worker pool, lives for the duration of __call__
+    _pool: typing.Optional[WorkerPool] = pydantic.PrivateAttr(default=None)
+    # run log, lives for the duration of __call__ if args.checkpoint is "log"
+    _log: typing.Optional[RunLog] = pydantic.PrivateAttr(default=None)
+    _rankings_sink: typing.Optional[RankingsSink] = pydantic.PrivateAttr(default=None)
+    # output writer, lives for the duration of __call__; without it output is written in
+    # place
+    _writer: typing.Optional[BackgroundWriter] = pydantic.PrivateAttr(default=None)
+    # step instrumentation, lives for the duration of __call__ if args.metrics; hooks
+    # are added by `add_hook`
+    _metrics: typing.Optional[Instrumentation] = pydantic.PrivateAttr(default=None)
+    # random streams of the run and the running step, see `_generator`
+    _streams: typing.Optional[RandomStreams] = pydantic.PrivateAttr(default=None)
+    _current_step: int = pydantic.PrivateAttr(default=0)
+    # users whose agents stepped in the running step, None for all
+    _stepped: typing.Optional[typing.Set[User]] = pydantic.PrivateAttr(default=None)
+    _hooks: typing.List[StepHook] = pydantic.PrivateAttr(default_factory=list)
+
     def model_post_init(self, __context: typing.Any):
 
         logging.debug(">f init simulation")
@@ -41,96 +116,398 @@ class SimulationInterface(abc.ABC, pydantic.BaseModel):
         (self.output_path / "rankings").mkdir(exist_ok=True)
 
     def __call__(self) -> None:
-        for n in track(range(self.args.num_steps)):
-            time_start = time.time()
-            logging.debug(f">f simulate step {n=}")
-            
-            self._step(n)
-
-            time_end = time.time()
-            logging.debug(f">f step {n=} done in {time_end - time_start:.2f}s")
-            with open(self.output_path / "time_per_step.log", "a") as f:
-                f.write(f"{n},{time_end - time_start:.2f}\n")
-
-            if n % 10 == 0:
-                self.network.to_json(self.output_path / "network.json")
-                self.feed.to_json(self.output_path / "feed.json")
-                self._individuals_to_json(self.output_path / "individuals.json")
+        self._pool = WorkerPool(self.args.num_workers)
+        # pool and writer are closed however the run ends, also if it fails to start
+        try:
+            self._writer = BackgroundWriter(
+                self.args.max_pending_writes, name="simulation-writer"
+            )
+            self._streams = RandomStreams(self.args.seed)
 
-    def _step(self, n: int = 0) -> None:
-        post_scores: typing.Dict[typing.Tuple[User, Post], float] = self.ranker(
-            users=self.individuals.keys(), feed=self.feed, network=self.network
-        )
+            run = (
+                load(self.args.resume_from)
+                if self.args.resume_from is not None
+                else None
+            )
+            start = self._restore(run) if run is not None else 0
+
+            if self.args.checkpoint == "log":
+                self._log = RunLog(
+                    self.output_path,
+                    writer=self._writer,
+                    fsync=self.args.log_fsync,
+                    seed=self._streams.seed,
+                )
+                if run is not None and run.path.resolve() == self.output_path.resolve():
+                    self._log.resume(run, self.feed)
+                else:
+                    self._log.begin(
+                        self.network,
+                        self.feed,
+                        self.individuals,
+                        step=None if run is None else run.step,
+                    )
+
+            if self.args.metrics:
+                self._metrics = Instrumentation(self._limiters(), self._step_hooks())
+
+            for n in track(range(start, self.args.num_steps)):
+                time_start = time.time()
+                logging.debug(f">f simulate step {n=}")
+                if self._metrics is not None:
+                    self._metrics.begin(n)
+
+                self._current_step = n
+                self._stepped = None
+                with self.ranker.seeded(self._streams, n):
+                    self._step(n)
+
+                time_end = time.time()
+                logging.debug(f">f step {n=} done in {time_end - time_start:.2f}s")
+                self._submit(
+                    _append_line,
+                    self.output_path / "time_per_step.log",
+                    f"{n},{time_end - time_start:.2f}",
+                )
+
+                with self._phase("persist"):
+                    if self._log is not None:
+                        self._log.step(n, self.feed, self.individuals, self._stepped)
+                    elif n % 10 == 0:
+                        # snapshots are taken here, the writer only serializes them
+                        self._submit(
+                            _dump_json,
+                            self.output_path / "network.json",
+                            self.network.node_link_data(),
+                        )
+                        self._submit(
+                            _dump_json,
+                            self.output_path / "feed.json",
+                            self.feed.records(),
+                        )
+                        self._submit(
+                            _dump_json,
+                            self.output_path / "individuals.json",
+                            self._individuals_state(),
+                        )
+
+                if self._metrics is not None:
+                    record = self._metrics.end(feed_size=len(self.feed))
+                    self._submit(
+                        _append_line,
+                        self.output_path / "metrics.jsonl",
+                        json.dumps(record),
+                    )
+
+        finally:
+            self._pool.close()
+            self._pool = None
+            if self._metrics is not None:
+                self._metrics.close()
+                self._metrics = None
+            try:
+                if self._log is not None:
+                    self._log.close()
+            finally:
+                # runs the pending writes before the run returns
+                if self._writer is not None:
+                    self._writer.close()
+                self._writer = None
+                self._log = None
+
+        if self.args.checkpoint == "log" and self.args.compact_on_finish:
+            logging.debug(">f materializing JSON output from the run log")
+            compact(self.output_path)
 
-        self._rankings_to_json(path = self.output_path / "rankings" / f"step_{n}_ranking.json", rankings=post_scores)
-
-        responses: typing.List[
-            typing.Tuple[User, AgentInterface, typing.List[Post]]
-        ] = list(
-            itertools.starmap(
-                self._wrapper_step_agent,
-                [
-                    (post_scores, user, agent)
-                    for user, agent in self.individuals.items()
-                ],
+    def add_hook(self, hook: StepHook) -> None:
+        """
+        Runs `hook` around every step of the following runs, in addition to the
+        profilers of `args`.
+        """
+        self._hooks.append(hook)
+
+    def _step_hooks(self) -> typing.List[StepHook]:
+        hooks = list(self._hooks)
+        if "cprofile" in self.args.profilers and self.args.profile_steps:
+            hooks.append(
+                CProfileHook(self.output_path / "profiles", self.args.profile_steps)
             )
+        if "tracemalloc" in self.args.profilers and self.args.profile_steps:
+            hooks.append(TracemallocHook(self.args.profile_steps))
+        return hooks
+
+    def _generator(self, purpose: str, user: typing.Any = None) -> typing.Any:
+        """
+        Generator of `user` for `purpose` in the running step (see `RandomStreams`), the
+        same in whichever thread or order the agents step. Every call starts the stream
+        anew; `numpy.random` outside a run.
+        """
+        if self._streams is None:
+            return np.random
+        return self._streams.generator(self._current_step, user, purpose)
+
+    def _limiters(self) -> typing.List[typing.Any]:
+        # endpoints of the ranker's and the agents' LLM clients
+        clients = [
+            getattr(self.ranker, "llm", None),
+            *(getattr(agent, "llm", None) for agent in self.individuals.values()),
+        ]
+        return [client.limiter for client in clients if client is not None]
+
+    def _phase(self, name: str) -> typing.ContextManager:
+        """
+        Times the block as phase `name` of the running step, see
+        `Instrumentation.phase`.
+        """
+        if self._metrics is None:
+            return contextlib.nullcontext()
+        return self._metrics.phase(name)
+
+    def _restore(self, run: LoggedRun) -> int:
+        """
+        Replaces network, feed, agent states and generator states by those of `run`,
+        returns the next step.
+        """
+        users = run.build_users([*self.network, *self.individuals])
+        self.network = run.build_network(users)
+        self.feed = run.build_feed(users)
+        self.individuals = run.build_agents(self.individuals, self.feed)
+        run.restore_rng()
+        if run.seed is not None:
+            self._streams = RandomStreams(run.seed)
+
+        logging.debug(
+            f">f resuming from {run.path} after step {run.step} with {len(self.feed)} posts"
         )
+        return 0 if run.step is None else run.step + 1
+
+    def _step(self, n: int = 0) -> None:
+        with self._phase("rank"):
+            post_scores: Rankings = self.ranker(
+                users=self.individuals.keys(),
+                feed=self.feed,
+                network=self.network,
+                pool=self._pool,
+            )
+
+        with self._phase("rankings"):
+            self._write_rankings(n, post_scores)
+
+        with self._phase("agents"):
+            responses: typing.List[
+                typing.Tuple[User, AgentInterface, typing.List[Post]]
+            ] = list(
+                itertools.starmap(
+                    self._timed_step_agent,
+                    [
+                        (post_scores, user, agent)
+                        for user, agent in self.individuals.items()
+                    ],
+                )
+            )
 
         # Add ID to posts
         posts = [post for _, _, agent_posts in responses for post in agent_posts]
         for post in posts:
             post.timestamp = n
-            
+        self._count(
+            ranked_pairs=len(post_scores), agents=len(responses), new_posts=len(posts)
+        )
+
         self.individuals = {user: agent for user, agent, _ in list(responses)}
-        self.feed.extend(posts)
+        with self._phase("feed_extend"):
+            self.feed.extend(posts)
+
+    def _submit(self, fn: typing.Callable, *args: typing.Any) -> None:
+        if self._writer is not None:
+            self._writer.submit(fn, *args)
+        else:
+            fn(*args)
+
+    def _embedding_batcher(self) -> typing.Optional[EmbeddingBatcher]:
+        """
+        Batcher embedding the posts of a step with the ranker's LLM, None if the ranker
+        does not use embeddings.
+        """
+        if getattr(self.ranker, "llm", None) is None:
+            return None
+        return EmbeddingBatcher(
+            self.ranker.llm,
+            max_batch_size=self.args.embedding_batch_size,
+            max_delay=self.args.embedding_batch_delay,
+        )
+
+    def _rank_and_step_agents(
+        self,
+        individuals: typing.Dict[User, AgentInterface],
+        rank: typing.Callable[[], Rankings],
+        on_ranked: typing.Optional[typing.Callable[[Rankings], None]] = None,
+    ) -> typing.Tuple[
+        Rankings, typing.List[typing.Tuple[User, AgentInterface, typing.List[Post]]]
+    ]:
+        """
+        Ranks with `rank` and steps the agents of `individuals` on threads, embedding
+        their posts as they finish. In "pipelined" execution, agents start as soon as
+        their ranking is final (see `RankerInterface.streaming`) and `on_ranked` runs
+        next to the agents instead of before them. Responses are in the order of
+        `individuals`; the run log only compares the agents of `individuals` for the
+        step.
+        """
+        batcher = self._embedding_batcher()
+        futures: typing.Dict[User, Future] = {}
+        self._stepped = set(individuals)
+
+        def embed(future: Future) -> None:
+            if batcher is not None and future.exception() is None:
+                batcher.submit(future.result()[2])
+
+        def dispatch(rankings: Rankings, user: User) -> None:
+            futures[user] = executor.submit(
+                self._timed_step_agent, rankings, user, individuals[user]
+            )
+            futures[user].add_done_callback(embed)
+
+        def write(rankings: Rankings) -> None:
+            with self._phase("rankings"):
+                on_ranked(rankings)
+
+        # agents wait on the shared LLM client, which limits the requests in flight
+        max_workers = max(1, min(len(individuals), self.args.max_concurrent_agents))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            with contextlib.ExitStack() as phases:
+                if self.args.execution == "pipelined":
+                    # agents already run while ranking, their phase covers both
+                    phases.enter_context(self._phase("agents"))
+                    with self._phase("rank"), self.ranker.streaming(dispatch):
+                        post_scores = rank()
+                    ranked = (
+                        executor.submit(write, post_scores)
+                        if on_ranked is not None
+                        else None
+                    )
+                else:
+                    with self._phase("rank"):
+                        post_scores = rank()
+                    if on_ranked is not None:
+                        write(post_scores)
+                    ranked = None
+                    phases.enter_context(self._phase("agents"))
+
+                # agents the ranker did not stream
+                for user in individuals:
+                    if user not in futures:
+                        dispatch(post_scores, user)
+
+                responses = [futures[user].result() for user in individuals]
+                if ranked is not None:
+                    ranked.result()
+
+        if batcher is not None:
+            logging.debug(
+                f">f waiting for embeddings of {sum(len(posts) for _, _, posts in responses)} posts"
+            )
+            with self._phase("embed"):
+                batcher.join()
+
+        self._count(
+            ranked_pairs=len(post_scores),
+            agents=len(responses),
+            new_posts=sum(len(posts) for _, _, posts in responses),
+        )
+        return post_scores, responses
+
+    def _timed_step_agent(
+        self, post_scores: Rankings, user: User, agent: AgentInterface
+    ) -> typing.Tuple[User, AgentInterface, typing.List[Post]]:
+        start = time.perf_counter()
+        response = self._wrapper_step_agent(post_scores, user, agent)
+        if self._metrics is not None:
+            self._metrics.duration("agent_step", time.perf_counter() - start)
+        return response
+
+    def _count(self, **counts: int) -> None:
+        if self._metrics is not None:
+            for name, value in counts.items():
+                self._metrics.count(name, value)
 
     def _wrapper_step_agent(
         self,
-        post_scores: typing.Dict[typing.Tuple[User, Post], float],
+        post_scores: Rankings,
         user: User,
         agent: AgentInterface,
     ) -> typing.Tuple[User, AgentInterface]:
-        user_feed = self._filter_posts_by_user(post_scores, user)
-        user_feed.sort(key=lambda x: x[1], reverse=True)
-        user_feed_top = user_feed[: self.args.num_posts_to_interact_with]
-
-        logging.debug(f">i number of feed items {len(user_feed)} for user {user.id}")
-        return self._step_agent(user, agent, Feed([post for post, _ in user_feed_top]))
+        logging.debug(
+            f">i number of feed items {post_scores.count(user)} for user {user.id}"
+        )
+        return self._step_agent(
+            user, agent, post_scores.view(user, self.args.num_posts_to_interact_with)
+        )
 
     @abc.abstractmethod
     def _step_agent(
-        self, user: User, agent: AgentInterface, feed: Feed
+        self, user: User, agent: AgentInterface, feed: typing.Union[Feed, FeedView]
     ) -> typing.Tuple[User, AgentInterface, typing.List[Post]]:
         pass
 
+    def _individuals_state(self) -> typing.Dict[str, typing.Any]:
+        return {
+            user.id: agent.model_dump(mode="json", exclude=["llm"])
+            for user, agent in self.individuals.items()
+        }
+
     def _individuals_to_json(self, path: str):
-        json.dump(
-            {
-                user.id: agent.model_dump(mode="json", exclude=["llm"])
-                for user, agent in self.individuals.items()
-            },
-            open(path, "w"),
-            indent=4,
-        )
+        _dump_json(path, self._individuals_state())
+
+    def _write_rankings(self, n: int, rankings: Rankings) -> None:
+        if self.args.rankings_format == "npz":
+            if self._rankings_sink is None:
+                self._rankings_sink = RankingsSink(
+                    self.output_path / "rankings",
+                    top_k=self.args.rankings_top_k,
+                    sample=self.args.rankings_sample,
+                    streams=self._streams,
+                )
+            # rankings are not changed after the step, the writer can read them directly
+            self._submit(self._rankings_sink.write, n, rankings)
+        elif self.args.rankings_format == "log" and self._log is not None:
+            self._log.rankings(n, rankings)
+        else:
+            self._submit(
+                self._rankings_to_json,
+                rankings,
+                self.output_path / "rankings" / f"step_{n}_ranking.json",
+            )
 
     def _rankings_to_json(
-        self, rankings: typing.Dict[typing.Tuple[User, Post], float], path: str
+        self, rankings: typing.Mapping[typing.Tuple[User, Post], float], path: str
     ):
-        json.dump(
+        _dump_json(
+            path,
             [
                 {"user": user.id, "post": post.id, "score": score}
                 for (user, post), score in rankings.items()
             ],
-            open(path, "w"),
-            indent=4,
         )
 
     @staticmethod
     def _filter_posts_by_user(
-        posts_scores: typing.Dict[typing.Tuple[User, Post], float], user: User
+        posts_scores: typing.Mapping[typing.Tuple[User, Post], float], user: User
     ) -> typing.List[typing.Tuple[Post, float]]:
+        if isinstance(posts_scores, Rankings):
+            return posts_scores.top(user)
+
         return [
             (post_content, post_score)
             for (post_user, post_content), post_score in posts_scores.items()
             if user == post_user
         ]
+
+
+def _append_line(path: pathlib.Path, line: str) -> None:
+    with open(path, "a") as f:
+        f.write(line + "\n")
+
+
+def _dump_json(path: pathlib.Path, data: typing.Any) -> None:
+    with open(path, "w") as f:
+        json.dump(data, f, indent=4)
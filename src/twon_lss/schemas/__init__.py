@@ -1,7 +1,9 @@
 from twon_lss.schemas.user import User
 from twon_lss.schemas.post import Post
-from twon_lss.schemas.feed import Feed
+from twon_lss.schemas.store import PostStore
+from twon_lss.schemas.feed import Feed, FeedView
 from twon_lss.schemas.network import Network
+from twon_lss.schemas.rankings import Rankings
 
 
-__all__ = ["User", "Post", "Interaction", "Feed", "Network"]
+__all__ = ["User", "Post", "PostStore", "Feed", "FeedView", "Network", "Rankings"]
@@ -1,24 +1,169 @@
 from twon_lss.schemas.user import User
-from twon_lss.schemas.post import Post
+from twon_lss.schemas.post import Post, _plain
+from twon_lss.schemas.store import PostStore
 import json
+import logging
 
-from pydantic import model_validator, PrivateAttr, Field, RootModel
+from pydantic import (
+    model_validator,
+    model_serializer,
+    PrivateAttr,
+    Field,
+    RootModel,
+    SerializationInfo,
+    SerializerFunctionWrapHandler,
+)
 from typing import List, Dict
-from bisect import bisect_right
+from bisect import bisect_left, bisect_right, insort
 import typing
 
+import numpy as np
+
+
+def _insert(positions: typing.List[int], position: int) -> None:
+    """Inserts `position` into the sorted `positions` unless it is there already."""
+    i = bisect_left(positions, position)
+    if i == len(positions) or positions[i] != position:
+        positions.insert(i, position)
+
+
+def _remove(positions: typing.List[int], position: int) -> None:
+    """Removes `position` from the sorted `positions` if it is there."""
+    i = bisect_left(positions, position)
+    if i < len(positions) and positions[i] == position:
+        del positions[i]
+
+
+def _shift(positions: typing.List[int], position: int) -> None:
+    """
+    Moves the entries of the sorted `positions` at or after `position` one position
+    back.
+    """
+    i = bisect_left(positions, position)
+    if i < len(positions):
+        positions[i:] = [p + 1 for p in positions[i:]]
+
+
 class Feed(RootModel):
     root: typing.List[Post] = Field(default_factory=list)
-    _user_index: Dict[User, List[Post]] = PrivateAttr(default_factory=dict)
-    
-    @model_validator(mode='after')
+    _positions: Dict[str, int] = PrivateAttr(default_factory=dict)
+
+    # columnar storage of the posts added by this feed, posts already stored elsewhere
+    # stay in their store
+    _store: PostStore = PrivateAttr(default_factory=PostStore)
+
+    # timestamps of root in (sorted) root order, and a counter of rebuilds and inserts
+    # that moved positions
+    _timestamps: List[int] = PrivateAttr(default_factory=list)
+    _generation: int = PrivateAttr(default=0)
+
+    # sorted positions in root of the posts authored by / read by each user
+    _authored: Dict[User, List[int]] = PrivateAttr(default_factory=dict)
+    _read: Dict[User, List[int]] = PrivateAttr(default_factory=dict)
+
+    @model_validator(mode="after")
     def _build_indexes(self):
-        self.root = sorted(self.root, key=lambda p: p.timestamp)
-        self._user_index = {}
-        for post in self.root:
-            self._user_index.setdefault(post.user, []).append(post)
+        root = sorted(self.root, key=lambda p: p.timestamp)
+        self.root = root
+        self._timestamps = [post.timestamp for post in root]
+        self._generation += 1
+        self._positions = {post.id: position for position, post in enumerate(root)}
+
+        # posts without a store are added to the feed's store in one batch
+        store = self._store
+        store.extend([post for post in root if post._location()[0] is None])
+
+        # the indexes are read from the columns of the stores the posts are in
+        stored = self._stored_rows()
+        authored: Dict[User, List[int]] = {}
+        read: Dict[User, List[int]] = {}
+        for post_store, positions, rows in stored:
+            post_store.listen(self)
+            users = post_store.users
+            for position, author, readers in zip(
+                positions,
+                post_store.authors[rows].tolist(),
+                post_store.members("reads", rows),
+                strict=True,
+            ):
+                authored.setdefault(users[author], []).append(position)
+                for reader in readers:
+                    read.setdefault(users[reader], []).append(position)
+
+        if len(stored) > 1:
+            # positions of different stores interleave
+            for positions in (*authored.values(), *read.values()):
+                positions.sort()
+        self._authored, self._read = authored, read
         return self
 
+    def _stored_rows(
+        self,
+    ) -> typing.List[typing.Tuple[PostStore, List[int], List[int]]]:
+        """(store, positions in root, rows) of every store the posts are in."""
+        stored: Dict[int, typing.Tuple[PostStore, List[int], List[int]]] = {}
+        for position, post in enumerate(self.root):
+            store, row = post._location()
+            entry = stored.setdefault(id(store), (store, [], []))
+            entry[1].append(position)
+            entry[2].append(row)
+        return list(stored.values())
+
+    @classmethod
+    def _from_posts(cls, posts: typing.List[Post]) -> "Feed":
+        """Builds a feed from already validated posts without revalidating them."""
+        return cls.model_construct(root=posts)._build_indexes()
+
+    def _store_post(self, post: Post) -> None:
+        if post._store is None:
+            self._store.add(post)
+        post._store.listen(self)
+
+    def _index(self, position: int, post: Post) -> None:
+        self._store_post(post)
+        self._positions[post.id] = position
+        insort(self._authored.setdefault(post.user, []), position)
+
+        for user in post.reads:
+            insort(self._read.setdefault(user, []), position)
+
+    def _on_read(self, post_id: str, user: User, read: bool) -> None:
+        position = self._positions.get(post_id)
+        if position is None:
+            return
+        if read:
+            _insert(self._read.setdefault(user, []), position)
+        elif user in self._read:
+            _remove(self._read[user], position)
+
+    def _unread(
+        self, user: User, authors: typing.Optional[typing.Iterable[User]] = None
+    ) -> np.ndarray:
+        """
+        Positions of the posts `user` has not read, optionally only those written by
+        `authors`.
+        """
+        read = self._read.get(user, [])
+
+        if authors is None:
+            unread = np.ones(len(self.root), dtype=bool)
+            unread[read] = False
+            return np.flatnonzero(unread)
+
+        candidates = np.unique(
+            np.fromiter(
+                (
+                    position
+                    for author in authors
+                    for position in self._authored.get(author, ())
+                ),
+                dtype=np.int64,
+            )
+        )
+        if read:
+            candidates = candidates[~np.isin(candidates, read)]
+        return candidates
+
     def __iter__(self):
         return iter(self.root)
 
@@ -29,28 +174,247 @@ class Feed(RootModel):
         return self.root[index]
 
     def append(self, post: Post) -> None:
+        """
+        Appends `post`, keeping root sorted by timestamp. A post older than the newest
+        one is inserted after the posts of its timestamp, which moves the positions of
+        the newer posts and invalidates existing views.
+        """
+        if self._timestamps and post.timestamp < self._timestamps[-1]:
+            self._insert(post)
+            return
+
         self.root.append(post)
-        self._user_index.setdefault(post.user, []).append(post)
+        self._timestamps.append(post.timestamp)
+        self._index(len(self.root) - 1, post)
+
+    def _insert(self, post: Post) -> None:
+        position = bisect_right(self._timestamps, post.timestamp)
+        logging.debug(
+            f">i out of order post {post.id}, inserted at position {position}"
+        )
+
+        self.root.insert(position, post)
+        self._timestamps.insert(position, post.timestamp)
+        self._generation += 1
+
+        for moved in range(position + 1, len(self.root)):
+            self._positions[self.root[moved].id] = moved
+        for positions in (*self._authored.values(), *self._read.values()):
+            if positions and positions[-1] >= position:
+                _shift(positions, position)
+        self._index(position, post)
 
     def extend(self, posts: typing.List[Post]) -> None:
         for post in posts:
             self.append(post)
 
-    def get_items_by_user(self, user: User) -> "Feed":
-        return Feed(root=self._user_index.get(user, []))
-    
-    def get_unread_items_by_user(self, user: User) -> "Feed":
-        return Feed(root=[p for p in self.root if user not in p.reads])
-    
-    def filter_by_timestamp(self, timestamp: int, persistence: int) -> "Feed":
+    def position(self, post: Post) -> int:
+        """Position of `post` in root."""
+        return self._positions[post.id]
+
+    def view(
+        self,
+        indices: typing.Optional[
+            typing.Union[range, typing.Sequence[int], np.ndarray]
+        ] = None,
+    ) -> "FeedView":
+        """View on the posts at `indices` (default: all posts), in the given order."""
+        return FeedView(self, range(len(self.root)) if indices is None else indices)
+
+    def get_items_by_user(self, user: User) -> "FeedView":
+        return FeedView(self, self._authored.get(user, []))
+
+    def get_unread_items_by_user(self, user: User) -> "FeedView":
+        return FeedView(self, self.get_unread_indices(user))
+
+    def get_read_indices(self, user: User) -> np.ndarray:
+        """Positions of the posts `user` has read."""
+        return np.asarray(self._read.get(user, []), dtype=np.int64)
+
+    def get_unread_indices(
+        self, user: User, authors: typing.Optional[typing.Iterable[User]] = None
+    ) -> np.ndarray:
+        """
+        Positions of the posts `user` has not read, optionally only those written by
+        `authors`.
+        """
+        return self._unread(user, authors)
+
+    def get_unread_items_by_authors(
+        self, user: User, authors: typing.Iterable[User]
+    ) -> typing.List[Post]:
+        return [self.root[i] for i in self.get_unread_indices(user, authors).tolist()]
+
+    def filter_by_timestamp(self, timestamp: int, persistence: int) -> "FeedView":
         cutoff = timestamp - persistence
-        idx = bisect_right([p.timestamp for p in self.root], cutoff)
-        return Feed(root=self.root[idx:])
-    
+        idx = bisect_right(self._timestamps, cutoff)
+        return FeedView(self, range(idx, len(self.root)))
+
+    def window(self, persistence: int) -> "FeedWindow":
+        """
+        Sliding window of the posts of the last `persistence` steps, see `FeedWindow`.
+        """
+        return FeedWindow(self, persistence)
+
+    def records(self) -> typing.List[typing.Dict[str, typing.Any]]:
+        """
+        The posts in the format of `Post.model_dump`, read from the stores in bulk.
+        """
+        records: List[typing.Dict[str, typing.Any]] = [{}] * len(self.root)
+        for store, positions, rows in self._stored_rows():
+            for position, record in zip(positions, store.records(rows), strict=True):
+                records[position] = record
+        return records
+
+    @model_serializer(mode="wrap")
+    def _serialize(
+        self, handler: SerializerFunctionWrapHandler, info: SerializationInfo
+    ) -> typing.Any:
+        # plain dumps are read from the stores in bulk instead of post by post
+        return self.records() if _plain(info) else handler(self)
+
     def to_json(self, path: str) -> None:
         """Save the Feed to a JSON file without the private attributes."""
         with open(path, "w") as f:
-            json.dump([post.model_dump() for post in self.root], f, indent=4)
+            json.dump(self.records(), f, indent=4)
 
     class Config:
-        arbitrary_types_allowed = True
\ No newline at end of file
+        arbitrary_types_allowed = True
+
+
+class FeedView:
+    """
+    Read-only view on the posts of a `Feed` at the given positions of its root. Views
+    iterate, index, slice and filter like a feed, but never copy or revalidate posts;
+    filtering a view returns another view on the same feed. Read state is shared with
+    the feed, so a view reflects reads made after it was created.
+
+    Attributes:
+        feed (Feed): The viewed feed.
+        indices (np.ndarray): Positions of the viewed posts in `feed.root`, in view
+            order.
+    """
+
+    def __init__(
+        self, feed: Feed, indices: typing.Union[range, typing.Sequence[int], np.ndarray]
+    ):
+        self.feed = feed
+        self._indices = (
+            indices
+            if isinstance(indices, range)
+            else np.asarray(indices, dtype=np.int64)
+        )
+
+    @property
+    def indices(self) -> np.ndarray:
+        if isinstance(self._indices, range):
+            return np.arange(
+                self._indices.start, self._indices.stop, self._indices.step
+            )
+        return self._indices
+
+    def _local(
+        self, positions: typing.Union[typing.Sequence[int], np.ndarray]
+    ) -> np.ndarray:
+        """View positions of the sorted feed `positions`."""
+        positions = np.asarray(positions, dtype=np.int64)
+        if isinstance(self._indices, range) and self._indices.step == 1:
+            start, stop = self._indices.start, self._indices.stop
+            lo, hi = np.searchsorted(positions, [start, max(start, stop)])
+            return positions[lo:hi] - start
+        return np.flatnonzero(np.isin(self.indices, positions))
+
+    def _select(self, local: np.ndarray) -> "FeedView":
+        return FeedView(self.feed, self.indices[local])
+
+    def __iter__(self) -> typing.Iterator[Post]:
+        positions = (
+            self._indices
+            if isinstance(self._indices, range)
+            else self._indices.tolist()
+        )
+        return map(self.feed.root.__getitem__, positions)
+
+    def __len__(self) -> int:
+        return len(self._indices)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return FeedView(self.feed, self._indices[index])
+        return self.feed.root[int(self._indices[index])]
+
+    def get_items_by_user(self, user: User) -> "FeedView":
+        return self._select(self._local(self.feed._authored.get(user, [])))
+
+    def get_unread_items_by_user(self, user: User) -> "FeedView":
+        return self._select(self.get_unread_indices(user))
+
+    def get_read_indices(self, user: User) -> np.ndarray:
+        """View positions of the posts `user` has read."""
+        return self._local(self.feed._read.get(user, []))
+
+    def get_unread_indices(
+        self, user: User, authors: typing.Optional[typing.Iterable[User]] = None
+    ) -> np.ndarray:
+        """
+        View positions of the posts `user` has not read, optionally only those written
+        by `authors`.
+        """
+        if authors is None:
+            unread = np.ones(len(self), dtype=bool)
+            unread[self.get_read_indices(user)] = False
+            return np.flatnonzero(unread)
+        return self._local(self.feed._unread(user, authors))
+
+    def get_unread_items_by_authors(
+        self, user: User, authors: typing.Iterable[User]
+    ) -> typing.List[Post]:
+        return list(self._select(self.get_unread_indices(user, authors)))
+
+    def filter_by_timestamp(self, timestamp: int, persistence: int) -> "FeedView":
+        cutoff = timestamp - persistence
+
+        if isinstance(self._indices, range) and self._indices.step == 1:
+            start, stop = self._indices.start, self._indices.stop
+            idx = bisect_right(
+                self.feed._timestamps, cutoff, lo=start, hi=max(start, stop)
+            )
+            return FeedView(self.feed, range(idx, max(idx, stop)))
+
+        idx = bisect_right([p.timestamp for p in self], cutoff)
+        return self[idx:]
+
+    def to_feed(self) -> Feed:
+        """Materializes the view as a standalone feed."""
+        return Feed._from_posts(list(self))
+
+
+class FeedWindow:
+    """
+    Sliding window over a feed with the posts newer than `timestamp - persistence`. The
+    start of the window only moves forward, so advancing it step by step searches the
+    not yet expired posts instead of the whole history.
+
+    Attributes:
+        feed (Feed): The windowed feed; posts appended to it enter the window
+            immediately.
+        persistence (int): Number of steps a post stays in the window.
+    """
+
+    def __init__(self, feed: Feed, persistence: int):
+        self.feed = feed
+        self.persistence = persistence
+        self._start = 0
+        self._generation = feed._generation
+
+    def __call__(self, timestamp: int) -> FeedView:
+        """Advances the window to `timestamp` and returns its posts."""
+        if self._generation != self.feed._generation:
+            # the feed was re-sorted, positions from before are meaningless
+            self._start = 0
+            self._generation = self.feed._generation
+
+        self._start = bisect_right(
+            self.feed._timestamps, timestamp - self.persistence, lo=self._start
+        )
+        return FeedView(self.feed, range(self._start, len(self.feed)))
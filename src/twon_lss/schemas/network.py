@@ -1,16 +1,136 @@
 import typing
 import json
+import collections.abc
 
 import pydantic
 
+import numpy as np
 import networkx
+import scipy.sparse
 
 from twon_lss.schemas.user import User
 
 
+def _fingerprint(graph: networkx.Graph) -> typing.Tuple[int, int]:
+    # node and edge count, edits that change neither need `Network.invalidate`
+    return graph.number_of_nodes(), graph.number_of_edges()
+
+
+class NetworkSnapshot:
+    """
+    Frozen CSR copy of a network graph. Users are rows in graph node order; `row_of`
+    maps user indices (see `UserRegistry`) to rows, so neighbor queries are array
+    lookups instead of networkx dict traversal.
+
+    Attributes:
+        users (List[User]): Users by row.
+        indptr (np.ndarray): CSR row pointers, neighbors of row `r` are
+            `indices[indptr[r]:indptr[r + 1]]`.
+        indices (np.ndarray): CSR neighbor rows.
+    """
+
+    def __init__(self, graph: networkx.Graph):
+        self.graph = graph
+        self.fingerprint = _fingerprint(graph)
+        self.users: typing.List[User] = list(graph.nodes())
+
+        if self.users:
+            adjacency = networkx.to_scipy_sparse_array(
+                graph, nodelist=self.users, format="csr"
+            )
+            adjacency.sort_indices()
+            self.indptr: np.ndarray = adjacency.indptr.astype(np.int64)
+            self.indices: np.ndarray = adjacency.indices.astype(np.int32)
+        else:
+            self.indptr = np.zeros(1, dtype=np.int64)
+            self.indices = np.empty(0, dtype=np.int32)
+
+        self._adjacency: typing.Optional[typing.Any] = None
+        self._index_rows()
+
+    def _index_rows(self) -> None:
+        user_indices = np.array([user.index for user in self.users], dtype=np.int64)
+        self._row_of = np.full(
+            user_indices.max() + 1 if len(user_indices) else 0, -1, dtype=np.int64
+        )
+        self._row_of[user_indices] = np.arange(len(self.users))
+
+    def __setstate__(self, state: typing.Dict[str, typing.Any]) -> None:
+        # user indices are reassigned in other processes
+        self.__dict__.update(state)
+        self._index_rows()
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    @property
+    def degrees(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    @property
+    def adjacency(self) -> typing.Any:
+        """Boolean scipy CSR adjacency matrix over rows."""
+        if self._adjacency is None:
+            self._adjacency = scipy.sparse.csr_array(
+                (np.ones(len(self.indices), dtype=bool), self.indices, self.indptr),
+                shape=(len(self), len(self)),
+            )
+        return self._adjacency
+
+    def row_of(self, user: User) -> int:
+        """Row of `user`, -1 if not in the network."""
+        index = user.index
+        return int(self._row_of[index]) if index < len(self._row_of) else -1
+
+    def rows_of(self, users: typing.Iterable[User]) -> np.ndarray:
+        """Rows of `users`, -1 for users not in the network."""
+        indices = np.fromiter((user.index for user in users), dtype=np.int64)
+        rows = np.full(len(indices), -1, dtype=np.int64)
+        known = indices < len(self._row_of)
+        rows[known] = self._row_of[indices[known]]
+        return rows
+
+    def neighbor_rows(self, row: int) -> np.ndarray:
+        return self.indices[self.indptr[row] : self.indptr[row + 1]]
+
+    def neighbor_mask(
+        self, user_rows: np.ndarray, author_rows: np.ndarray
+    ) -> np.ndarray:
+        """
+        (users x posts) mask of the posts written by a neighbor of each user, given the
+        rows of the users and of the post authors; rows of -1 never match.
+        """
+        mask = np.zeros((len(user_rows), len(author_rows)), dtype=bool)
+        known_users = np.flatnonzero(user_rows >= 0)
+        known_posts = np.flatnonzero(author_rows >= 0)
+
+        if len(known_users) and len(known_posts):
+            mask[np.ix_(known_users, known_posts)] = self.adjacency[
+                user_rows[known_users]
+            ][:, author_rows[known_posts]].toarray()
+        return mask
+
+
+class _Neighbors(collections.abc.Mapping):
+    def __init__(self, network: "Network"):
+        self._network = network
+
+    def __getitem__(self, user: User) -> typing.List[User]:
+        return self._network.get_neighbors(user)
+
+    def __iter__(self) -> typing.Iterator[User]:
+        return iter(self._network)
+
+    def __len__(self) -> int:
+        return len(self._network)
+
+
 class Network(pydantic.RootModel):
     root: networkx.Graph = networkx.Graph()
 
+    # CSR snapshot of root, rebuilt when root is replaced or edited
+    _snapshot: typing.Optional[NetworkSnapshot] = pydantic.PrivateAttr(default=None)
+
     model_config = pydantic.ConfigDict(arbitrary_types_allowed=True)
 
     def __iter__(self):
@@ -19,8 +139,64 @@ class Network(pydantic.RootModel):
     def __len__(self):
         return len(self.root.nodes())
 
+    def snapshot(self) -> NetworkSnapshot:
+        """
+        The CSR snapshot of the graph, rebuilt when `root` was replaced or its node or
+        edge count changed. Edits of `root` itself that keep both counts (such as moving
+        an edge) need a call to `invalidate`; `add_edge` and `remove_edge` invalidate
+        the snapshot themselves.
+        """
+        snapshot, root = self._snapshot, self.root
+        if (
+            snapshot is None
+            or snapshot.graph is not root
+            or snapshot.fingerprint != _fingerprint(root)
+        ):
+            snapshot = self._snapshot = NetworkSnapshot(root)
+        return snapshot
+
+    def invalidate(self) -> None:
+        self._snapshot = None
+
+    def add_edge(self, user: User, other: User) -> None:
+        self.root.add_edge(user, other)
+        self.invalidate()
+
+    def remove_edge(self, user: User, other: User) -> None:
+        self.root.remove_edge(user, other)
+        self.invalidate()
+
+    @property
+    def neighbors(self) -> typing.Mapping[User, typing.List[User]]:
+        """Neighbors of each user, as lists."""
+        return _Neighbors(self)
+
+    @property
+    def degrees(self) -> np.ndarray:
+        """Degree of each user, in iteration order."""
+        return self.snapshot().degrees
+
     def get_neighbors(self, user: User) -> typing.List[User]:
-        return list(self.root.neighbors(user))
+        # counting the edges of the graph takes a pass over its nodes, a query only
+        # checks the degree of `user`
+        snapshot, root = self._snapshot, self.root
+        row = -1
+        if (
+            snapshot is not None
+            and snapshot.graph is root
+            and len(snapshot) == len(root)
+        ):
+            row = snapshot.row_of(user)
+        if row < 0 or snapshot.indptr[row + 1] - snapshot.indptr[row] != len(
+            root.adj.get(user, ())
+        ):
+            snapshot = self.snapshot()
+            row = snapshot.row_of(user)
+        if row < 0:
+            raise networkx.NetworkXError(f"The node {user} is not in the graph.")
+
+        users = snapshot.users
+        return [users[r] for r in snapshot.neighbor_rows(row).tolist()]
 
     @classmethod
     def from_graph(cls, graph: networkx.Graph, users: typing.List[User]) -> "Network":
@@ -33,12 +209,15 @@ class Network(pydantic.RootModel):
         assert len(graph) == len(users)
         return networkx.relabel_nodes(graph, mapping=lambda node_id: users[node_id])
 
-    def to_json(self, path: str) -> None:
-        json.dump(
-            networkx.node_link_data(
-                networkx.relabel_nodes(self.root, mapping=lambda user: user.id),
-                edges="edges",
-            ),
-            open(path, "w"),
-            indent=4,
+    def node_link_data(self) -> typing.Dict[str, typing.Any]:
+        """
+        The graph with user ids as nodes in networkx node-link format, as written by
+        `to_json`.
+        """
+        return networkx.node_link_data(
+            networkx.relabel_nodes(self.root, mapping=lambda user: user.id),
+            edges="edges",
         )
+
+    def to_json(self, path: str) -> None:
+        json.dump(self.node_link_data(), open(path, "w"), indent=4)
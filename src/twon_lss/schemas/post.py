@@ -1,12 +1,66 @@
+import copy
 import typing
 import uuid
 
+import numpy as np
 import pydantic
 
 from twon_lss.schemas.user import User
+from twon_lss.schemas.store import STORED_FIELDS, PostStore
+
+
+def _plain(info: pydantic.SerializationInfo) -> bool:
+    """Whether a dump uses no options that change its content."""
+    return (
+        info.include is None
+        and info.exclude is None
+        and not info.by_alias
+        and not info.exclude_unset
+        and not info.exclude_defaults
+        and not info.exclude_none
+        and not info.round_trip
+    )
+
+
+# stored fields a bound post keeps a reference of, they are read far more often than
+# written; contents are interned by the store, so the reference costs no memory of its
+# own
+_KEPT_FIELDS = frozenset({"content", "timestamp"})
+
+
+class _Stored:
+    """
+    Reads a stored field of a bound post from its store. Unbound posts keep the field in
+    their `__dict__`, which takes precedence over this (non-data) descriptor, so their
+    reads never get here. Array values (the embedding) are returned as lists, the
+    field's public type; `Post.embedding_array` reads them without the copy.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.getter = getattr(PostStore, f"_get_{name}")
+
+    def __get__(
+        self, post: typing.Optional["Post"], owner: typing.Optional[type] = None
+    ) -> typing.Any:
+        if post is None:
+            return self
+        private = post.__pydantic_private__
+        if private is None or private["_store"] is None:
+            raise AttributeError(self.name)
+        value = self.getter(private["_store"], private["_row"])
+        return value.tolist() if isinstance(value, np.ndarray) else value
 
 
 class Post(pydantic.BaseModel):
+    """
+    A post. Once a feed adds the post to its `PostStore`, the post keeps `user`, `id`
+    and references of its `content` and `timestamp` itself and reads its other fields
+    through the store; `reads` and `likes` then are set views on the store. Writes of
+    stored fields go to the store. Copies of a bound post (`model_copy`, `copy.copy`,
+    `copy.deepcopy`) are unbound, so editing a copy leaves the stored post alone.
+    """
+
     user: User
     content: str
 
@@ -17,9 +71,99 @@ class Post(pydantic.BaseModel):
     timestamp: int = 0
     embedding: typing.Optional[typing.List[float]] = None
 
+    _store: typing.Optional[typing.Any] = pydantic.PrivateAttr(default=None)
+    _row: int = pydantic.PrivateAttr(default=-1)
+
     def __hash__(self):
         return hash(self.id)
-    
-    @pydantic.field_serializer('reads', 'likes')
+
+    def _bind(self, store: typing.Any, row: int) -> None:
+        for name in STORED_FIELDS - _KEPT_FIELDS:
+            self.__dict__.pop(name, None)
+        for name in _KEPT_FIELDS:
+            self.__dict__[name] = store.get(row, name)
+        private = self.__pydantic_private__
+        private["_store"], private["_row"] = store, row
+
+    @property
+    def embedding_array(self) -> typing.Optional[np.ndarray]:
+        """
+        The embedding as a read-only float32 array; a bound post reads it from its store
+        without a copy.
+        """
+        store, row = self._location()
+        if store is not None:
+            return store._get_embedding(row)
+        if self.embedding is None:
+            return None
+        array = np.asarray(self.embedding, dtype=np.float32)
+        array.flags.writeable = False
+        return array
+
+    def _location(self) -> typing.Tuple[typing.Optional[typing.Any], int]:
+        """Store and row of the post, (None, -1) while it is not stored."""
+        private = self.__pydantic_private__
+        return private["_store"], private["_row"]
+
+    def _unbound(self) -> "Post":
+        """Standalone copy of a stored post."""
+        return Post.model_construct(
+            _fields_set=self.model_fields_set,
+            user=self.user,
+            content=self.content,
+            reads=set(self.reads),
+            likes=set(self.likes),
+            id=self.id,
+            timestamp=self.timestamp,
+            embedding=self.embedding,
+        )
+
+    def __copy__(self) -> "Post":
+        if self._store is None:
+            return super().__copy__()
+        return self._unbound()
+
+    def __deepcopy__(
+        self, memo: typing.Optional[typing.Dict[int, typing.Any]] = None
+    ) -> "Post":
+        if self._store is None:
+            return super().__deepcopy__(memo)
+        return copy.deepcopy(self._unbound(), memo)
+
+    def __setattr__(self, name: str, value: typing.Any) -> None:
+        if name in STORED_FIELDS and self._store is not None:
+            self._store.set(self._row, name, value)
+            if name in _KEPT_FIELDS:
+                self.__dict__[name] = self._store.get(self._row, name)
+            return
+        super().__setattr__(name, value)
+
+    def __repr_args__(self):
+        for name, field in type(self).model_fields.items():
+            if field.repr:
+                yield name, getattr(self, name)
+
+    @pydantic.model_serializer(mode="wrap")
+    def _serialize(
+        self,
+        handler: pydantic.SerializerFunctionWrapHandler,
+        info: pydantic.SerializationInfo,
+    ) -> typing.Any:
+        store, row = self._location()
+        if store is None:
+            return handler(self)
+        if _plain(info):
+            # the store's record is the plain dump, in python and json mode alike
+            return store.record(row)
+        return handler(self._unbound())
+
+    @pydantic.field_serializer("reads", "likes")
     def serialize_sets(self, v: typing.Set[User]) -> typing.List[User]:
         return list(v)
+
+
+# set after the class is created, so pydantic does not take the descriptors for field
+# defaults
+for _name in STORED_FIELDS - _KEPT_FIELDS:
+    setattr(Post, _name, _Stored(_name))
+del _name
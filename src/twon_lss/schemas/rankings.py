@@ -0,0 +1,173 @@
+import typing
+import collections.abc
+
+import numpy as np
+
+from twon_lss.schemas.user import User
+from twon_lss.schemas.post import Post
+from twon_lss.schemas.feed import Feed, FeedView
+
+
+class Rankings(collections.abc.Mapping):
+    """
+    Ranker output grouped by user: for every user the positions of its candidate posts
+    in `feed.root` and their scores. Consumers select a user's best posts with
+    `top`/`view` instead of scanning all (user, post) pairs; the class still reads like
+    the former `{(user, post): score}` dict for code that iterates over all pairs.
+
+    Attributes:
+        feed (Feed): The feed the positions refer to (the viewed feed if ranked on a
+            `FeedView`).
+    """
+
+    def __init__(self, feed: typing.Union[Feed, FeedView]):
+        self.feed: Feed = feed.feed if isinstance(feed, FeedView) else feed
+        self._entries: typing.Dict[User, typing.Tuple[np.ndarray, np.ndarray]] = {}
+
+    @staticmethod
+    def positions_of(feed: typing.Union[Feed, FeedView]) -> np.ndarray:
+        """
+        Positions in the underlying feed of the posts of `feed`, in iteration order.
+        """
+        return feed.indices if isinstance(feed, FeedView) else np.arange(len(feed))
+
+    @classmethod
+    def from_scores(
+        cls,
+        feed: typing.Union[Feed, FeedView],
+        scores: typing.Mapping[typing.Tuple[User, Post], float],
+    ) -> "Rankings":
+        rankings = cls(feed)
+        per_user: typing.Dict[
+            User, typing.Tuple[typing.List[int], typing.List[float]]
+        ] = {}
+
+        for (user, post), score in scores.items():
+            positions, values = per_user.setdefault(user, ([], []))
+            positions.append(rankings.feed.position(post))
+            values.append(score)
+
+        for user, (positions, values) in per_user.items():
+            rankings.add(user, positions, values)
+
+        return rankings
+
+    def add(
+        self,
+        user: User,
+        positions: typing.Union[typing.Sequence[int], np.ndarray],
+        scores: typing.Union[typing.Sequence[float], np.ndarray],
+    ) -> None:
+        """Sets the candidates of `user`, replacing earlier ones."""
+        self._entries[user] = (
+            np.asarray(positions, dtype=np.int64),
+            np.asarray(scores, dtype=float),
+        )
+
+    def users(self) -> typing.KeysView[User]:
+        return self._entries.keys()
+
+    def count(self, user: User) -> int:
+        return len(self._entries[user][0]) if user in self._entries else 0
+
+    def _top(self, user: User, k: typing.Optional[int]) -> np.ndarray:
+        # indices into the entry of `user` of its `k` best candidates, best first
+        if user not in self._entries:
+            return np.empty(0, dtype=np.int64)
+
+        scores = self._entries[user][1]
+        n = len(scores)
+
+        if k is None or k >= n:
+            selected = np.arange(n)
+        elif k <= 0:
+            return np.empty(0, dtype=np.int64)
+        else:
+            kth = np.partition(scores, n - k)[n - k]
+            above = np.flatnonzero(scores > kth)
+            ties = np.flatnonzero(scores == kth)[: k - len(above)]
+            selected = np.sort(np.concatenate([above, ties]))
+
+        return selected[np.argsort(-scores[selected], kind="stable")]
+
+    def top_positions(self, user: User, k: typing.Optional[int] = None) -> np.ndarray:
+        """
+        Positions of the `k` best scored posts of `user` (all if `k` is None), best
+        first. Only the top `k` are sorted; equal scores keep candidate order like a
+        stable descending sort.
+        """
+        return (
+            self._entries[user][0][self._top(user, k)]
+            if user in self._entries
+            else np.empty(0, dtype=np.int64)
+        )
+
+    def columns(
+        self,
+        users: typing.Optional[typing.Iterable[User]] = None,
+        k: typing.Optional[int] = None,
+    ) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The rankings of `users` (default all) as columns over their (user, post) pairs:
+        the row of the user in `users`, the post position and the score. With `k`, only
+        the `k` best posts of each user, best first.
+        """
+        users = list(self._entries) if users is None else list(users)
+        rows, positions, scores = [], [], []
+
+        for row, user in enumerate(users):
+            if user not in self._entries:
+                continue
+            selected = self._top(user, k) if k is not None else slice(None)
+            user_positions, user_scores = self._entries[user]
+            positions.append(user_positions[selected])
+            scores.append(user_scores[selected])
+            rows.append(np.full(len(positions[-1]), row, dtype=np.int32))
+
+        if not rows:
+            return (
+                np.empty(0, dtype=np.int32),
+                np.empty(0, dtype=np.int64),
+                np.empty(0, dtype=float),
+            )
+        return np.concatenate(rows), np.concatenate(positions), np.concatenate(scores)
+
+    def top(
+        self, user: User, k: typing.Optional[int] = None
+    ) -> typing.List[typing.Tuple[Post, float]]:
+        """The `k` best scored (post, score) pairs of `user`, best first."""
+        top = self.top_positions(user, k)
+        if not len(top):
+            return []
+
+        positions, scores = self._entries[user]
+        score_of = dict(zip(positions.tolist(), scores.tolist(), strict=True))
+        return [(self.feed[pos], score_of[pos]) for pos in top.tolist()]
+
+    def view(self, user: User, k: typing.Optional[int] = None) -> FeedView:
+        """The `k` best scored posts of `user` as a view on `feed`, best first."""
+        return self.feed.view(self.top_positions(user, k))
+
+    def __getitem__(self, key: typing.Tuple[User, Post]) -> float:
+        user, post = key
+        if user not in self._entries:
+            raise KeyError(key)
+
+        positions, scores = self._entries[user]
+        match = np.flatnonzero(positions == self.feed.position(post))
+        if not len(match):
+            raise KeyError(key)
+        return float(scores[match[0]])
+
+    def __iter__(self) -> typing.Iterator[typing.Tuple[User, Post]]:
+        for user, (positions, _) in self._entries.items():
+            for pos in positions.tolist():
+                yield user, self.feed[pos]
+
+    def __len__(self) -> int:
+        return sum(len(positions) for positions, _ in self._entries.values())
+
+    def items(self) -> typing.Iterator[typing.Tuple[typing.Tuple[User, Post], float]]:
+        for user, (positions, scores) in self._entries.items():
+            for pos, score in zip(positions.tolist(), scores.tolist(), strict=True):
+                yield (user, self.feed[pos]), score
@@ -0,0 +1,559 @@
+import typing
+import itertools
+import threading
+import weakref
+import collections.abc
+
+import numpy as np
+
+from twon_lss.schemas.user import User
+
+
+# post fields held by the store once a post is added to it, see `Post`
+STORED_FIELDS = frozenset({"content", "reads", "likes", "timestamp", "embedding"})
+
+
+class _Adjacency:
+    """
+    Post -> user adjacency in CSR form. Rows changed since the last compaction live in a
+    dict of sets and are merged back into the CSR arrays once there are too many of
+    them, so frequent small updates stay cheap.
+    """
+
+    def __init__(self):
+        self._size = 0
+        # (indptr, indices, overlay), swapped as a whole so readers never see a half
+        # compacted state
+        self._state: typing.Tuple[
+            np.ndarray, np.ndarray, typing.Dict[int, typing.Set[int]]
+        ] = (
+            np.zeros(1, dtype=np.int64),
+            np.empty(0, dtype=np.int32),
+            {},
+        )
+
+    def __len__(self) -> int:
+        return self._size
+
+    def members(self, row: int) -> typing.Tuple[int, ...]:
+        indptr, indices, overlay = self._state
+        if row in overlay:
+            return tuple(overlay[row])
+        if row + 1 < len(indptr):
+            return tuple(indices[indptr[row] : indptr[row + 1]].tolist())
+        return ()
+
+    def count(self, row: int) -> int:
+        indptr, _, overlay = self._state
+        if row in overlay:
+            return len(overlay[row])
+        if row + 1 < len(indptr):
+            return int(indptr[row + 1] - indptr[row])
+        return 0
+
+    def contains(self, row: int, member: int) -> bool:
+        indptr, indices, overlay = self._state
+        if row in overlay:
+            return member in overlay[row]
+        if row + 1 < len(indptr):
+            return bool((indices[indptr[row] : indptr[row + 1]] == member).any())
+        return False
+
+    def append(self, members: typing.Iterable[int]) -> None:
+        members = set(members)
+        if members:
+            self._state[2][self._size] = members
+        self._size += 1
+        self._maybe_compact()
+
+    def extend(self, rows: typing.Sequence[typing.Iterable[int]]) -> None:
+        """Appends `rows` at once as a block of the CSR arrays."""
+        if not rows:
+            return
+        if len(self._state[0]) - 1 < self._size:
+            self.compact()
+
+        # rows keep the member order of `append`
+        rows = [set(members) for members in rows]
+        lengths = np.fromiter(map(len, rows), dtype=np.int64, count=len(rows))
+        members = np.fromiter(
+            itertools.chain.from_iterable(rows),
+            dtype=np.int32,
+            count=int(lengths.sum()),
+        )
+
+        indptr, indices, overlay = self._state
+        self._state = (
+            np.concatenate([indptr, indptr[-1] + np.cumsum(lengths)]),
+            np.concatenate([indices, members]),
+            overlay,
+        )
+        self._size += len(rows)
+
+    def member_lists(self, rows: typing.Iterable[int]) -> typing.List[typing.List[int]]:
+        """Members of each of `rows`, read from the CSR arrays in bulk."""
+        indptr, indices, overlay = self._state
+        bounds, flat = indptr.tolist(), indices.tolist()
+        return [
+            list(overlay[row])
+            if row in overlay
+            else flat[bounds[row] : bounds[row + 1]]
+            if row + 1 < len(bounds)
+            else []
+            for row in rows
+        ]
+
+    def add(self, row: int, member: int) -> bool:
+        members = self._row(row)
+        if member in members:
+            return False
+        members.add(member)
+        self._maybe_compact()
+        return True
+
+    def discard(self, row: int, member: int) -> bool:
+        members = self._row(row)
+        if member not in members:
+            return False
+        members.discard(member)
+        self._maybe_compact()
+        return True
+
+    def _row(self, row: int) -> typing.Set[int]:
+        overlay = self._state[2]
+        if row not in overlay:
+            overlay[row] = set(self.members(row))
+        return overlay[row]
+
+    def _maybe_compact(self) -> None:
+        if len(self._state[2]) > max(1024, self._size // 8):
+            self.compact()
+
+    def remap(self, lookup: np.ndarray) -> None:
+        """Replaces every member `m` by `lookup[m]`."""
+        indptr, indices, overlay = self._state
+        self._state = (
+            indptr,
+            lookup[indices].astype(np.int32),
+            {
+                row: {int(lookup[m]) for m in members}
+                for row, members in overlay.items()
+            },
+        )
+
+    def compact(self) -> None:
+        indptr, indices, overlay = self._state
+        old_rows = len(indptr) - 1
+
+        lengths = np.zeros(self._size, dtype=np.int64)
+        lengths[:old_rows] = np.diff(indptr)
+        for row, members in overlay.items():
+            lengths[row] = len(members)
+
+        new_indptr = np.zeros(self._size + 1, dtype=np.int64)
+        np.cumsum(lengths, out=new_indptr[1:])
+        new_indices = np.empty(new_indptr[-1], dtype=np.int32)
+
+        # entries of untouched rows keep their offset within the row
+        entry_rows = np.repeat(np.arange(old_rows), np.diff(indptr))
+        keep = ~np.isin(
+            entry_rows, np.fromiter(overlay.keys(), dtype=np.int64, count=len(overlay))
+        )
+        offsets = np.arange(len(indices)) - indptr[entry_rows]
+        new_indices[new_indptr[entry_rows[keep]] + offsets[keep]] = indices[keep]
+
+        for row, members in overlay.items():
+            new_indices[new_indptr[row] : new_indptr[row + 1]] = sorted(members)
+
+        self._state = (new_indptr, new_indices, {})
+
+
+class StoredSet(collections.abc.MutableSet):
+    """
+    Set of users of one post backed by a `PostStore` (the `reads`/`likes` of a stored
+    post).
+    """
+
+    __slots__ = ("_store", "_row", "_field")
+
+    def __init__(self, store: "PostStore", row: int, field: str):
+        self._store = store
+        self._row = row
+        self._field = field
+
+    def __contains__(self, user: object) -> bool:
+        return isinstance(user, User) and self._store._adjacency(self._field).contains(
+            self._row, user.index
+        )
+
+    def __iter__(self) -> typing.Iterator[User]:
+        users = self._store._users
+        return (
+            users[member]
+            for member in self._store._adjacency(self._field).members(self._row)
+        )
+
+    def __len__(self) -> int:
+        return self._store._adjacency(self._field).count(self._row)
+
+    def add(self, user: User) -> None:
+        self._store.link(self._field, self._row, user)
+
+    def discard(self, user: User) -> None:
+        self._store.unlink(self._field, self._row, user)
+
+    def update(self, *others: typing.Iterable[User]) -> None:
+        for other in others:
+            for user in other:
+                self.add(user)
+
+    def __repr__(self) -> str:
+        return repr(set(self))
+
+
+class PostStore:
+    """
+    Columnar storage of posts: integer rows instead of post objects, integer user
+    indices, interned contents, int32 timestamps, a contiguous float32 embedding matrix
+    and CSR adjacencies for reads and likes. A feed adds its posts to a store, after
+    which the `Post` objects only keep their id and author and read everything else from
+    here.
+
+    Attributes:
+        ids (List[str]): Post ids by row.
+    """
+
+    def __init__(self):
+        self.ids: typing.List[str] = []
+
+        # users referenced by the store, by their registry index
+        self._users: typing.Dict[int, User] = {}
+        self._contents: typing.List[str] = []
+        self._content_index: typing.Dict[str, int] = {}
+
+        self._authors = np.empty(0, dtype=np.int32)
+        self._content_ids = np.empty(0, dtype=np.int32)
+        self._timestamps = np.empty(0, dtype=np.int32)
+        self._embeddings: typing.Optional[np.ndarray] = None
+        self._has_embedding = np.empty(0, dtype=bool)
+
+        self._reads = _Adjacency()
+        self._likes = _Adjacency()
+
+        self._lock = threading.Lock()
+        self._listeners: typing.List[weakref.ref] = []
+        # read/like changes as (field, row, user index, added), collected once `track`
+        # was called
+        self._journal: typing.Optional[
+            typing.List[typing.Tuple[str, int, int, bool]]
+        ] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getstate__(self) -> dict:
+        # locks, listening feeds and the journal stay with the original store
+        return {
+            k: v
+            for k, v in self.__dict__.items()
+            if k not in ("_lock", "_listeners", "_journal")
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._journal = None
+
+        # unpickled users are re-registered and may have got other indices in this
+        # process
+        moved = {
+            old: user.index for old, user in self._users.items() if old != user.index
+        }
+        if moved:
+            lookup = np.arange(max(max(self._users), max(moved.values())) + 1)
+            lookup[list(moved)] = list(moved.values())
+            self._authors = lookup[self._authors].astype(np.int32)
+            self._reads.remap(lookup)
+            self._likes.remap(lookup)
+            self._users = {user.index: user for user in self._users.values()}
+
+    @property
+    def authors(self) -> np.ndarray:
+        """User index of the author of each row."""
+        return self._authors[: len(self)]
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self._timestamps[: len(self)]
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """(rows x dim) float32 embedding matrix; rows without an embedding are zero."""
+        if self._embeddings is None:
+            return np.zeros((len(self), 0), dtype=np.float32)
+        return self._embeddings[: len(self)]
+
+    @property
+    def users(self) -> typing.Dict[int, User]:
+        """Users referenced by the store, by their index (see `UserRegistry`)."""
+        return self._users
+
+    def user_index(self, user: User) -> int:
+        self._users.setdefault(user.index, user)
+        return user.index
+
+    def _intern_content(self, content: str) -> int:
+        if content not in self._content_index:
+            self._content_index[content] = len(self._contents)
+            self._contents.append(content)
+        return self._content_index[content]
+
+    def _adjacency(self, field: str) -> _Adjacency:
+        return self._reads if field == "reads" else self._likes
+
+    def _reserve(self, size: int) -> None:
+        capacity = len(self._timestamps)
+        if size <= capacity:
+            return
+
+        capacity = max(size, 2 * capacity, 64)
+        for name in ("_authors", "_content_ids", "_timestamps", "_has_embedding"):
+            column = getattr(self, name)
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[: len(column)] = column
+            setattr(self, name, grown)
+
+        if self._embeddings is not None:
+            grown = np.zeros((capacity, self._embeddings.shape[1]), dtype=np.float32)
+            grown[: len(self._embeddings)] = self._embeddings
+            self._embeddings = grown
+
+    def add(self, post: typing.Any) -> int:
+        """
+        Appends `post` and binds it to its new row, see `Post`. Returns the row.
+        """
+        values = {name: post.__dict__[name] for name in STORED_FIELDS}
+
+        with self._lock:
+            row = len(self.ids)
+            self._reserve(row + 1)
+            self.ids.append(post.id)
+            self._authors[row] = self.user_index(post.user)
+            self._content_ids[row] = self._intern_content(values["content"])
+            self._timestamps[row] = values["timestamp"]
+            self._reads.append(self.user_index(user) for user in values["reads"])
+            self._likes.append(self.user_index(user) for user in values["likes"])
+
+        self._set_embedding(row, values["embedding"])
+        post._bind(self, row)
+        return row
+
+    def extend(self, posts: typing.Sequence[typing.Any]) -> range:
+        """
+        Appends `posts` column by column and binds each to its new row, see `add`.
+        Returns the rows.
+        """
+        values = [post.__dict__ for post in posts]
+
+        with self._lock:
+            start = len(self.ids)
+            rows = range(start, start + len(posts))
+            self._reserve(rows.stop)
+            self.ids.extend(post.id for post in posts)
+            self._authors[start : rows.stop] = [
+                self.user_index(post.user) for post in posts
+            ]
+            self._content_ids[start : rows.stop] = [
+                self._intern_content(v["content"]) for v in values
+            ]
+            self._timestamps[start : rows.stop] = [v["timestamp"] for v in values]
+            for field, adjacency in (("reads", self._reads), ("likes", self._likes)):
+                # every distinct user object is registered once
+                for user in {
+                    id(user): user for v in values for user in v[field]
+                }.values():
+                    self.user_index(user)
+                adjacency.extend([[user.index for user in v[field]] for v in values])
+
+        embedded = [i for i, v in enumerate(values) if v["embedding"] is not None]
+        if embedded:
+            matrix = np.asarray(
+                [values[i]["embedding"] for i in embedded], dtype=np.float32
+            )
+            # the first embedding creates or checks the matrix
+            self._set_embedding(start + embedded[0], matrix[0])
+            self._embeddings[np.add(embedded, start)] = matrix
+            self._has_embedding[np.add(embedded, start)] = True
+
+        for row, post in zip(rows, posts, strict=True):
+            post._bind(self, row)
+        return rows
+
+    def members(
+        self, field: str, rows: typing.Iterable[int]
+    ) -> typing.List[typing.List[int]]:
+        """User indices of the `reads` or `likes` of each of `rows`, see `users`."""
+        return self._adjacency(field).member_lists(rows)
+
+    def get(self, row: int, field: str) -> typing.Any:
+        return getattr(self, f"_get_{field}")(row)
+
+    # getters of the stored fields, `Post` reads its fields through them directly
+    def _get_content(self, row: int) -> str:
+        return self._contents[self._content_ids[row]]
+
+    def _get_timestamp(self, row: int) -> int:
+        return int(self._timestamps[row])
+
+    def _get_embedding(self, row: int) -> typing.Optional[np.ndarray]:
+        if not self._has_embedding[row]:
+            return None
+        embedding = self._embeddings[row]
+        embedding.flags.writeable = False
+        return embedding
+
+    def _get_reads(self, row: int) -> StoredSet:
+        return StoredSet(self, row, "reads")
+
+    def _get_likes(self, row: int) -> StoredSet:
+        return StoredSet(self, row, "likes")
+
+    def set(self, row: int, field: str, value: typing.Any) -> None:
+        if field == "content":
+            self._content_ids[row] = self._intern_content(value)
+        elif field == "timestamp":
+            self._timestamps[row] = value
+        elif field == "embedding":
+            self._set_embedding(row, value)
+        else:
+            current = StoredSet(self, row, field)
+            for user in list(current):
+                current.discard(user)
+            current.update(value)
+
+    def _set_embedding(
+        self, row: int, embedding: typing.Optional[typing.Sequence[float]]
+    ) -> None:
+        if embedding is None:
+            self._has_embedding[row] = False
+            return
+
+        embedding = np.asarray(embedding, dtype=np.float32)
+        if self._embeddings is None:
+            self._embeddings = np.zeros(
+                (len(self._timestamps), len(embedding)), dtype=np.float32
+            )
+        if embedding.shape != self._embeddings.shape[1:]:
+            raise ValueError(
+                f"embedding of dimension {embedding.shape} does not fit store of dimension {self._embeddings.shape[1:]}"
+            )
+
+        self._embeddings[row] = embedding
+        self._has_embedding[row] = True
+
+    def link(self, field: str, row: int, user: User) -> None:
+        with self._lock:
+            added = self._adjacency(field).add(row, self.user_index(user))
+            if added and self._journal is not None:
+                self._journal.append((field, row, user.index, True))
+        if added and field == "reads":
+            self._notify(row, user, True)
+
+    def unlink(self, field: str, row: int, user: User) -> None:
+        with self._lock:
+            removed = self._adjacency(field).discard(row, user.index)
+            if removed and self._journal is not None:
+                self._journal.append((field, row, user.index, False))
+        if removed and field == "reads":
+            self._notify(row, user, False)
+
+    def track(self) -> None:
+        """Starts collecting read/like changes, see `changes`."""
+        with self._lock:
+            if self._journal is None:
+                self._journal = []
+
+    def changes(self) -> typing.List[typing.Tuple[str, int, int, bool]]:
+        """
+        Read/like changes since the last call as (field, row, user index, added), in
+        order.
+        """
+        with self._lock:
+            if self._journal is None:
+                return []
+            changes, self._journal = self._journal, []
+        return changes
+
+    def listen(self, feed: typing.Any) -> None:
+        """
+        Registers `feed` to be told about read changes through `feed._on_read(post_id,
+        user, read)`.
+        """
+        self._listeners = [ref for ref in self._listeners if ref() is not None]
+        if not any(ref() is feed for ref in self._listeners):
+            self._listeners.append(weakref.ref(feed))
+
+    def _notify(self, row: int, user: User, read: bool) -> None:
+        for ref in self._listeners:
+            feed = ref()
+            if feed is not None:
+                feed._on_read(self.ids[row], user, read)
+
+    def record(self, row: int) -> dict:
+        """The row in the format of `Post.model_dump`."""
+        users = self._users
+        return {
+            "user": users[self._authors[row]].model_dump(),
+            "content": self.get(row, "content"),
+            "reads": [users[m].model_dump() for m in self._reads.members(row)],
+            "likes": [users[m].model_dump() for m in self._likes.members(row)],
+            "id": self.ids[row],
+            "timestamp": self.get(row, "timestamp"),
+            "embedding": self._embeddings[row].tolist()
+            if self._has_embedding[row]
+            else None,
+        }
+
+    def records(self, rows: typing.Iterable[int]) -> typing.List[dict]:
+        """
+        The rows in the format of `Post.model_dump`, read column by column. Entries of
+        the same user are one dict.
+        """
+        rows = np.fromiter(rows, dtype=np.int64)
+        dumps = {index: user.model_dump() for index, user in self._users.items()}
+
+        contents = [self._contents[i] for i in self._content_ids[rows].tolist()]
+        embeddings: typing.List[typing.Optional[typing.List[float]]] = [None] * len(
+            rows
+        )
+        if self._embeddings is not None:
+            embedded = np.flatnonzero(self._has_embedding[rows])
+            for i, embedding in zip(
+                embedded.tolist(),
+                self._embeddings[rows[embedded]].tolist(),
+                strict=True,
+            ):
+                embeddings[i] = embedding
+
+        return [
+            {
+                "user": dumps[author],
+                "content": content,
+                "reads": [dumps[m] for m in reads],
+                "likes": [dumps[m] for m in likes],
+                "id": self.ids[row],
+                "timestamp": timestamp,
+                "embedding": embedding,
+            }
+            for row, author, content, reads, likes, timestamp, embedding in zip(
+                rows.tolist(),
+                self._authors[rows].tolist(),
+                contents,
+                self.members("reads", rows.tolist()),
+                self.members("likes", rows.tolist()),
+                self._timestamps[rows].tolist(),
+                embeddings,
+                strict=True,
+            )
+        ]
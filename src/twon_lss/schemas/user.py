@@ -1,10 +1,79 @@
+import typing
 import uuid
+import threading
 
 import pydantic
 
 
+class UserRegistry:
+    """
+    Assigns every distinct user id a dense integer index, in order of first appearance.
+    Users compare and hash by their index, and array based structures (post stores,
+    feeds, rankers) can use it as a row or column.
+    """
+
+    def __init__(self):
+        self._indices: typing.Dict[str, int] = {}
+        self._ids: typing.List[str] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def index(self, user_id: str) -> int:
+        """Index of `user_id`, registering it on first use."""
+        index = self._indices.get(user_id)
+        if index is None:
+            with self._lock:
+                index = self._indices.setdefault(user_id, len(self._ids))
+                if index == len(self._ids):
+                    self._ids.append(user_id)
+        return index
+
+    def id(self, index: int) -> str:
+        return self._ids[index]
+
+
+# process wide registry, indices are not stable across processes and are reassigned on
+# unpickling
+REGISTRY = UserRegistry()
+
+
 class User(pydantic.BaseModel):
+    # dense integer index of the user, see `UserRegistry`; a plain slot, as hashing
+    # reads it for every dict/set lookup
+    __slots__ = ("index",)
+
     id: str = pydantic.Field(default_factory=lambda: f"user-{uuid.uuid4()}")
 
+    def model_post_init(self, __context: typing.Any) -> None:
+        object.__setattr__(self, "index", REGISTRY.index(self.id))
+
+    def __setattr__(self, name: str, value: typing.Any) -> None:
+        super().__setattr__(name, value)
+        if name == "id":
+            object.__setattr__(self, "index", REGISTRY.index(value))
+
+    def __setstate__(self, state: typing.Dict[str, typing.Any]) -> None:
+        super().__setstate__(state)
+        object.__setattr__(self, "index", REGISTRY.index(self.id))
+
+    def __copy__(self) -> "User":
+        copied = super().__copy__()
+        object.__setattr__(copied, "index", self.index)
+        return copied
+
+    def __deepcopy__(
+        self, memo: typing.Optional[typing.Dict[int, typing.Any]] = None
+    ) -> "User":
+        copied = super().__deepcopy__(memo)
+        object.__setattr__(copied, "index", self.index)
+        return copied
+
     def __hash__(self):
-        return hash(self.id)
+        return self.index
+
+    def __eq__(self, other: typing.Any) -> bool:
+        if isinstance(other, User):
+            return self.index == other.index
+        return NotImplemented
@@ -6,11 +6,12 @@ from twon_lss.interfaces import (
     SimulationInterface,
     SimulationInterfaceArgs,
 )
-from twon_lss.schemas import Feed, User, Post
+from twon_lss.schemas import FeedView, User, Post
 
 
 from twon_lss.simulations.bcm.agent import Agent
 from twon_lss.simulations.bcm.ranker import Ranker, RankerArgs
+from twon_lss.simulations.bcm.engine import Engine
 
 
 __all__ = [
@@ -20,6 +21,7 @@ __all__ = [
     "AgentInstructions",
     "Ranker",
     "RankerArgs",
+    "Engine",
 ]
 
 
@@ -28,7 +30,7 @@ class SimulationArgs(SimulationInterfaceArgs):
 
 
 class Simulation(SimulationInterface):
-    def _step_agent(self, user: User, agent: AgentInterface, feed: Feed):
+    def _step_agent(self, user: User, agent: AgentInterface, feed: FeedView):
         new_posts: typing.List[Post] = []
 
         for post in feed:
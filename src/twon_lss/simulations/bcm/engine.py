@@ -0,0 +1,281 @@
+import typing
+import logging
+
+import numpy as np
+
+from twon_lss.schemas import User, Post, Feed, Network
+from twon_lss.simulations.bcm.agent import Agent
+from twon_lss.simulations.bcm.ranker import Ranker
+
+
+__all__ = ["Engine"]
+
+
+class Engine:
+    """
+    Array-native bounded confidence simulation. Opinions, confidence bounds and exposure
+    of the agents and opinion, author and step of the posts are NumPy arrays; a step
+    ranks and updates all agents at once instead of going through `Post`, `Feed` and the
+    ranker per pair.
+
+    A step follows `Simulation`: every agent is offered the posts of its network
+    neighbors that it has not read, scored by `ranker` (network score per post, times
+    noise per pair, as `Ranker` does), and reads its `num_posts` best posts in order.
+    Every read moves its opinion `delta` towards the post if they differ by less than
+    `eps`, and the agent posts its new opinion. With noise disabled and a "positivity"
+    or "negativity" ranker, the results equal those of `Simulation`; randomness comes
+    from the engine's own generator otherwise.
+
+    `window` limits the candidates of step n to the posts with a timestamp of at least
+    n - `window`, posts of the last `window` steps. `Simulation` ranks the whole feed,
+    whose size grows with every step; a window keeps the cost of a step constant.
+
+    Attributes:
+        users (List[User]): The agents, row i of the agent arrays.
+        opinions (np.ndarray): Current opinion of every agent.
+        eps (np.ndarray): Confidence bound of every agent.
+        delta (np.ndarray): Convergence rate of every agent.
+        exposure (np.ndarray): Posts every agent read so far.
+        history (List[np.ndarray]): Opinions of the agents after every step, starting
+            with the initial ones.
+    """
+
+    def __init__(
+        self,
+        individuals: typing.Mapping[User, Agent],
+        network: Network,
+        feed: Feed,
+        ranker: typing.Optional[Ranker] = None,
+        num_posts: int = 5,
+        window: typing.Optional[int] = None,
+        seed: typing.Optional[int] = None,
+    ):
+        if any(not agent.memory for agent in individuals.values()):
+            raise ValueError("every agent needs an initial opinion in its memory")
+
+        self.ranker = ranker or Ranker()
+        self.num_posts = num_posts
+        self.window = window
+        self.rng = np.random.default_rng(seed)
+
+        self.users = list(individuals)
+        self._agents = list(individuals.values())
+        self._memory = [list(agent.memory) for agent in self._agents]
+        self.opinions = np.array(
+            [agent.memory[-1] for agent in self._agents], dtype=float
+        )
+        self.eps = np.array([agent.eps for agent in self._agents], dtype=float)
+        self.delta = np.array([agent.delta for agent in self._agents], dtype=float)
+        self.exposure = np.zeros(len(self.users), dtype=np.int64)
+        self.history: typing.List[np.ndarray] = [self.opinions.copy()]
+
+        snapshot = network.snapshot()
+        self._indptr, self._indices = snapshot.indptr, snapshot.indices
+        self._agent_rows = snapshot.rows_of(self.users)
+        # agent of every network row, -1 for users without an agent
+        self._agent_of_row = np.full(len(snapshot), -1, dtype=np.int64)
+        known = self._agent_rows >= 0
+        self._agent_of_row[self._agent_rows[known]] = np.flatnonzero(known)
+
+        # the initial posts are kept as they are, posts of the engine only exist as
+        # array rows
+        self._initial: typing.List[Post] = list(feed)
+        self._post_opinions = np.array(
+            [float(post.content) for post in self._initial], dtype=float
+        )
+        self._post_rows = snapshot.rows_of(post.user for post in self._initial)
+        self._post_agents = np.full(len(self._initial), -1, dtype=np.int64)
+        self._post_steps = np.array(
+            [post.timestamp for post in self._initial], dtype=np.int64
+        )
+
+        # initial posts can have been read already, as (agent, post) pairs
+        agent_index = {user: i for i, user in enumerate(self.users)}
+        self._read = np.array(
+            [
+                agent_index[user] * len(self._initial) + position
+                for position, post in enumerate(self._initial)
+                for user in post.reads
+                if user in agent_index
+            ],
+            dtype=np.int64,
+        )
+        self._steps = 0
+
+    @classmethod
+    def from_simulation(cls, simulation: typing.Any, **kwargs: typing.Any) -> "Engine":
+        """
+        Engine with the agents, network, feed, ranker and posts per step of a
+        `Simulation`.
+        """
+        return cls(
+            simulation.individuals,
+            simulation.network,
+            simulation.feed,
+            simulation.ranker,
+            simulation.args.num_posts_to_interact_with,
+            **kwargs,
+        )
+
+    def __call__(self, num_steps: int) -> None:
+        for _ in range(num_steps):
+            self.step()
+
+    @property
+    def num_posts_total(self) -> int:
+        return len(self._post_opinions)
+
+    def step(self) -> None:
+        n = self._steps
+        candidates = self._candidates(n)
+        agents, posts = self._pairs(candidates)
+
+        scores = self.ranker.args.weights.network * self._network_scores(posts)
+        noise = self.ranker.args.noise
+        if noise.low != 1.0 or noise.high != 1.0:
+            scores = scores * self.rng.uniform(noise.low, noise.high, size=len(scores))
+
+        offered = np.full((len(self.users), self.num_posts), np.nan)
+        for j, (readers, picked) in enumerate(self._top(agents, posts, scores)):
+            offered[readers, j] = self._post_opinions[picked]
+
+        # the reads of an agent are sequential, all agents read their j-th post at once
+        written = np.full_like(offered, np.nan)
+        x = self.opinions.copy()
+        for j in range(self.num_posts):
+            xj = offered[:, j]
+            valid = ~np.isnan(xj)
+            close = valid & (np.abs(x - xj) < self.eps)
+            x = np.where(close, x + self.delta * (xj - x), x)
+            written[:, j] = np.where(valid, x, np.nan)
+
+        self.opinions = x
+        self.exposure += (~np.isnan(offered)).sum(axis=1)
+        self.history.append(x.copy())
+
+        # new posts in agent order, as `Simulation` extends the feed
+        authors, reads = np.nonzero(~np.isnan(written))
+        self._post_opinions = np.concatenate(
+            [self._post_opinions, written[authors, reads]]
+        )
+        self._post_rows = np.concatenate([self._post_rows, self._agent_rows[authors]])
+        self._post_agents = np.concatenate([self._post_agents, authors])
+        self._post_steps = np.concatenate(
+            [self._post_steps, np.full(len(authors), n, dtype=np.int64)]
+        )
+
+        logging.debug(
+            f">f bcm engine step {n}: {len(candidates)} candidate posts, {len(authors)} new posts"
+        )
+        self._steps += 1
+
+    def _candidates(self, n: int) -> np.ndarray:
+        if self.window is None:
+            return np.arange(self.num_posts_total)
+        return np.flatnonzero(self._post_steps >= n - self.window)
+
+    def _pairs(self, candidates: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray]:
+        # (agent, post) pairs of every candidate post and the agents among the neighbors
+        # of its author
+        rows = self._post_rows[candidates]
+        candidates, rows = candidates[rows >= 0], rows[rows >= 0]
+
+        starts = self._indptr[rows]
+        counts = self._indptr[rows + 1] - starts
+        posts = np.repeat(candidates, counts)
+        offsets = np.arange(len(posts)) - np.repeat(np.cumsum(counts) - counts, counts)
+        agents = self._agent_of_row[self._indices[np.repeat(starts, counts) + offsets]]
+
+        keep = agents >= 0
+        if len(self._read):
+            initial = posts < len(self._initial)
+            keep &= ~(
+                initial & np.isin(agents * len(self._initial) + posts, self._read)
+            )
+        return agents[keep], posts[keep]
+
+    def _top(
+        self, agents: np.ndarray, posts: np.ndarray, scores: np.ndarray
+    ) -> typing.Iterator[typing.Tuple[np.ndarray, np.ndarray]]:
+        """
+        Agents and their j-th best post for j < `num_posts`, equal scores in feed order
+        as `Rankings.top_positions`. Pairs come in feed order; k rounds of a grouped
+        maximum are much cheaper than sorting all pairs.
+        """
+        scores = scores.astype(float, copy=True)
+        for _ in range(self.num_posts):
+            best = np.full(len(self.users), -np.inf)
+            np.maximum.at(best, agents, scores)
+            hits = np.flatnonzero((scores == best[agents]) & (scores > -np.inf))
+
+            first = np.full(len(self.users), len(scores))
+            np.minimum.at(first, agents[hits], hits)
+            readers = np.flatnonzero(first < len(scores))
+            if not len(readers):
+                return
+            yield readers, posts[first[readers]]
+            scores[first[readers]] = -np.inf
+
+    def _network_scores(self, posts: np.ndarray) -> np.ndarray:
+        if self.ranker.type == "random":
+            # one score per post and step, shared by all agents the post is offered to
+            return self.rng.uniform(-1.0, 1.0, size=self.num_posts_total)[posts]
+        if self.ranker.type == "positivity":
+            return self._post_opinions[posts]
+        if self.ranker.type == "negativity":
+            return -self._post_opinions[posts]
+        return np.zeros(len(posts))
+
+    def feed(self) -> Feed:
+        """
+        The feed of the run: the initial posts and a `Post` per post of the engine, as
+        `Simulation` writes them.
+        """
+        posts = [
+            Post.model_construct(
+                user=post.user,
+                content=post.content,
+                reads=set(post.reads),
+                likes=set(post.likes),
+                id=post.id,
+                timestamp=post.timestamp,
+                embedding=post.embedding,
+            )
+            for post in self._initial
+        ]
+        start = len(self._initial)
+        for agent, opinion, step in zip(
+            self._post_agents[start:].tolist(),
+            self._post_opinions[start:].tolist(),
+            self._post_steps[start:].tolist(),
+            strict=True,
+        ):
+            posts.append(
+                Post(user=self.users[agent], content=str(opinion), timestamp=step)
+            )
+        return Feed._from_posts(posts)
+
+    def agents(self) -> typing.Dict[User, Agent]:
+        """
+        The agents with their memory as `Simulation` keeps it: initial memory and the
+        opinion after every read.
+        """
+        start = len(self._initial)
+        authors = self._post_agents[start:]
+        order = np.argsort(authors, kind="stable")
+        bounds = np.searchsorted(authors[order], np.arange(len(self.users) + 1))
+        opinions = self._post_opinions[start:][order]
+
+        return {
+            user: agent.model_copy(
+                update={
+                    "memory": [
+                        *self._memory[i],
+                        *opinions[bounds[i] : bounds[i + 1]].tolist(),
+                    ]
+                }
+            )
+            for i, (user, agent) in enumerate(
+                zip(self.users, self._agents, strict=True)
+            )
+        }
@@ -1,9 +1,11 @@
 import typing
-import random
+
+import numpy as np
 
 from twon_lss.interfaces import RankerInterface, RankerArgsInterface
 
 from twon_lss.schemas import User, Post, Feed
+from twon_lss.utility import FeedSnapshot
 
 
 __all__ = ["Ranker", "RankerArgs"]
@@ -19,9 +21,11 @@ class Ranker(RankerInterface):
     )
     args: RankerArgs = RankerArgs()
 
+    supports_snapshot: typing.ClassVar[bool] = True
+
     def _compute_network(self, post: Post) -> float:
         if self.type == "random":
-            return random.uniform(-1.0, 1.0)
+            return float(self._generator("network").uniform(-1.0, 1.0))
 
         elif self.type == "positivity":
             return float(post.content)
@@ -34,3 +38,30 @@ class Ranker(RankerInterface):
 
     def _compute_individual(self, _user: User, _post: Post, _feed: Feed) -> float:
         return 0.0
+
+    def compute_network_batch(self, posts: typing.Sequence[Post]) -> np.ndarray:
+        if self.type == "random":
+            return self._generator("network").uniform(-1.0, 1.0, size=len(posts))
+
+        elif self.type == "positivity":
+            return np.array([float(post.content) for post in posts])
+
+        elif self.type == "negativity":
+            return np.array([float(post.content) for post in posts]) * -1
+
+        else:
+            return np.zeros(len(posts))
+
+    def compute_individual_batch(
+        self,
+        users: typing.Sequence[User],
+        posts: typing.Sequence[Post],
+        _feed: Feed,
+        _mask: typing.Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        return np.zeros((len(users), len(posts)))
+
+    def _compute_individual_snapshot(
+        self, _snapshot: FeedSnapshot, _context: typing.Any, candidates: np.ndarray
+    ) -> np.ndarray:
+        return np.zeros(len(candidates))
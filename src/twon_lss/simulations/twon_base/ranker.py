@@ -1,14 +1,16 @@
 import statistics
 import logging
 import time
-import random
 import typing
 
+import numpy as np
+
 from twon_lss.interfaces import RankerInterface, RankerArgsInterface
 
-from twon_lss.schemas import User, Post, Feed
+from twon_lss.schemas import User, Post, Feed, Rankings
 from twon_lss.schemas.network import Network
-from twon_lss.utility import LLM
+from twon_lss.utility import LLM, FeedSnapshot, WorkerPool
+from twon_lss.utility.similarity import embedding_matrix, mean_cosine_similarity
 
 from sklearn.metrics.pairwise import cosine_similarity
 
@@ -28,62 +30,126 @@ class Ranker(RankerInterface):
     def _compute_network(self, post: Post) -> float:
         return len(post.likes)
 
-    def _compute_individual(self, user: User, post: Post, feed: Feed) -> float:   
+    def _compute_individual(self, user: User, post: Post, feed: Feed) -> float:
         try:
             return statistics.mean(
                 self.llm.similarity(
-                    post.content, [item.content for item in feed.get_items_by_user(user)]
+                    post.content,
+                    [item.content for item in feed.get_items_by_user(user)],
                 )
             )
         except Exception as e:
             logging.error(f"Error computing individual score: {e}")
             time.sleep(15)
             return 0.0
-        
+
 
 class RandomRanker(RankerInterface):
     args: RankerArgs = RankerArgs()
 
+    supports_snapshot: typing.ClassVar[bool] = True
+
     def _compute_network(self, post: Post) -> float:
         return 0.0
 
-    def _compute_individual(self, user: User, post: Post, feed: Feed) -> float:   
-        return random.uniform(0, 1)
-    
+    def _compute_individual(self, user: User, post: Post, feed: Feed) -> float:
+        return float(self._generator("individual", user).uniform(0, 1))
+
+    def compute_network_batch(self, posts: typing.Sequence[Post]) -> np.ndarray:
+        return np.zeros(len(posts))
+
+    def compute_individual_batch(
+        self,
+        users: typing.Sequence[User],
+        posts: typing.Sequence[Post],
+        feed: Feed,
+        mask: typing.Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        return self._draw_batch(
+            "individual",
+            users,
+            np.ones((len(users), len(posts)), dtype=bool) if mask is None else mask,
+        )
+
+    def _snapshot_context(self, user: User, feed: Feed) -> str:
+        # the workers draw from the user's stream
+        return user.id
+
+    def _compute_individual_snapshot(
+        self, snapshot: FeedSnapshot, context: str, candidates: np.ndarray
+    ) -> np.ndarray:
+        return self._generator("individual", context).uniform(
+            0, 1, size=len(candidates)
+        )
+
 
 class LikeRanker(RankerInterface):
     args: RankerArgs = RankerArgs()
 
+    supports_snapshot: typing.ClassVar[bool] = True
+
     def _compute_network(self, post: Post) -> float:
-        return len(post.likes) + random.uniform(0, 1) # to prevent "chronological reading"
+        return len(post.likes) + float(
+            self._generator("network").uniform(0, 1)
+        )  # to prevent "chronological reading"
 
-    def _compute_individual(self, user: User, post: Post, feed: Feed) -> float:   
+    def _compute_individual(self, user: User, post: Post, feed: Feed) -> float:
         return 0.0
-    
+
+    def compute_network_batch(self, posts: typing.Sequence[Post]) -> np.ndarray:
+        return np.array(
+            [len(post.likes) for post in posts], dtype=float
+        ) + self._generator("network").uniform(0, 1, size=len(posts))
+
+    def compute_individual_batch(
+        self,
+        users: typing.Sequence[User],
+        posts: typing.Sequence[Post],
+        feed: Feed,
+        mask: typing.Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        return np.zeros((len(users), len(posts)))
+
+    def _compute_individual_snapshot(
+        self, snapshot: FeedSnapshot, context: typing.Any, candidates: np.ndarray
+    ) -> np.ndarray:
+        return np.zeros(len(candidates))
+
 
 class UserLikeRanker(RankerInterface):
     args: RankerArgs = RankerArgs()
 
     def _compute_network(self, post: Post, feed: Feed) -> float:
-        return feed.get_like_count_by_user(post.user) + random.uniform(0, 1) # to prevent "chronological reading"
+        return feed.get_like_count_by_user(post.user) + float(
+            self._generator("network").uniform(0, 1)
+        )  # to prevent "chronological reading"
 
-    def _compute_individual(self, user: User, post: Post, feed: Feed) -> float:   
+    def _compute_individual(self, user: User, post: Post, feed: Feed) -> float:
         return 0.0
 
     def __call__(
-        self, users: typing.List[User], feed: Feed, network: Network
-    ) -> typing.Dict[typing.Tuple[User, Post], float]:
+        self,
+        users: typing.List[User],
+        feed: Feed,
+        network: Network,
+        pool: typing.Optional[WorkerPool] = None,
+    ) -> Rankings:
         logging.debug(f"{len(feed)=}")
 
         global_scores: typing.Dict[str, float] = {}
         for post in feed:
-            global_scores[post.id] = self._compute_network(post, feed) # Default implementation doesn't pass Feeds object
+            global_scores[post.id] = self._compute_network(
+                post, feed
+            )  # Default implementation doesn't pass Feeds object
 
         # retrieve indivual score for visible (if is neighbor) post for each user
         final_scores: typing.Dict[typing.Tuple[User, Post], float] = {}
         for user in users:
+            self._generators.clear()
             for post in self.get_individual_posts(user, feed, network):
-                individual_score = random.uniform(0, 1)
+                individual_score = float(
+                    self._generator("individual", user).uniform(0, 1)
+                )
                 global_score = global_scores[post.id]
 
                 combined_score = (
@@ -91,10 +157,12 @@ class UserLikeRanker(RankerInterface):
                     + self.args.weights.network * global_score
                 )
 
-                final_scores[(user, post)] = self.args.noise() * combined_score
+                final_scores[(user, post)] = (
+                    self.args.noise(self._generator("noise", user)) * combined_score
+                )
+
+        return Rankings.from_scores(feed, final_scores)
 
-        return final_scores
-    
 
 class PersonalizedUserLikeRanker(RankerInterface):
     args: RankerArgs = RankerArgs()
@@ -102,22 +170,61 @@ class PersonalizedUserLikeRanker(RankerInterface):
     def _compute_network(self, post: Post) -> float:
         return 0.0
 
-    def _compute_individual(self, user: User, post: Post, feed: Feed) -> float:   
-        return feed.get_likes_given_to_user(user, post.user) + random.uniform(0, 1) # Add noise in case that there are no likes, liked user has multiple unread tweets, multiple users have same like count etc.
-    
-    
+    def _compute_individual(self, user: User, post: Post, feed: Feed) -> float:
+        return (
+            feed.get_likes_given_to_user(user, post.user)
+            + float(self._generator("individual", user).uniform(0, 1))
+        )  # Add noise in case that there are no likes, liked user has multiple unread tweets, multiple users have same like count etc.
 
 
 class SemanticSimilarityRanker(RankerInterface):
     llm: LLM
     args: RankerArgs = RankerArgs()
 
+    supports_snapshot: typing.ClassVar[bool] = True
+
     def _compute_network(self, post: Post) -> float:
         return 0.0
 
-    def _compute_individual(self, user: User, post: Post, feed: Feed) -> float:   
-
-        return(statistics.mean(
-                cosine_similarity([post.embedding], [item.embedding for item in feed.get_items_by_user(user)][-10:])[0]
-        ))
-        
\ No newline at end of file
+    def _compute_individual(self, user: User, post: Post, feed: Feed) -> float:
+
+        return statistics.mean(
+            cosine_similarity(
+                [post.embedding_array],
+                [item.embedding_array for item in feed.get_items_by_user(user)][-10:],
+            )[0]
+        )
+
+    def compute_network_batch(self, posts: typing.Sequence[Post]) -> np.ndarray:
+        return np.zeros(len(posts))
+
+    def compute_individual_batch(
+        self,
+        users: typing.Sequence[User],
+        posts: typing.Sequence[Post],
+        feed: Feed,
+        mask: typing.Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        # mean cosine similarity to the user's 10 most recent posts, for all pairs at
+        # once
+        return mean_cosine_similarity(
+            [
+                embedding_matrix(
+                    [item.embedding_array for item in feed.get_items_by_user(user)][
+                        -10:
+                    ]
+                )
+                for user in users
+            ],
+            embedding_matrix([post.embedding_array for post in posts]),
+        )
+
+    def _snapshot_context(self, user: User, feed: Feed) -> np.ndarray:
+        return embedding_matrix(
+            [item.embedding_array for item in feed.get_items_by_user(user)][-10:]
+        ).astype(np.float32)
+
+    def _compute_individual_snapshot(
+        self, snapshot: FeedSnapshot, context: np.ndarray, candidates: np.ndarray
+    ) -> np.ndarray:
+        return mean_cosine_similarity([context], snapshot.embeddings[candidates])[0]
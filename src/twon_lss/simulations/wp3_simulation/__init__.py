@@ -1,10 +1,6 @@
 import logging
-import multiprocessing
 import typing
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import multiprocessing
-import random
-import numpy as np
+import pydantic
 
 from twon_lss.interfaces import (
     AgentInterface,
@@ -12,13 +8,23 @@ from twon_lss.interfaces import (
     SimulationInterface,
     SimulationInterfaceArgs,
 )
-from twon_lss.schemas import Feed, User, Post
+from twon_lss.schemas import FeedView, User, Post, Rankings
+from twon_lss.schemas.feed import FeedWindow
 
 
 from twon_lss.simulations.wp3_simulation.agent import WP3Agent, AgentInstructions
-from twon_lss.simulations.wp3_simulation.ranker import RankerArgs, SemanticSimilarityRanker, RandomRanker
+from twon_lss.simulations.wp3_simulation.ranker import (
+    RankerArgs,
+    SemanticSimilarityRanker,
+    RandomRanker,
+)
+from twon_lss.simulations.wp3_simulation.scheduler import ActivationScheduler
 
-from twon_lss.simulations.wp3_simulation.utility import WP3LLM, agent_parameter_estimation, simulation_load_estimator
+from twon_lss.simulations.wp3_simulation.utility import (
+    WP3LLM,
+    agent_parameter_estimation,
+    simulation_load_estimator,
+)
 
 __all__ = [
     "Simulation",
@@ -29,6 +35,7 @@ __all__ = [
     "RandomRanker",
     "SemanticSimilarityRanker",
     "RankerArgs",
+    "ActivationScheduler",
     "WP3LLM",
     "agent_parameter_estimation",
     "simulation_load_estimator",
@@ -40,20 +47,19 @@ class SimulationArgs(SimulationInterfaceArgs):
 
 
 class Simulation(SimulationInterface):
+    # sliding persistence window over the feed, advanced once per step
+    _window: typing.Optional[FeedWindow] = pydantic.PrivateAttr(default=None)
+    # next activation step of every agent, built at the first step of a run
+    _scheduler: typing.Optional[ActivationScheduler] = pydantic.PrivateAttr(
+        default=None
+    )
 
     def model_post_init(self, __context: typing.Any):
 
-        # Ensure there is no seed
-        random.seed() 
-        np.random.seed()
-        logging.debug(">f seeds removed for simulation run")
-        
         # Generate initial embeddings if required
         if hasattr(self.ranker, "llm") and self.ranker.llm is not None:
             logging.debug(f">f generating embeddings for {len(self.feed)} feed posts")
-            embeddings = self.ranker.llm.extract(
-                [post.content for post in self.feed]
-            )
+            embeddings = self.ranker.llm.extract([post.content for post in self.feed])
             for post, embedding in zip(self.feed, embeddings):
                 post.embedding = embedding
 
@@ -68,20 +74,20 @@ class Simulation(SimulationInterface):
         self.output_path.mkdir(exist_ok=True)
         (self.output_path / "rankings").mkdir(exist_ok=True)
 
+    def __call__(self) -> None:
+        self._scheduler = None
+        super().__call__()
 
     def _wrapper_step_agent(
         self,
-        post_scores: typing.Dict[typing.Tuple[User, Post], float],
+        post_scores: Rankings,
         user: User,
         agent: AgentInterface,
     ):
-        user_feed = self._filter_posts_by_user(post_scores, user)
-        user_feed.sort(key=lambda x: x[1], reverse=True)
-
-        return self._step_agent(user, agent, Feed([post for post, _ in user_feed]))
+        # the agent reads at most read_amount posts, only those need to be ordered
+        return self._step_agent(user, agent, post_scores.view(user, agent.read_amount))
 
-
-    def _step_agent(self, user: User, agent: WP3Agent, feed: Feed):
+    def _step_agent(self, user: User, agent: WP3Agent, feed: FeedView):
 
         posts: typing.List[Post] = []
 
@@ -89,65 +95,66 @@ class Simulation(SimulationInterface):
         agent.activations += 1
 
         # Determine how many posts the users reads
-        user_feed_top = feed[:agent.read_amount]
-        logging.debug(f">i number of feed items {len(user_feed_top)} for user {user.id}")
+        user_feed_top = feed[: agent.read_amount]
+        logging.debug(
+            f">i number of feed items {len(user_feed_top)} for user {user.id}"
+        )
 
         # Read posts in the feed
-        agent.consume_feed(user_feed_top, user)
+        agent.consume_feed(user_feed_top, user, rng=self._generator("like", user))
 
         # Post new content
         agent_posting_probability = agent.posting_probability
         while agent_posting_probability > 1.0:
             posts.append(Post(user=user, content=agent.post()))
             agent_posting_probability -= 1.0
-        if random.random() <= agent.posting_probability:
+        if self._generator("post", user).random() <= agent.posting_probability:
             posts.append(Post(user=user, content=agent.post()))
         agent.posts.extend(posts)
 
         return user, agent, posts
-    
 
     def _step(self, n: int = 0) -> None:
         # Strip feed to only recent posts for efficiency
-        stripped_feed = self.feed.filter_by_timestamp(n, self.ranker.args.persistence)
-        
+        if self._window is None or self._window.feed is not self.feed:
+            self._window = self.feed.window(self.ranker.args.persistence)
+        stripped_feed = self._window(n)
+
         # Calculate post scores
-        active_individuals = {user: agent for user, agent in self.individuals.items() if random.random() <= agent.activation_probability}
-        logging.debug(f">i calculating post scores for {len(active_individuals)} active individuals")
+        if self._scheduler is None:
+            self._scheduler = ActivationScheduler(
+                self.individuals, start=n, streams=self._streams
+            )
+        active_individuals = self._scheduler.due(n, self.individuals)
+        logging.debug(
+            f">i calculating post scores for {len(active_individuals)} active individuals"
+        )
         if len(active_individuals) == 0:
-            logging.warning(">w no active individuals this step ,this may be due to low activation probabilities -> consider adjusting them.")
+            logging.warning(
+                ">w no active individuals this step ,this may be due to low activation probabilities -> consider adjusting them."
+            )
+            self._stepped = set()
             return
 
-        post_scores: typing.Dict[typing.Tuple[User, Post], float] = self.ranker(
-            individuals=active_individuals, feed=stripped_feed, network=self.network
+        # rankings are written while the agents step if the execution is pipelined
+        logging.debug(
+            f">i stepping through {len(active_individuals)} active individuals"
+        )
+        post_scores, responses = self._rank_and_step_agents(
+            active_individuals,
+            lambda: self.ranker(
+                individuals=active_individuals,
+                feed=stripped_feed,
+                network=self.network,
+                pool=self._pool,
+            ),
+            on_ranked=lambda rankings: self._write_rankings(n, rankings),
         )
-
-        self._rankings_to_json(path = self.output_path / "rankings" / f"step_{n}_ranking.json", rankings=post_scores)
-        
-        # For I/O bound: more workers; for CPU bound: stick to cpu_count
-        logging.debug(f">i stepping through {len(active_individuals)} active individuals")
-        max_workers = min(len(active_individuals), multiprocessing.cpu_count() * 2)
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {
-                executor.submit(self._wrapper_step_agent, post_scores, user, agent): user 
-                for user, agent in active_individuals.items()
-            }
-
-            responses = []
-            for future in as_completed(futures):
-                responses.append(future.result())
 
         # Add timestamp to posts
         posts = [post for _, _, agent_posts in responses for post in agent_posts]
         for post in posts:
             post.timestamp = n
 
-        # Generate embeddings if required
-        if hasattr(self.ranker, "llm") and self.ranker.llm is not None:
-            logging.debug(f">f generating embeddings for {len(posts)} posts")
-            embeddings = self.ranker.llm.extract([post.content for post in posts])
-
-            for post, embedding in zip(posts, embeddings):
-                post.embedding = embedding
-
-        self.feed.extend(posts)
\ No newline at end of file
+        with self._phase("feed_extend"):
+            self.feed.extend(posts)
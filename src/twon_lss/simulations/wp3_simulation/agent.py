@@ -26,14 +26,13 @@ class AgentInstructions(pydantic.BaseModel):
 
 
 class WP3Agent(AgentInterface):
-    
     llm: LLM
     instructions: AgentInstructions
 
     memory_length: int = pydantic.Field(default=4, ge=0, le=50)
     bio: str = pydantic.Field(default="")
     cognition: str = pydantic.Field(default="")
-    
+
     activation_probability: float
     posting_probability: float
     read_amount: int
@@ -41,8 +40,7 @@ class WP3Agent(AgentInterface):
     memory: typing.List[Message] = pydantic.Field(default_factory=list)
     activations: int = 0
     posts: typing.List[Post] = pydantic.Field(default_factory=list)
-    
-    
+
     def select_actions(self, post: Post):
         pass
 
@@ -54,17 +52,18 @@ class WP3Agent(AgentInterface):
             Chat(
                 [
                     Message(role="system", content=self._profile()),
-                    *self.memory[-self.memory_length * 2:],
+                    *self.memory[-self.memory_length * 2 :],
                     Message(role="user", content=prompt),
                 ]
             )
         )
-    
-    
+
     # Actions
     def _profile(self) -> str:
-        return self.instructions.profile_format.format(bio=self.bio, cognition=self.cognition)
-    
+        return self.instructions.profile_format.format(
+            bio=self.bio, cognition=self.cognition
+        )
+
     def cognition_update(self) -> None:
         """
         Currently not used in the simulation, but can be called to update the agent's cognition based on its memory
@@ -73,33 +72,44 @@ class WP3Agent(AgentInterface):
         logging.debug(f"Agent response: {response}")
         self.cognition = response
 
-    def _like(self, post: Post, user: User) -> None:
+    def _like(
+        self, post: Post, user: User, rng: typing.Optional[np.random.Generator] = None
+    ) -> None:
         """
-        Currently a simple probabilistic like function. The likes arent used in the simulation yet.
+        Currently a simple probabilistic like function. The likes arent used in the
+        simulation yet. Draws from `rng` if given (the simulation passes the agent's
+        stream), from `numpy.random` otherwise.
         """
-        if np.random.rand() <= 0.25:
+        if (np.random if rng is None else rng).random() <= 0.25:
             post.likes.add(user)
             return True
         return False
-    
+
     def _read(self, feed_str) -> str:
-        response: str = self._inference(self.instructions.read_prompt.format(feed=feed_str))
+        response: str = self._inference(
+            self.instructions.read_prompt.format(feed=feed_str)
+        )
         logging.debug(f"Agent response: {response}")
 
         self._append_to_memory(self.instructions.feed_placeholder, role="user")
         self._append_to_memory(response)
 
-    def consume_feed(self, posts: list[Post], user:User) -> str:
+    def consume_feed(
+        self,
+        posts: list[Post],
+        user: User,
+        rng: typing.Optional[np.random.Generator] = None,
+    ) -> str:
         feed_str = ""
         for post in posts:
             post.reads.add(user)
-            if self._like(post, user):
-                feed_str += f">{post.user.id}: {post.content}\n"   # (You like this post) 
+            if self._like(post, user, rng):
+                feed_str += f">{post.user.id}: {post.content}\n"  # (You like this post)
             else:
                 feed_str += f">{post.user.id}: {post.content}\n"
         self._read(feed_str)
-        
-    def post(self) -> str:     
+
+    def post(self) -> str:
         prompt = self.instructions.post_prompt
         response: str = self._inference(prompt)
         self._append_to_memory(prompt, role="user")
@@ -2,15 +2,17 @@ from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import statistics
 import logging
 import time
-import random
 import typing
 
+import numpy as np
+
 from twon_lss.interfaces import RankerInterface, RankerArgsInterface
 
-from twon_lss.schemas import User, Post, Feed
+from twon_lss.schemas import User, Post, Feed, Rankings
 from twon_lss.schemas.network import Network
 from twon_lss.simulations.wp3_simulation.agent import WP3Agent
-from twon_lss.utility import LLM
+from twon_lss.utility import LLM, FeedSnapshot, WorkerPool
+from twon_lss.utility.similarity import embedding_matrix, mean_cosine_similarity
 
 from sklearn.metrics.pairwise import cosine_similarity
 
@@ -25,30 +27,92 @@ class RankerArgs(RankerArgsInterface):
 class RandomRanker(RankerInterface):
     args: RankerArgs = RankerArgs()
 
+    supports_snapshot: typing.ClassVar[bool] = True
+
     def __call__(
-        self, individuals: typing.List[User], feed: Feed, network: Network
-        ) -> typing.Dict[typing.Tuple[User, Post], float]:
+        self,
+        individuals: typing.List[User],
+        feed: Feed,
+        network: Network,
+        pool: typing.Optional[WorkerPool] = None,
+    ) -> Rankings:
         # WP3 adapted call version because simulation step passes individuals instead of users at ranker call
         # For this ranker we dont need individuals, so we drop them when passing to extract
-        return super().__call__(list(individuals.keys()), feed, network)
+        return super().__call__(list(individuals.keys()), feed, network, pool)
 
     def _compute_network(self, post: Post) -> float:
         return 0.0
 
-    def _compute_individual(self, agent: WP3Agent, post: Post, feed: Feed) -> float:
-        return random.random()
-    
+    def _compute_individual(self, user: User, post: Post, feed: Feed) -> float:
+        return float(self._generator("individual", user).uniform(0, 1))
+
+    def compute_network_batch(self, posts: typing.Sequence[Post]) -> np.ndarray:
+        return np.zeros(len(posts))
+
+    def compute_individual_batch(
+        self,
+        users: typing.Sequence[User],
+        posts: typing.Sequence[Post],
+        feed: Feed,
+        mask: typing.Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        return self._draw_batch(
+            "individual",
+            users,
+            np.ones((len(users), len(posts)), dtype=bool) if mask is None else mask,
+        )
+
+    def _snapshot_context(self, user: User, feed: Feed) -> str:
+        # the workers draw from the user's stream
+        return user.id
+
+    def _compute_individual_snapshot(
+        self, snapshot: FeedSnapshot, context: str, candidates: np.ndarray
+    ) -> np.ndarray:
+        return self._generator("individual", context).uniform(
+            0, 1, size=len(candidates)
+        )
+
 
 class SemanticSimilarityRanker(RankerInterface):
     llm: LLM
     args: RankerArgs = RankerArgs()
 
+    supports_snapshot: typing.ClassVar[bool] = True
+
     def __call__(
-        self, individuals: typing.List[User], feed: Feed, network: Network
-        ) -> typing.Dict[typing.Tuple[User, Post], float]:
+        self,
+        individuals: typing.List[User],
+        feed: Feed,
+        network: Network,
+        pool: typing.Optional[WorkerPool] = None,
+    ) -> Rankings:
 
         logging.debug(f"{len(feed)=}")
 
+        if self.args.mode == "batched":
+            # individual scores depend on the agents, noise stays disabled as in
+            # _process_user
+            return self._rank_batched(
+                individuals.keys(),
+                feed,
+                network,
+                subjects=individuals.values(),
+                noise=False,
+            )
+
+        if pool is not None:
+            # only the agents' recent post embeddings are shipped, the feed goes through
+            # shared memory
+            return self._rank_pool(
+                individuals.keys(),
+                feed,
+                network,
+                pool,
+                subjects=individuals.values(),
+                noise=False,
+            )
+
         # compute global scores
         global_scores: typing.Dict[str, float] = {}
         for post in feed:
@@ -58,7 +122,10 @@ class SemanticSimilarityRanker(RankerInterface):
         with ProcessPoolExecutor() as executor:
             user_results = executor.map(
                 self._process_user,
-                [(individuals[individual], individual, feed, network, global_scores) for individual in individuals.keys()]
+                [
+                    (individuals[individual], individual, feed, network, global_scores)
+                    for individual in individuals.keys()
+                ],
             )
 
         # create lookup dicts for user.id to user and post.id to post
@@ -68,7 +135,6 @@ class SemanticSimilarityRanker(RankerInterface):
         # merge results
         final_scores = {}
         for user_score_dict in user_results:
-
             # map back to (User, Post) keys
             mapped_dict = {
                 (user_lookup[user_id], post_lookup[post_id]): score
@@ -77,8 +143,7 @@ class SemanticSimilarityRanker(RankerInterface):
 
             final_scores.update(mapped_dict)
 
-        return final_scores
-    
+        return Rankings.from_scores(feed, final_scores)
 
     def _process_user(
         self, args: typing.Tuple[WP3Agent, User, Feed, Network, typing.Dict[str, float]]
@@ -95,19 +160,51 @@ class SemanticSimilarityRanker(RankerInterface):
                 + self.args.weights.network * global_score
             )
 
-            scores[(user.id, post.id)] = combined_score # * self.args.noise() 
+            scores[(user.id, post.id)] = combined_score  # * self.args.noise()
 
         return scores
-    
 
     def _compute_network(self, post: Post) -> float:
         return 0.0
 
     def _compute_individual(self, agent: WP3Agent, post: Post, feed: Feed) -> float:
         try:
-            return(statistics.mean(
-                cosine_similarity([post.embedding], [item.embedding for item in agent.posts[-10:]])[0]
-            ))
+            return statistics.mean(
+                cosine_similarity(
+                    [post.embedding_array],
+                    [item.embedding_array for item in agent.posts[-10:]],
+                )[0]
+            )
         except Exception as e:
             logging.error(f"Failed to compute semantic similarity: {e}")
-            return 0.0
\ No newline at end of file
+            return 0.0
+
+    def compute_network_batch(self, posts: typing.Sequence[Post]) -> np.ndarray:
+        return np.zeros(len(posts))
+
+    def compute_individual_batch(
+        self,
+        agents: typing.Sequence[WP3Agent],
+        posts: typing.Sequence[Post],
+        feed: Feed,
+        mask: typing.Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        # mean cosine similarity to the agent's 10 most recent posts, for all pairs at
+        # once
+        return mean_cosine_similarity(
+            [
+                embedding_matrix([item.embedding_array for item in agent.posts[-10:]])
+                for agent in agents
+            ],
+            embedding_matrix([post.embedding_array for post in posts]),
+        )
+
+    def _snapshot_context(self, agent: WP3Agent, feed: Feed) -> np.ndarray:
+        return embedding_matrix(
+            [item.embedding_array for item in agent.posts[-10:]]
+        ).astype(np.float32)
+
+    def _compute_individual_snapshot(
+        self, snapshot: FeedSnapshot, context: np.ndarray, candidates: np.ndarray
+    ) -> np.ndarray:
+        return mean_cosine_similarity([context], snapshot.embeddings[candidates])[0]
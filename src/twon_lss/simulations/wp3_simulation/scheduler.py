@@ -0,0 +1,145 @@
+import typing
+import heapq
+import logging
+
+import numpy as np
+
+from twon_lss.schemas import User
+from twon_lss.utility import RandomStreams
+
+
+class ActivationScheduler:
+    """
+    Activation steps of agents that activate in every step with their
+    `activation_probability`. The gaps between the activations of such an agent are
+    geometric, so the scheduler samples each agent's next activation step when it
+    activates and keeps the agents in a queue ordered by that step. A step only touches
+    the agents that are due instead of drawing for every agent.
+
+    Agents with an `activation_probability` of 0 never activate, of 1 or more in every
+    step. A probability changed during a run takes effect after the agent's next
+    activation; agents that never activate are idle and pick a raised probability up
+    when they `join` again. With `streams`, the gaps drawn in a step come from the
+    step's activation stream in the order of the agents, otherwise from `numpy.random`.
+
+    A step costs time in the number of agents due, not in the number of agents. Agents
+    added to or removed from the individuals of a run are announced with `join` and
+    `leave`; `due` only rescans the individuals when their number differs from the
+    scheduled agents.
+
+    Attributes:
+        start (int): First step the agents can activate in.
+    """
+
+    def __init__(
+        self,
+        individuals: typing.Mapping[User, typing.Any],
+        start: int = 0,
+        streams: typing.Optional[RandomStreams] = None,
+    ):
+        self.start = start
+        self._streams = streams
+        self._order: typing.Dict[User, int] = {}
+        self._idle: typing.Set[User] = set()
+        self._next = 0
+        self._queue: typing.List[typing.Tuple[int, int, User]] = []
+        self.join(individuals, start)
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def _gaps(self, probabilities: np.ndarray, n: int, purpose: str) -> np.ndarray:
+        """Steps until the next activation per probability, 0 for never."""
+        rng = (
+            np.random
+            if self._streams is None
+            else self._streams.generator(n, None, purpose)
+        )
+        gaps = np.zeros(len(probabilities), dtype=np.int64)
+        active = probabilities > 0
+        gaps[active] = rng.geometric(np.minimum(probabilities[active], 1.0))
+        return gaps
+
+    def join(self, individuals: typing.Mapping[User, typing.Any], n: int) -> None:
+        """
+        Schedules the agents of `individuals` that are new or idle to activate from step
+        `n` on.
+        """
+        users = [
+            user
+            for user in individuals
+            if user not in self._order or user in self._idle
+        ]
+        gaps = self._gaps(
+            np.array(
+                [individuals[user].activation_probability for user in users],
+                dtype=float,
+            ),
+            n,
+            "schedule",
+        )
+
+        for user, gap in zip(users, gaps.tolist(), strict=True):
+            if user not in self._order:
+                self._order[user] = self._next
+                self._next += 1
+            if gap:
+                self._queue.append((n + gap - 1, self._order[user], user))
+                self._idle.discard(user)
+            else:
+                self._idle.add(user)
+        heapq.heapify(self._queue)
+
+    def leave(self, users: typing.Iterable[User]) -> None:
+        """
+        Drops `users` and their scheduled activations; they are scheduled anew if they
+        `join` again.
+        """
+        left = {user for user in users if self._order.pop(user, None) is not None}
+        if left:
+            self._idle -= left
+            self._queue = [entry for entry in self._queue if entry[2] not in left]
+            heapq.heapify(self._queue)
+
+    def due(
+        self, n: int, individuals: typing.Mapping[User, typing.Any]
+    ) -> typing.Dict[User, typing.Any]:
+        """
+        Agents of `individuals` activating in step `n`, in the order of `individuals`,
+        and schedules their next activation. Steps must be requested in increasing
+        order. If the number of `individuals` changed without `join`/`leave`, agents
+        added are scheduled from `n` and agents removed are dropped; an agent replaced
+        by another in the same step needs `leave` and `join`.
+        """
+        if len(self._order) != len(individuals):
+            self.leave([user for user in self._order if user not in individuals])
+            self.join(individuals, n)
+
+        due: typing.List[typing.Tuple[int, User]] = []
+        while self._queue and self._queue[0][0] <= n:
+            _, order, user = heapq.heappop(self._queue)
+            if user in individuals:
+                due.append((order, user))
+            else:
+                # replaced without `leave`
+                del self._order[user]
+
+        due.sort()
+        gaps = self._gaps(
+            np.array(
+                [individuals[user].activation_probability for _, user in due],
+                dtype=float,
+            ),
+            n,
+            "activation",
+        )
+        for (order, user), gap in zip(due, gaps.tolist(), strict=True):
+            if gap:
+                heapq.heappush(self._queue, (n + gap, order, user))
+            else:
+                self._idle.add(user)
+
+        logging.debug(
+            f">f {len(due)} agents activate in step {n}, {len(self._queue)} scheduled"
+        )
+        return {user: individuals[user] for _, user in due}
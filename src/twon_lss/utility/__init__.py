@@ -1,6 +1,40 @@
 from twon_lss.utility.llm import LLM, Message, Chat
+from twon_lss.utility.batcher import EmbeddingBatcher
+from twon_lss.utility.cache import EmbeddingCache, ResponseStore
 from twon_lss.utility.noise import Noise
+from twon_lss.utility.ratelimit import RateLimiter, RetryPolicy
+from twon_lss.utility.pool import WorkerPool, FeedSnapshot
+from twon_lss.utility.rankings import RankingsSink, RankingsReader
 from twon_lss.utility.eval import RunEvaluation
+from twon_lss.utility.writer import BackgroundWriter
+from twon_lss.utility.seeding import RandomStreams
+from twon_lss.utility.metrics import (
+    Instrumentation,
+    StepHook,
+    CProfileHook,
+    TracemallocHook,
+)
 
 
-__all__ = ["LLM", "Message", "Chat", "Noise", "RunEvaluation"]
+__all__ = [
+    "LLM",
+    "BackgroundWriter",
+    "Message",
+    "Chat",
+    "EmbeddingBatcher",
+    "EmbeddingCache",
+    "ResponseStore",
+    "Noise",
+    "RateLimiter",
+    "RetryPolicy",
+    "RankingsSink",
+    "RankingsReader",
+    "RunEvaluation",
+    "WorkerPool",
+    "FeedSnapshot",
+    "Instrumentation",
+    "StepHook",
+    "CProfileHook",
+    "TracemallocHook",
+    "RandomStreams",
+]
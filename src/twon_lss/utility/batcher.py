@@ -0,0 +1,90 @@
+import typing
+import asyncio
+import logging
+
+from twon_lss.utility.llm import LLM, _background_loop
+
+
+class EmbeddingBatcher:
+    """
+    Collects posts from any thread and embeds them in batches of up to `max_batch_size`
+    posts, sent as soon as a batch is full or `max_delay` seconds after its first post
+    arrived. Batches are requested concurrently on the LLM client's event loop (bounded
+    by its concurrency and rate limits) and each embedding is set on its post as its
+    batch returns.
+
+    Attributes:
+        llm (LLM): Client of the feature extraction endpoint.
+        max_batch_size (int): Posts per request.
+        max_delay (float): Seconds a partial batch waits for more posts.
+    """
+
+    def __init__(self, llm: LLM, max_batch_size: int = 100, max_delay: float = 0.05):
+        self.llm = llm
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+
+        # only touched on the event loop
+        self._loop = _background_loop()
+        self._pending: typing.List[typing.Any] = []
+        self._timer: typing.Optional[asyncio.TimerHandle] = None
+        self._tasks: typing.Set[asyncio.Task] = set()
+        self._errors: typing.List[BaseException] = []
+
+    def __enter__(self) -> "EmbeddingBatcher":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.join()
+
+    def submit(self, posts: typing.Iterable[typing.Any]) -> None:
+        posts = list(posts)
+        if posts:
+            self._loop.call_soon_threadsafe(self._add, posts)
+
+    def join(self) -> None:
+        """
+        Sends the partial batch and waits until every submitted post has its embedding.
+        """
+        asyncio.run_coroutine_threadsafe(self._drain(), self._loop).result()
+        if self._errors:
+            errors, self._errors = self._errors, []
+            raise errors[0]
+
+    def _add(self, posts: typing.List[typing.Any]) -> None:
+        self._pending.extend(posts)
+        while len(self._pending) >= self.max_batch_size:
+            self._send(self._pending[: self.max_batch_size])
+            self._pending = self._pending[self.max_batch_size :]
+
+        if self._pending and self._timer is None:
+            self._timer = self._loop.call_later(self.max_delay, self._flush)
+
+    def _flush(self) -> None:
+        self._timer = None
+        if self._pending:
+            self._send(self._pending)
+            self._pending = []
+
+    def _send(self, batch: typing.List[typing.Any]) -> None:
+        task = self._loop.create_task(self._embed(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _embed(self, batch: typing.List[typing.Any]) -> None:
+        try:
+            embeddings = await self.llm.aextract([post.content for post in batch])
+        except Exception as e:
+            self._errors.append(e)
+            return
+
+        logging.debug(f">f embedded batch of {len(batch)} posts")
+        for post, embedding in zip(batch, embeddings, strict=True):
+            post.embedding = embedding
+
+    async def _drain(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._flush()
+        while self._tasks:
+            await asyncio.gather(*self._tasks)
@@ -0,0 +1,225 @@
+import typing
+import hashlib
+import pathlib
+import json
+import os
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, files are only locked between the threads of a process
+    fcntl = None
+
+
+DIGEST_SIZE = 32
+
+
+def _lock_file(f: typing.IO) -> None:
+    """
+    Locks the open file `f` against other processes until it is closed, where the
+    platform supports it.
+    """
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX)
+
+
+def content_digest(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    Persistent, content addressed embedding store for one (model, url) pair. Embeddings
+    are appended to a float32 file that is read through a memory map; a parallel file
+    holds the sha256 digest of each embedded text. Several processes may share a cache
+    directory, appends are serialized with a file lock and each process picks up the
+    entries of the others on its next miss. Without `fcntl` (Windows), only the threads
+    of one process may share it.
+
+    Attributes:
+        path (pathlib.Path): Directory of this (model, url) pair inside the cache root.
+        dim (Optional[int]): Embedding dimension, known after the first embedding was
+            stored.
+    """
+
+    def __init__(self, root: typing.Union[str, pathlib.Path], model: str, url: str):
+        namespace = hashlib.sha256(f"{model}\n{url}".encode("utf-8")).hexdigest()[:16]
+        self.path = pathlib.Path(root) / namespace
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        self._meta = self.path / "meta.json"
+        self._keys = self.path / "keys.bin"
+        self._vectors = self.path / "vectors.f32"
+        if not self._meta.exists():
+            self._meta.write_text(json.dumps({"model": model, "url": url}))
+
+        self.dim: typing.Optional[int] = json.loads(self._meta.read_text()).get("dim")
+        self._index: typing.Dict[bytes, int] = {}
+        self._matrix = np.zeros((0, self.dim or 0), dtype=np.float32)
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, text: str) -> bool:
+        return content_digest(text) in self._index
+
+    def refresh(self) -> None:
+        """Loads entries appended since the last refresh, also by other processes."""
+        if self.dim is None:
+            self.dim = json.loads(self._meta.read_text()).get("dim")
+        if self.dim is None or not self._keys.exists():
+            return
+
+        # a row counts once both its vector and its key are complete
+        rows = min(
+            self._keys.stat().st_size // DIGEST_SIZE,
+            self._vectors.stat().st_size // (4 * self.dim),
+        )
+        if rows <= len(self._index):
+            return
+
+        with open(self._keys, "rb") as f:
+            f.seek(len(self._index) * DIGEST_SIZE)
+            keys = f.read((rows - len(self._index)) * DIGEST_SIZE)
+        for offset in range(0, len(keys), DIGEST_SIZE):
+            self._index.setdefault(
+                keys[offset : offset + DIGEST_SIZE], len(self._index)
+            )
+
+        self._matrix = np.memmap(
+            self._vectors, dtype=np.float32, mode="r", shape=(rows, self.dim)
+        )
+
+    def get(
+        self, texts: typing.Sequence[str]
+    ) -> typing.List[typing.Optional[np.ndarray]]:
+        """Cached embeddings of `texts`, None for misses."""
+        with self._lock:
+            digests = [content_digest(text) for text in texts]
+            if any(digest not in self._index for digest in digests):
+                self.refresh()
+            return [
+                np.array(self._matrix[self._index[digest]])
+                if digest in self._index
+                else None
+                for digest in digests
+            ]
+
+    def put(
+        self,
+        texts: typing.Sequence[str],
+        embeddings: typing.Sequence[typing.Sequence[float]],
+    ) -> None:
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2 or len(matrix) != len(texts):
+            raise ValueError(
+                f"expected one embedding vector per text, got shape {matrix.shape}"
+            )
+
+        with self._lock, open(self.path / "lock", "w") as lock:
+            _lock_file(lock)
+            self.refresh()
+
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                self._meta.write_text(
+                    json.dumps({**json.loads(self._meta.read_text()), "dim": self.dim})
+                )
+            if matrix.shape[1] != self.dim:
+                raise ValueError(
+                    f"embedding dimension {matrix.shape[1]} does not match cache dimension {self.dim}"
+                )
+
+            new = {}
+            for text, vector in zip(texts, matrix, strict=True):
+                digest = content_digest(text)
+                if digest not in self._index:
+                    new[digest] = vector
+            if not new:
+                return
+
+            # vectors first, a key without its vector would point past the end of the
+            # file
+            with open(self._vectors, "ab") as f:
+                f.write(np.stack(list(new.values())).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._keys, "ab") as f:
+                f.write(b"".join(new.keys()))
+
+            self.refresh()
+
+
+class ResponseStore:
+    """
+    Recorded LLM responses in an append-only JSON lines file. Responses are keyed by the
+    model and the full request payload (chat and sampling parameters); a key requested
+    repeatedly keeps one response per occurrence, so a replay returns the same sequence
+    of responses as the recorded run.
+
+    Attributes:
+        path (pathlib.Path): The JSON lines file.
+    """
+
+    def __init__(self, path: typing.Union[str, pathlib.Path]):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._responses: typing.Dict[str, typing.List[typing.Any]] = {}
+        self._occurrences: typing.Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        if self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    # a line cut off by an interrupted run is dropped
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._responses.setdefault(record["key"], []).append(
+                        record["response"]
+                    )
+
+    def __len__(self) -> int:
+        return sum(len(responses) for responses in self._responses.values())
+
+    @staticmethod
+    def key(model: str, payload: dict) -> str:
+        return hashlib.sha256(
+            json.dumps([model, payload], sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def occurrence(self, key: str) -> int:
+        """Counts a request of `key` and returns how often it was requested before."""
+        with self._lock:
+            occurrence = self._occurrences.get(key, 0)
+            self._occurrences[key] = occurrence + 1
+            return occurrence
+
+    def get(self, key: str, occurrence: int, cycle: bool = False) -> typing.Any:
+        """
+        The response recorded for the `occurrence`th request of `key`. With `cycle`,
+        requests beyond the recorded ones wrap around to the first responses. Raises
+        KeyError if there is no such response.
+        """
+        responses = self._responses.get(key, [])
+        if cycle and responses:
+            occurrence %= len(responses)
+        if occurrence >= len(responses):
+            raise KeyError(
+                f"no recorded response for occurrence {occurrence} of request {key}"
+            )
+        return responses[occurrence]
+
+    def add(self, key: str, response: typing.Any) -> None:
+        line = json.dumps({"key": key, "response": response}) + "\n"
+        with self._lock, open(self.path, "a") as f:
+            _lock_file(f)
+            f.write(line)
+            self._responses.setdefault(key, []).append(response)
@@ -1,10 +1,23 @@
 import logging
-import requests
 import typing
+import asyncio
+import threading
 import time
+import weakref
+import os
+import pathlib
 
+import httpx
 import pydantic
 
+from twon_lss.utility.cache import EmbeddingCache, ResponseStore
+from twon_lss.utility.ratelimit import (
+    RateLimiter,
+    RateLimitMetrics,
+    RetryPolicy,
+    parse_retry_after,
+)
+
 
 class Message(pydantic.BaseModel):
     role: typing.Literal["system", "user", "assistant"]
@@ -15,74 +28,344 @@ class Chat(pydantic.RootModel):
     root: typing.List[Message]
 
 
+# event loop running the requests of the synchronous API, shared by all clients of the
+# process
+_LOOP: typing.Optional[asyncio.AbstractEventLoop] = None
+_LOOP_LOCK = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None or _LOOP.is_closed():
+            _LOOP = asyncio.new_event_loop()
+            threading.Thread(
+                target=_LOOP.run_forever, name="llm-client", daemon=True
+            ).start()
+    return _LOOP
+
+
+def _reset_loop() -> None:
+    # the loop thread does not survive a fork
+    global _LOOP
+    _LOOP = None
+
+
+os.register_at_fork(after_in_child=_reset_loop)
+
+# httpx logs every request at INFO level
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def _usage_tokens(body: typing.Any) -> int:
+    # tokens reported by chat completion (`usage`) and RunPod (`output[].usage`)
+    # responses
+    usages = []
+    if isinstance(body, dict):
+        usages.append(body.get("usage"))
+        if isinstance(body.get("output"), list):
+            usages.extend(
+                item.get("usage") for item in body["output"] if isinstance(item, dict)
+            )
+
+    tokens = 0
+    for usage in usages:
+        if not isinstance(usage, dict):
+            continue
+        if isinstance(usage.get("total_tokens"), int):
+            tokens += usage["total_tokens"]
+        else:
+            tokens += sum(
+                usage[name]
+                for name in ("prompt_tokens", "completion_tokens", "input", "output")
+                if isinstance(usage.get(name), int)
+            )
+    return tokens
+
+
+def _transient(error: Exception) -> bool:
+    # timeouts, connection errors, throttling and server errors can pass, other errors
+    # repeat on every retry
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
 class LLM(pydantic.BaseModel):
+    """
+    Client for chat completion and feature extraction endpoints. Requests go through one
+    pooled keep-alive connection per event loop, with at most `max_concurrency` requests
+    in flight. `agenerate`/`aextract` are the async API; `generate`/`extract` run the
+    same coroutines on a background event loop, so any number of threads can share the
+    client and its connection pool.
+
+    All clients of an endpoint share a `RateLimiter` that admits requests at an adaptive
+    rate. Failed requests are retried after the server's `Retry-After` or a jittered
+    backoff, waiting in the event loop instead of a thread.
+
+    With a `cache_dir`, embeddings are kept in an on-disk `EmbeddingCache` and `extract`
+    only requests texts that were not embedded before by this model and url.
+
+    With a `response_store`, generated responses are recorded to a local file.
+    `response_mode` decides how it is used: "record" queries the endpoint and records
+    every response, "replay" serves recorded responses only (cycling through them once a
+    request was made more often than recorded) and never touches the network, "cached"
+    replays what was recorded and queries and records the rest.
+
+    Attributes:
+        timeout (float): Timeout of a single request in seconds.
+        max_concurrency (int): Maximum number of requests in flight (and pooled
+            connections) per event loop.
+        max_requests_per_second (Optional[float]): Admission rate of the endpoint while
+            it does not throttle, None for no limit. Clients of an endpoint with the
+            same limits share their admission, see `RateLimiter`.
+        retry (RetryPolicy): Backoff between retries.
+        cache_dir (Optional[pathlib.Path]): Root directory of the embedding cache, no
+            caching if None.
+        response_store (Optional[pathlib.Path]): File of recorded responses, no
+            recording if None.
+        response_mode (Literal["record", "replay", "cached"]): Use of the recorded
+            responses.
+    """
+
     api_key: str
 
     model: str = "Qwen/Qwen3-4B-Instruct-2507:nscale"
     url: str = "https://router.huggingface.co/v1/chat/completions"
 
-    def _query(self, payload):
-        headers: dict = {"Authorization": f"Bearer {self.api_key}"}
-        response = requests.post(self.url, headers=headers, json=payload)
-        return response.json()
-    
+    timeout: float = 120.0
+    max_concurrency: int = pydantic.Field(64, gt=0)
+    max_requests_per_second: typing.Optional[float] = pydantic.Field(None, gt=0)
+    retry: RetryPolicy = pydantic.Field(default_factory=RetryPolicy)
+    cache_dir: typing.Optional[pathlib.Path] = None
+    response_store: typing.Optional[pathlib.Path] = None
+    response_mode: typing.Literal["record", "replay", "cached"] = "record"
 
-    def generate(self, chat: Chat, max_retries: int = 3) -> str:
+    # connection pool and in-flight limit per event loop, created on first use
+    _clients: typing.Optional[weakref.WeakKeyDictionary] = pydantic.PrivateAttr(
+        default=None
+    )
+    _cache: typing.Optional[EmbeddingCache] = pydantic.PrivateAttr(default=None)
+    _responses: typing.Optional[ResponseStore] = pydantic.PrivateAttr(default=None)
+
+    def __getstate__(self) -> typing.Dict[str, typing.Any]:
+        # connections are bound to this process, copies open their own
+        state = super().__getstate__()
+        state["__pydantic_private__"] = {
+            **state["__pydantic_private__"],
+            "_clients": None,
+            "_cache": None,
+            "_responses": None,
+        }
+        return state
+
+    @property
+    def limiter(self) -> RateLimiter:
+        return RateLimiter.shared(
+            self.url, self.max_requests_per_second, self.max_concurrency
+        )
+
+    @property
+    def metrics(self) -> RateLimitMetrics:
+        """Request, throttling and retry counts of the endpoint, over all clients."""
+        return self.limiter.metrics
+
+    @property
+    def cache(self) -> typing.Optional[EmbeddingCache]:
+        if self.cache_dir is not None and self._cache is None:
+            self._cache = EmbeddingCache(self.cache_dir, self.model, self.url)
+        return self._cache
+
+    @property
+    def responses(self) -> typing.Optional[ResponseStore]:
+        if self.response_store is not None and self._responses is None:
+            self._responses = ResponseStore(self.response_store)
+        return self._responses
+
+    def _client(self) -> typing.Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        loop = asyncio.get_running_loop()
+        if self._clients is None:
+            self._clients = weakref.WeakKeyDictionary()
+        if loop not in self._clients:
+            self._clients[loop] = (
+                httpx.AsyncClient(
+                    headers={"Authorization": f"Bearer {self.api_key}"},
+                    timeout=self.timeout,
+                    limits=httpx.Limits(
+                        max_connections=self.max_concurrency,
+                        max_keepalive_connections=self.max_concurrency,
+                    ),
+                ),
+                asyncio.Semaphore(self.max_concurrency),
+            )
+        return self._clients[loop]
+
+    def _run(self, coroutine: typing.Awaitable) -> typing.Any:
+        return asyncio.run_coroutine_threadsafe(coroutine, _background_loop()).result()
+
+    async def aclose(self) -> None:
+        """Closes the connection pool of the running event loop."""
+        client = (self._clients or {}).pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client[0].aclose()
+
+    async def _aquery(self, payload: dict) -> typing.Any:
+        limiter = self.limiter
+        await limiter.acquire()
+
+        client, semaphore = self._client()
+        async with semaphore:
+            start = time.monotonic()
+            response = await client.post(self.url, json=payload)
+            latency = time.monotonic() - start
+
+        if response.status_code in (429, 503):
+            limiter.throttled()
+        response.raise_for_status()
+        body = response.json()
+        limiter.completed(latency, _usage_tokens(body))
+        return body
+
+    def _query(self, payload: dict) -> typing.Any:
+        return self._run(self._aquery(payload))
+
+    async def _arequest(
+        self,
+        payload: dict,
+        parse: typing.Callable[[typing.Any], typing.Any],
+        max_retries: int,
+        record: bool = False,
+    ) -> typing.Any:
+        """
+        Queries `payload` and returns the `parse`d response, retrying timeouts,
+        connection errors, throttling and server errors up to `max_retries` times. Other
+        errors, such as client errors or responses that fail to parse, are raised at
+        once. With `record`, the response goes through the `response_store`, see
+        `response_mode`.
+        """
+        store = self.responses if record else None
+        if store is not None:
+            key = ResponseStore.key(self.model, payload)
+            occurrence = store.occurrence(key)
+
+            if self.response_mode != "record":
+                try:
+                    return parse(
+                        store.get(key, occurrence, cycle=self.response_mode == "replay")
+                    )
+                except KeyError:
+                    if self.response_mode == "replay":
+                        raise
+                    logging.debug(f">f no recorded response for {key}, querying")
+
+        limiter = self.limiter
+
+        for attempt in range(max_retries + 1):
+            try:
+                response = await self._aquery(payload)
+                result = parse(response)
+                limiter.succeeded()
+                if store is not None:
+                    store.add(key, response)
+                return result
+
+            except Exception as e:
+                logging.error(f"Failed to query LLM: {e}")
+                if attempt == max_retries or not _transient(e):
+                    limiter.failed()
+                    raise
+
+                retry_after = (
+                    parse_retry_after(e.response.headers.get("Retry-After"))
+                    if isinstance(e, httpx.HTTPStatusError)
+                    else None
+                )
+                await limiter.backoff(self.retry.delay(attempt, retry_after))
+
+    async def agenerate(self, chat: Chat, max_retries: int = 3) -> str:
         try:
-            response: str = self._query(
+            return await self._arequest(
                 {
                     "messages": chat.model_dump(),
                     "model": self.model,
-                }
-            )["choices"][0]["message"]["content"]
-        
+                },
+                lambda response: response["choices"][0]["message"]["content"],
+                max_retries,
+                record=True,
+            )
         except Exception as e:
-            logging.error(f"Failed to query LLM: {e}")
-            if max_retries > 0:
-                time.sleep(60)
-                return self.generate(chat, max_retries - 1)
-            raise RuntimeError("Failed to generate response from LLM after retries") from e
-        
-        return response
-
-    def extract(self, text: typing.Optional[typing.Union[str, list]], max_retries: int = 3):
+            raise RuntimeError(
+                "Failed to generate response from LLM after retries"
+            ) from e
+
+    def generate(self, chat: Chat, max_retries: int = 3) -> str:
+        return self._run(self.agenerate(chat, max_retries))
+
+    async def _aextract_chunk(
+        self, inputs: typing.Union[str, list], max_retries: int
+    ) -> typing.Any:
+        try:
+            return await self._arequest(
+                {"inputs": inputs}, lambda response: response, max_retries
+            )
+        except Exception as e:
+            raise RuntimeError("Failed to extract embeddings after retries") from e
+
+    async def aextract(
+        self, text: typing.Optional[typing.Union[str, list]], max_retries: int = 3
+    ):
         """
-        Returns embeddings for either text or list of texts.
+        Returns embeddings for either text or list of texts. Long lists are sent as
+        concurrent chunks, texts found in the embedding cache are not sent at all.
         """
 
         if self.url == "https://router.huggingface.co/v1/chat/completions":
-            raise ValueError("Extract endpoint not supported for chat completions API. Use HF-Inference URL that includs endpoint and model for extract")
-        
+            raise ValueError(
+                "Extract endpoint not supported for chat completions API. Use HF-Inference URL that includs endpoint and model for extract"
+            )
 
-        if len(text) < 100:
-            try:
-                return self._query({
-                    "inputs": text,
-                })
-            except Exception as e:
-                logging.error(f"Failed to extract embeddings: {e}")
-                if max_retries > 0:
-                    time.sleep(5)
-                    return self.extract(text, max_retries - 1)
-                raise RuntimeError("Failed to extract embeddings after retries") from e
-            
-        else:
-            # Chunking for long texts
-            CHUNK_SIZE = 100
-            chunks = [text[i:i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)]
-            embeddings = []
-            for chunk in chunks:
-                try:
-                    emb_chunk = self._query({
-                        "inputs": chunk,
-                    })
-                    embeddings.extend(emb_chunk)
-                except Exception as e:
-                    logging.error(f"Failed to extract embeddings for chunk: {e}")
-                    if max_retries > 0:
-                        time.sleep(5)
-                        emb_chunk = self.extract(chunk, max_retries - 1)
-                        embeddings.extend(emb_chunk)
-                    else:
-                        raise RuntimeError("Failed to extract embeddings after retries") from e
-            return embeddings
+        if self.cache is not None:
+            return await self._aextract_cached(text, max_retries)
+        return await self._aextract_uncached(text, max_retries)
+
+    async def _aextract_cached(self, text: typing.Union[str, list], max_retries: int):
+        texts = [text] if isinstance(text, str) else list(text)
+        embeddings = self.cache.get(texts)
+
+        misses = list(
+            dict.fromkeys(
+                t
+                for t, embedding in zip(texts, embeddings, strict=True)
+                if embedding is None
+            )
+        )
+        logging.debug(
+            f">f embedding cache: {len(texts) - len(misses)} hits, {len(misses)} misses"
+        )
+        if misses:
+            fetched = await self._aextract_uncached(misses, max_retries)
+            self.cache.put(misses, fetched)
+            embeddings = self.cache.get(texts)
+
+        embeddings = [embedding.tolist() for embedding in embeddings]
+        return embeddings[0] if isinstance(text, str) else embeddings
+
+    async def _aextract_uncached(self, text: typing.Union[str, list], max_retries: int):
+        if isinstance(text, str) or len(text) < 100:
+            return await self._aextract_chunk(text, max_retries)
+
+        # Chunking for long texts
+        CHUNK_SIZE = 100
+        chunks = [text[i : i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)]
+        results = await asyncio.gather(
+            *(self._aextract_chunk(chunk, max_retries) for chunk in chunks)
+        )
+        return [embedding for emb_chunk in results for embedding in emb_chunk]
+
+    def extract(
+        self, text: typing.Optional[typing.Union[str, list]], max_retries: int = 3
+    ):
+        """
+        Returns embeddings for either text or list of texts.
+        """
+        return self._run(self.aextract(text, max_retries))
@@ -0,0 +1,253 @@
+import typing
+import pathlib
+import threading
+import contextlib
+import cProfile
+import tracemalloc
+import time
+
+import numpy as np
+
+from twon_lss.utility.ratelimit import RateLimiter
+
+
+class StepHook:
+    """
+    Runs around the steps of a simulation run, see `Instrumentation`. `stop` may return
+    a dict that is merged into the metrics of the step.
+    """
+
+    def start(self, n: int) -> None:
+        pass
+
+    def stop(self, n: int) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        return None
+
+
+class CProfileHook(StepHook):
+    """
+    Profiles the selected steps with cProfile and writes `step_{n}.prof` (see `pstats`)
+    to `path`. Only the thread that runs the step loop is profiled, agents and worker
+    processes are not.
+
+    Attributes:
+        path (pathlib.Path): Directory of the profiles.
+        steps (Set[int]): Steps to profile.
+    """
+
+    def __init__(
+        self, path: typing.Union[str, pathlib.Path], steps: typing.Iterable[int]
+    ):
+        self.path = pathlib.Path(path)
+        self.steps = set(steps)
+        self._profile: typing.Optional[cProfile.Profile] = None
+
+    def start(self, n: int) -> None:
+        if n in self.steps:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self, n: int) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        if self._profile is None:
+            return None
+
+        self._profile.disable()
+        self.path.mkdir(parents=True, exist_ok=True)
+        path = self.path / f"step_{n}.prof"
+        self._profile.dump_stats(path)
+        self._profile = None
+        return {"profile": str(path)}
+
+
+class TracemallocHook(StepHook):
+    """
+    Traces allocations during the selected steps and reports current and peak traced
+    memory and the `top` allocating source lines. Tracing slows the step down
+    considerably.
+
+    Attributes:
+        steps (Set[int]): Steps to trace.
+        top (int): Number of source lines reported.
+    """
+
+    def __init__(self, steps: typing.Iterable[int], top: int = 10):
+        self.steps = set(steps)
+        self.top = top
+        self._started = False
+
+    def start(self, n: int) -> None:
+        if n not in self.steps:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started = True
+        tracemalloc.reset_peak()
+
+    def stop(self, n: int) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        if n not in self.steps or not tracemalloc.is_tracing():
+            return None
+
+        current, peak = tracemalloc.get_traced_memory()
+        stats = tracemalloc.take_snapshot().statistics("lineno")[: self.top]
+        if self._started:
+            tracemalloc.stop()
+            self._started = False
+
+        return {
+            "memory": {
+                "current": current,
+                "peak": peak,
+                "top": [
+                    {
+                        "line": str(stat.traceback[0]),
+                        "size": stat.size,
+                        "count": stat.count,
+                    }
+                    for stat in stats
+                ],
+            }
+        }
+
+
+def _summary(
+    values: typing.Sequence[float], percentiles: typing.Sequence[int]
+) -> typing.Dict[str, float]:
+    if not len(values):
+        return {"count": 0}
+    values = np.asarray(values, dtype=float)
+    return {
+        "count": len(values),
+        "mean": float(values.mean()),
+        **{
+            f"p{q}": float(value)
+            for q, value in zip(
+                percentiles, np.percentile(values, percentiles), strict=True
+            )
+        },
+        "max": float(values.max()),
+    }
+
+
+class Instrumentation:
+    """
+    Collects the metrics of every simulation step: wall seconds per phase, durations of
+    repeated operations (e.g. the step of each agent) as percentiles, counters, and the
+    requests of the LLM endpoints behind `limiters` (calls, retries, throttled and
+    failed requests, tokens and latency percentiles). `end` returns them as one
+    JSON-serializable record per step.
+
+    Phases and durations may be recorded from any thread. Requests are attributed to the
+    step that is running when they complete; the counts of an endpoint include other
+    clients of it in the same process.
+
+    Attributes:
+        limiters (List[RateLimiter]): Endpoints whose requests are recorded.
+        hooks (List[StepHook]): Hooks started before and stopped after every step.
+    """
+
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(
+        self,
+        limiters: typing.Iterable[RateLimiter] = (),
+        hooks: typing.Iterable[StepHook] = (),
+    ):
+        self.limiters = list({id(limiter): limiter for limiter in limiters}.values())
+        self.hooks = list(hooks)
+
+        self._lock = threading.Lock()
+        self._step: typing.Optional[int] = None
+        self._start = 0.0
+        self._phases: typing.Dict[str, float] = {}
+        self._durations: typing.Dict[str, typing.List[float]] = {}
+        self._counts: typing.Dict[str, int] = {}
+        self._latencies: typing.List[float] = []
+        self._requests: typing.Dict[int, typing.Dict[str, typing.Any]] = {}
+
+        for limiter in self.limiters:
+            limiter.watch(self._on_request)
+
+    def __enter__(self) -> "Instrumentation":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for limiter in self.limiters:
+            limiter.unwatch(self._on_request)
+        self.limiters = []
+
+    def begin(self, n: int) -> None:
+        with self._lock:
+            self._step = n
+            self._phases, self._durations, self._counts, self._latencies = (
+                {},
+                {},
+                {},
+                [],
+            )
+            self._requests = {
+                id(limiter): limiter.metrics.model_dump() for limiter in self.limiters
+            }
+
+        for hook in self.hooks:
+            hook.start(n)
+        self._start = time.perf_counter()
+
+    def end(self, **counts: int) -> typing.Dict[str, typing.Any]:
+        """The record of the running step, with `counts` added to its counters."""
+        seconds = time.perf_counter() - self._start
+        extra: typing.Dict[str, typing.Any] = {}
+        for hook in self.hooks:
+            extra.update(hook.stop(self._step) or {})
+
+        with self._lock:
+            llm = {"calls": 0, "retries": 0, "throttled": 0, "failures": 0, "tokens": 0}
+            for limiter in self.limiters:
+                before, after = self._requests[id(limiter)], limiter.metrics
+                llm["calls"] += after.requests - before["requests"]
+                llm["retries"] += after.retries - before["retries"]
+                llm["throttled"] += after.throttled - before["throttled"]
+                llm["failures"] += after.failures - before["failures"]
+                llm["tokens"] += after.tokens - before["tokens"]
+            llm["latency"] = _summary(self._latencies, self.PERCENTILES)
+
+            record = {
+                "step": self._step,
+                "seconds": seconds,
+                "phases": dict(self._phases),
+                "durations": {
+                    name: _summary(values, self.PERCENTILES)
+                    for name, values in self._durations.items()
+                },
+                "counts": {**self._counts, **counts},
+                "llm": llm,
+                **extra,
+            }
+            self._step = None
+        return record
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> typing.Iterator[None]:
+        """Adds the wall seconds of the block to phase `name` of the running step."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._phases[name] = self._phases.get(name, 0.0) + elapsed
+
+    def duration(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._durations.setdefault(name, []).append(seconds)
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + value
+
+    def _on_request(self, latency: float, tokens: int) -> None:
+        with self._lock:
+            if self._step is not None:
+                self._latencies.append(latency)
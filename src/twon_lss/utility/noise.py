@@ -3,11 +3,17 @@ import typing
 
 import pydantic
 
+import numpy as np
+
 
 class Noise(pydantic.BaseModel):
     """
-    The `Noise` class generates random floating point numbers from a uniform distribution for multiplicative noise with the following attributes.
-    The neutral value (no noise) is achieved when `low = high = 1.0`. The class provides methods to generate single random numbers or multiple samples.
+    The `Noise` class generates random floating point numbers from a uniform
+    distribution for multiplicative noise with the following attributes. The neutral
+    value (no noise) is achieved when `low = high = 1.0`. The class provides methods to
+    generate single random numbers, multiple samples or whole arrays, drawn from `rng`
+    (e.g. a stream of `RandomStreams`) if given and from the global generators
+    otherwise.
 
     Attributes:
         low (float): Lower boundary for the random number generation (default: 0.8).
@@ -17,8 +23,21 @@ class Noise(pydantic.BaseModel):
     low: float = 0.8
     high: float = 1.2
 
-    def __call__(self) -> float:
-        return random.uniform(self.low, self.high)
+    def __call__(self, rng: typing.Optional[np.random.Generator] = None) -> float:
+        if rng is None:
+            return random.uniform(self.low, self.high)
+        return float(rng.uniform(self.low, self.high))
+
+    def draw_samples(
+        self, n: int, rng: typing.Optional[np.random.Generator] = None
+    ) -> typing.List[float]:
+        return [self(rng) for _ in range(n)]
 
-    def draw_samples(self, n: int) -> typing.List[float]:
-        return [self() for _ in range(n)]
+    def draw_array(
+        self,
+        shape: typing.Union[int, typing.Tuple[int, ...]],
+        rng: typing.Optional[typing.Any] = None,
+    ) -> np.ndarray:
+        return (np.random if rng is None else rng).uniform(
+            self.low, self.high, size=shape
+        )
@@ -0,0 +1,195 @@
+import typing
+import logging
+import random
+import os
+
+from concurrent.futures import ProcessPoolExecutor, Future
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from twon_lss.utility.similarity import embedding_matrix
+
+
+class FeedSnapshot:
+    """
+    Read-only columnar copy of a feed placed in shared memory, so worker processes can
+    attach to it by name instead of unpickling the feed. The snapshot holds post ids,
+    author indices, timestamps and float32 embeddings, plus any extra per-post columns
+    (e.g. network scores).
+
+    Attributes:
+        handle (dict): Picklable description (shared memory name, shape, dtype) of each
+            column, used by `FeedSnapshot.attach`.
+    """
+
+    def __init__(
+        self,
+        arrays: typing.Dict[str, np.ndarray],
+        blocks: typing.Dict[str, shared_memory.SharedMemory],
+    ):
+        self._arrays = arrays
+        self._blocks = blocks
+
+    @classmethod
+    def publish(
+        cls,
+        posts: typing.Sequence[typing.Any],
+        authors: typing.Dict[typing.Any, int],
+        **columns: np.ndarray,
+    ) -> "FeedSnapshot":
+        arrays = {
+            "ids": np.array([post.id for post in posts], dtype="S"),
+            "authors": np.array(
+                [authors.get(post.user, -1) for post in posts], dtype=np.int32
+            ),
+            "timestamps": np.array([post.timestamp for post in posts], dtype=np.int32),
+            "embeddings": embedding_matrix(
+                [post.embedding_array for post in posts]
+            ).astype(np.float32),
+            **{name: np.asarray(column) for name, column in columns.items()},
+        }
+
+        blocks = {}
+        shared = {}
+        for name, array in arrays.items():
+            blocks[name] = shared_memory.SharedMemory(
+                create=True, size=max(array.nbytes, 1)
+            )
+            shared[name] = np.ndarray(
+                array.shape, dtype=array.dtype, buffer=blocks[name].buf
+            )
+            shared[name][...] = array
+            shared[name].flags.writeable = False
+
+        return cls(shared, blocks)
+
+    @classmethod
+    def attach(
+        cls, handle: typing.Dict[str, typing.Tuple[str, tuple, str]]
+    ) -> "FeedSnapshot":
+        arrays = {}
+        blocks = {}
+        for name, (block_name, shape, dtype) in handle.items():
+            blocks[name] = shared_memory.SharedMemory(name=block_name)
+            arrays[name] = np.ndarray(shape, dtype=dtype, buffer=blocks[name].buf)
+            arrays[name].flags.writeable = False
+
+        return cls(arrays, blocks)
+
+    @property
+    def handle(self) -> typing.Dict[str, typing.Tuple[str, tuple, str]]:
+        return {
+            name: (self._blocks[name].name, array.shape, array.dtype.str)
+            for name, array in self._arrays.items()
+        }
+
+    def __getattr__(self, name: str) -> np.ndarray:
+        try:
+            return self.__dict__["_arrays"][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __len__(self) -> int:
+        return len(self._arrays["ids"])
+
+    def close(self) -> None:
+        self._arrays = {}
+        for block in self._blocks.values():
+            try:
+                block.close()
+            except BufferError:
+                # views on the block are still alive, the mapping is released with them
+                pass
+
+    def unlink(self) -> None:
+        blocks = list(self._blocks.values())
+        self.close()
+        for block in blocks:
+            block.unlink()
+        self._blocks = {}
+
+
+# snapshots attached by the current worker process, keyed by the name of their id block
+_ATTACHED: typing.Dict[str, FeedSnapshot] = {}
+
+
+def _init_worker() -> None:
+    # forked workers inherit the parent's random state, reseed to decorrelate them
+    random.seed()
+    np.random.seed()
+
+
+def attached_snapshot(
+    handle: typing.Dict[str, typing.Tuple[str, tuple, str]],
+) -> FeedSnapshot:
+    """
+    Returns the snapshot described by `handle`, attaching once per worker and releasing
+    snapshots of previous steps.
+    """
+    key = handle["ids"][0]
+
+    if key not in _ATTACHED:
+        for stale in list(_ATTACHED):
+            _ATTACHED.pop(stale).close()
+        _ATTACHED[key] = FeedSnapshot.attach(handle)
+
+    return _ATTACHED[key]
+
+
+class WorkerPool:
+    """
+    Long-lived process pool shared by all steps of a simulation, together with the feed
+    snapshot of the current step. Use as a context manager or call `close` to stop the
+    workers and release the shared memory.
+
+    Attributes:
+        max_workers (int): Number of worker processes (default: CPU count).
+    """
+
+    def __init__(self, max_workers: typing.Optional[int] = None):
+        self.max_workers: int = max_workers or os.cpu_count() or 1
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers, initializer=_init_worker
+        )
+        self._snapshot: typing.Optional[FeedSnapshot] = None
+
+    def __enter__(self) -> "WorkerPool":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def publish(
+        self,
+        posts: typing.Sequence[typing.Any],
+        authors: typing.Dict[typing.Any, int],
+        **columns: np.ndarray,
+    ) -> FeedSnapshot:
+        """
+        Replaces the current snapshot with one of `posts`; the previous snapshot is
+        unlinked.
+        """
+        self._release()
+        self._snapshot = FeedSnapshot.publish(posts, authors, **columns)
+        logging.debug(f">f published snapshot of {len(posts)} posts")
+        return self._snapshot
+
+    def submit(self, fn: typing.Callable, *args) -> Future:
+        return self._executor.submit(fn, *args)
+
+    def map(self, fn: typing.Callable, iterable: typing.Iterable) -> typing.Iterator:
+        return self._executor.map(fn, iterable)
+
+    def chunksize(self, n: int) -> int:
+        # a few tasks per worker balances load without per-item overhead
+        return max(1, -(-n // (self.max_workers * 4)))
+
+    def close(self) -> None:
+        self._executor.shutdown()
+        self._release()
+
+    def _release(self) -> None:
+        if self._snapshot is not None:
+            self._snapshot.unlink()
+            self._snapshot = None
@@ -0,0 +1,127 @@
+import typing
+import pathlib
+import re
+
+import numpy as np
+import pandas as pd
+
+from twon_lss.schemas import Rankings
+from twon_lss.utility.seeding import RandomStreams
+
+
+class RankingsSink:
+    """
+    Writes the rankings of every step as columnar arrays to `step_{n}.npz` in `path`:
+    for every (user, post) pair the user (row of `user_ids`), the post (row of
+    `post_ids`/`positions`, the post's position in the feed) and its float32 score.
+    Users' pairs are stored best first if `top_k` is set.
+
+    Attributes:
+        path (pathlib.Path): Directory of the step files.
+        top_k (Optional[int]): Only keep the `top_k` best posts of each user.
+        sample (Optional[float]): Only keep the rankings of this fraction of the users,
+            drawn anew every step from the step's "rankings" stream of `streams`.
+        streams (RandomStreams): Random streams of the run, new ones from `seed` if not
+            given.
+        compress (bool): Write compressed npz files.
+    """
+
+    def __init__(
+        self,
+        path: typing.Union[str, pathlib.Path],
+        top_k: typing.Optional[int] = None,
+        sample: typing.Optional[float] = None,
+        seed: typing.Optional[int] = None,
+        compress: bool = False,
+        streams: typing.Optional[RandomStreams] = None,
+    ):
+        if sample is not None and not 0.0 < sample <= 1.0:
+            raise ValueError(f"sample must be a fraction in (0, 1], got {sample}")
+
+        self.path = pathlib.Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.top_k = top_k
+        self.sample = sample
+        self.compress = compress
+        self.streams = streams if streams is not None else RandomStreams(seed)
+
+    def columns(self, rankings: Rankings, n: int = 0) -> typing.Dict[str, np.ndarray]:
+        """The arrays stored for `rankings` of step `n`."""
+        users = list(rankings.users())
+        if self.sample is not None and users:
+            rng = self.streams.generator(n, None, "rankings")
+            keep = np.sort(
+                rng.choice(
+                    len(users),
+                    size=max(1, round(self.sample * len(users))),
+                    replace=False,
+                )
+            )
+            users = [users[i] for i in keep.tolist()]
+
+        rows, positions, scores = rankings.columns(users, self.top_k)
+        table, post = np.unique(positions, return_inverse=True)
+
+        return {
+            "user": rows.astype(np.int32),
+            "post": post.astype(np.int32),
+            "score": scores.astype(np.float32),
+            "user_ids": np.array([user.id for user in users], dtype=str),
+            "post_ids": np.array(
+                [rankings.feed[pos].id for pos in table.tolist()], dtype=str
+            ),
+            "positions": table.astype(np.int64),
+        }
+
+    def write(self, n: int, rankings: Rankings) -> pathlib.Path:
+        path = self.path / f"step_{n}.npz"
+        (np.savez_compressed if self.compress else np.savez)(
+            path, **self.columns(rankings, n)
+        )
+        return path
+
+
+class RankingsReader:
+    """
+    Reads the step files of a `RankingsSink` as arrays or data frames.
+
+    Attributes:
+        path (pathlib.Path): Directory of the step files.
+    """
+
+    def __init__(self, path: typing.Union[str, pathlib.Path]):
+        self.path = pathlib.Path(path)
+
+    @property
+    def steps(self) -> typing.List[int]:
+        steps = (
+            re.fullmatch(r"step_(\d+)\.npz", file.name)
+            for file in self.path.glob("step_*.npz")
+        )
+        return sorted(int(match.group(1)) for match in steps if match)
+
+    def __iter__(
+        self,
+    ) -> typing.Iterator[typing.Tuple[int, typing.Dict[str, np.ndarray]]]:
+        for step in self.steps:
+            yield step, self.arrays(step)
+
+    def arrays(self, step: int) -> typing.Dict[str, np.ndarray]:
+        """The stored arrays of `step`, see `RankingsSink`."""
+        with np.load(self.path / f"step_{step}.npz") as data:
+            return {name: data[name] for name in data.files}
+
+    def frame(self, step: int) -> pd.DataFrame:
+        """
+        The rankings of `step` with one row per (user, post) pair: user id, post id,
+        post position and score.
+        """
+        data = self.arrays(step)
+        return pd.DataFrame(
+            {
+                "user": data["user_ids"][data["user"]],
+                "post": data["post_ids"][data["post"]],
+                "position": data["positions"][data["post"]],
+                "score": data["score"],
+            }
+        )
@@ -0,0 +1,189 @@
+import typing
+import asyncio
+import threading
+import logging
+import random
+import time
+import email.utils
+
+import pydantic
+
+
+class RetryPolicy(pydantic.BaseModel):
+    """
+    Exponential backoff with full jitter; a `Retry-After` sent by the server takes
+    precedence. Only transient errors are retried, at most `max_retries` times per
+    request. The default delays let three retries span about as long as the fixed
+    one-minute pauses they replaced on average, so a request outlives short outages of
+    the endpoint.
+
+    Attributes:
+        base_delay (float): Upper bound of the first backoff in seconds, doubled on
+            every retry.
+        max_delay (float): Upper bound of any backoff in seconds.
+    """
+
+    base_delay: float = 30.0
+    max_delay: float = 60.0
+
+    def delay(self, attempt: int, retry_after: typing.Optional[float] = None) -> float:
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+def parse_retry_after(value: typing.Optional[str]) -> typing.Optional[float]:
+    """Seconds to wait from a `Retry-After` header given in seconds or as HTTP date."""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(
+            0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        )
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitMetrics(pydantic.BaseModel):
+    requests: int = 0
+    successes: int = 0
+    throttled: int = 0
+    retries: int = 0
+    failures: int = 0
+    # seconds spent waiting for admission and in backoff, summed over requests
+    admission_wait: float = 0.0
+    backoff_wait: float = 0.0
+    # seconds of completed requests and tokens reported by the responses, summed over
+    # requests
+    latency: float = 0.0
+    tokens: int = 0
+    # admitted requests per second, None without a limit
+    rate: typing.Optional[float] = None
+
+
+class RateLimiter:
+    """
+    Token bucket admission shared by all clients of an endpoint. The refill rate adapts
+    to the endpoint: it is halved whenever the endpoint throttles (429/503) and grows
+    back linearly with every success, up to `max_rate`. Without a `max_rate`, requests
+    are admitted at once and throttling is only counted. Waiting happens in the event
+    loop, so neither admission nor backoff holds a thread or a connection.
+
+    Attributes:
+        max_rate (Optional[float]): Requests per second when the endpoint does not
+            throttle, None for no limit.
+        burst (int): Bucket capacity, requests that may start at once.
+        min_rate (float): Lower bound of the adapted rate.
+    """
+
+    # limiters by endpoint and settings, see `RateLimiter.shared`
+    _SHARED: typing.Dict[
+        typing.Tuple[str, typing.Optional[float], int], "RateLimiter"
+    ] = {}
+    _SHARED_LOCK = threading.Lock()
+
+    def __init__(
+        self, max_rate: typing.Optional[float], burst: int, min_rate: float = 0.1
+    ):
+        self.max_rate = max_rate
+        self.burst = burst
+        self.min_rate = min_rate if max_rate is None else min(min_rate, max_rate)
+
+        self.rate = max_rate
+        self.metrics = RateLimitMetrics(rate=max_rate)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._watchers: typing.List[typing.Callable[[float, int], None]] = []
+
+    @classmethod
+    def shared(
+        cls, endpoint: str, max_rate: typing.Optional[float], burst: int
+    ) -> "RateLimiter":
+        """
+        The limiter of `endpoint` with the given settings, created on first use. Clients
+        of an endpoint with different settings get limiters of their own.
+        """
+        key = (endpoint, max_rate, burst)
+        with cls._SHARED_LOCK:
+            if key not in cls._SHARED:
+                cls._SHARED[key] = cls(max_rate, burst)
+            return cls._SHARED[key]
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        if self.max_rate is None:
+            with self._lock:
+                self.metrics.requests += 1
+            return
+
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    self.metrics.requests += 1
+                    self.metrics.admission_wait += time.monotonic() - start
+                    return
+                wait = (1.0 - self._tokens) / self.rate
+            await asyncio.sleep(wait)
+
+    def watch(self, callback: typing.Callable[[float, int], None]) -> None:
+        """
+        Calls `callback(latency, tokens)` for every completed request, on the thread of
+        the request.
+        """
+        with self._lock:
+            self._watchers.append(callback)
+
+    def unwatch(self, callback: typing.Callable[[float, int], None]) -> None:
+        with self._lock:
+            self._watchers.remove(callback)
+
+    def completed(self, latency: float, tokens: int = 0) -> None:
+        with self._lock:
+            self.metrics.latency += latency
+            self.metrics.tokens += tokens
+            watchers = list(self._watchers)
+        for callback in watchers:
+            callback(latency, tokens)
+
+    def succeeded(self) -> None:
+        with self._lock:
+            self.metrics.successes += 1
+            if self.max_rate is not None:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 100)
+                self.metrics.rate = self.rate
+
+    def throttled(self) -> None:
+        with self._lock:
+            self.metrics.throttled += 1
+            if self.max_rate is not None:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.metrics.rate = self.rate
+                # drop the burst, the endpoint is saturated
+                self._tokens = min(self._tokens, 0.0)
+        if self.max_rate is None:
+            logging.warning(">w endpoint throttled")
+        else:
+            logging.warning(
+                f">w endpoint throttled, request rate lowered to {self.rate:.2f}/s"
+            )
+
+    async def backoff(self, delay: float) -> None:
+        with self._lock:
+            self.metrics.retries += 1
+            self.metrics.backoff_wait += delay
+        await asyncio.sleep(delay)
+
+    def failed(self) -> None:
+        with self._lock:
+            self.metrics.failures += 1
@@ -0,0 +1,659 @@
+import typing
+import pathlib
+import json
+import os
+import threading
+import argparse
+import random
+
+import numpy as np
+import networkx
+import pydantic
+
+from twon_lss.schemas import User, Post, Feed, Network
+from twon_lss.utility.rankings import RankingsReader
+from twon_lss.utility.writer import BackgroundWriter
+
+
+EVENTS = "events.jsonl"
+EMBEDDINGS = "embeddings.f32"
+
+
+def agent_state(agent: pydantic.BaseModel) -> typing.Dict[str, typing.Any]:
+    """
+    JSON state of `agent` without its LLM client. Posts in list fields are replaced by
+    `{"$post": id}` references, their reads and likes are logged as events of their own.
+    """
+    post_fields = {
+        name
+        for name, value in agent
+        if isinstance(value, list) and value and isinstance(value[0], Post)
+    }
+    state = agent.model_dump(mode="json", exclude={"llm", *post_fields})
+    for name in post_fields:
+        state[name] = [{"$post": post.id} for post in getattr(agent, name)]
+    return {name: state[name] for name in type(agent).model_fields if name in state}
+
+
+def _delta(
+    old: typing.Dict[str, typing.Any], new: typing.Dict[str, typing.Any]
+) -> typing.Dict[str, typing.Any]:
+    # lists that only grew are logged by their new items
+    delta: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+    for name, value in new.items():
+        previous = old.get(name)
+        if name in old and value == previous:
+            continue
+        if (
+            isinstance(value, list)
+            and isinstance(previous, list)
+            and value[: len(previous)] == previous
+        ):
+            delta.setdefault("extend", {})[name] = value[len(previous) :]
+        else:
+            delta.setdefault("set", {})[name] = value
+    return delta
+
+
+class RunLog:
+    """
+    Append-only event log of a simulation run, replacing the periodic full JSON dumps.
+    `events.jsonl` holds one compact JSON event per line: the network, users, new posts,
+    read/like changes, agent state deltas and rankings, each step closed by the
+    generator states (`rng`, with the `seed` of the run's `RandomStreams`) and a `step`
+    event. Embeddings of logged posts are appended to `embeddings.f32` and referenced by
+    row. Events after the last `step` event belong to an unfinished step and are ignored
+    by readers.
+
+    Events are collected on the calling thread and written per step; with a `writer`,
+    encoding, writing and fsync happen on its thread.
+
+    `compact` materializes the legacy `network.json`, `feed.json` and `individuals.json`
+    from the log, `load` replays it to resume the run.
+
+    Attributes:
+        path (pathlib.Path): Directory of the log files.
+        writer (Optional[BackgroundWriter]): Writer the output of every step is handed
+            to, None to write in place.
+        fsync (bool): Sync the files to disk after every step.
+        seed (Optional[int]): Root seed of the run's random streams, logged with every
+            step.
+    """
+
+    def __init__(
+        self,
+        path: typing.Union[str, pathlib.Path],
+        writer: typing.Optional[BackgroundWriter] = None,
+        fsync: bool = False,
+        seed: typing.Optional[int] = None,
+    ):
+        self.path = pathlib.Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.writer = writer
+        self.fsync = fsync
+        self.seed = seed
+
+        self._events: typing.Optional[typing.TextIO] = None
+        self._embeddings: typing.Optional[typing.BinaryIO] = None
+        self._embedding_rows = 0
+        self._dim: typing.Optional[int] = None
+
+        # output of the current step, not yet handed to the files
+        self._pending_events: typing.List[typing.Dict[str, typing.Any]] = []
+        self._pending_embeddings: typing.List[bytes] = []
+
+        # what was logged so far: users by id, feed posts by id, last agent states by
+        # user id
+        self._users: typing.Set[str] = set()
+        self._posts: typing.Set[str] = set()
+        self._agents: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+        self._stores: typing.Dict[int, typing.Any] = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "RunLog":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.flush()
+        for f in (self._events, self._embeddings):
+            if f is not None:
+                f.close()
+        self._events = self._embeddings = None
+
+    def begin(
+        self,
+        network: Network,
+        feed: Feed,
+        individuals: typing.Mapping[User, pydantic.BaseModel],
+        step: typing.Optional[int] = None,
+    ) -> None:
+        """
+        Starts a new log with the initial state of the run, replacing an existing one. A
+        run resumed from another log passes the `step` its state is from.
+        """
+        with self._lock:
+            self._events = open(self.path / EVENTS, "w")
+            self._embeddings = open(self.path / EMBEDDINGS, "wb")
+
+            self._write({"type": "network", "data": network.node_link_data()})
+            for user in network.root:
+                self._log_user(user)
+            self._log_posts(feed)
+            self._log_agents(individuals)
+            self._commit(step)
+
+    def resume(self, run: "LoggedRun", feed: Feed) -> None:
+        """
+        Continues the log of `run` (see `load`) in place, dropping the output of an
+        unfinished step. `feed` is the feed restored from `run`.
+        """
+        if run.path.resolve() != self.path.resolve():
+            raise ValueError(f"cannot resume the log in {run.path} in {self.path}")
+
+        with self._lock:
+            with open(self.path / EVENTS, "r+b") as f:
+                f.truncate(run.size)
+            with open(self.path / EMBEDDINGS, "r+b") as f:
+                f.truncate(run.embedding_rows * 4 * (run.dim or 0))
+            self._events = open(self.path / EVENTS, "a")
+            self._embeddings = open(self.path / EMBEDDINGS, "ab")
+
+            self._dim = run.dim
+            self._embedding_rows = run.embedding_rows
+            self._users = set(run.users)
+            self._agents = dict(run.agents)
+            for post in feed.root:
+                self._track(post)
+            self._posts = {post.id for post in feed.root}
+
+    def step(
+        self,
+        n: int,
+        feed: Feed,
+        individuals: typing.Mapping[User, pydantic.BaseModel],
+        stepped: typing.Optional[typing.Collection[User]] = None,
+    ) -> None:
+        """
+        Logs the changes of step `n`: new posts, read/like changes and agent state
+        deltas. Only the agents of the `stepped` users (all if None) and agents new to
+        the log are compared, the others are taken as unchanged.
+        """
+        with self._lock:
+            self._log_posts(feed)
+            self._log_changes()
+            if stepped is not None:
+                individuals = {
+                    user: agent
+                    for user, agent in individuals.items()
+                    if user in stepped or user.id not in self._agents
+                }
+            self._log_agents(individuals)
+            self._commit(n)
+
+    def rankings(
+        self, n: int, rankings: typing.Mapping[typing.Tuple[User, Post], float]
+    ) -> None:
+        """Logs the rankings of step `n`, one event per user."""
+        by_user: typing.Dict[
+            str, typing.Tuple[typing.List[str], typing.List[float]]
+        ] = {}
+        for (user, post), score in rankings.items():
+            posts, scores = by_user.setdefault(user.id, ([], []))
+            posts.append(post.id)
+            scores.append(float(score))
+
+        with self._lock:
+            for user_id, (posts, scores) in by_user.items():
+                self._write(
+                    {
+                        "type": "ranking",
+                        "step": n,
+                        "user": user_id,
+                        "posts": posts,
+                        "scores": scores,
+                    }
+                )
+
+    def _write(self, event: typing.Dict[str, typing.Any]) -> None:
+        self._pending_events.append(event)
+
+    def _commit(self, n: typing.Optional[int]) -> None:
+        # generator states to resume the run with, see `LoggedRun.restore_rng`
+        name, keys, pos, has_gauss, cached = np.random.get_state()
+        event = {
+            "type": "rng",
+            "random": random.getstate(),
+            "numpy": [name, keys.tolist(), pos, has_gauss, cached],
+        }
+        if self.seed is not None:
+            event["seed"] = self.seed
+        self._write(event)
+        self._write({"type": "step", "step": n})
+        events, embeddings = self._pending_events, self._pending_embeddings
+        self._pending_events, self._pending_embeddings = [], []
+
+        if self.writer is not None:
+            self.writer.submit(self._output, events, embeddings)
+        else:
+            self._output(events, embeddings)
+
+    def _output(
+        self,
+        events: typing.List[typing.Dict[str, typing.Any]],
+        embeddings: typing.List[bytes],
+    ) -> None:
+        # embeddings first, events of a step never reference rows that are not written
+        # yet
+        self._embeddings.write(b"".join(embeddings))
+        self._embeddings.flush()
+        self._events.write(
+            "".join(json.dumps(event, separators=(",", ":")) + "\n" for event in events)
+        )
+        self._events.flush()
+
+        if self.fsync:
+            os.fsync(self._embeddings.fileno())
+            os.fsync(self._events.fileno())
+
+    def _log_user(self, user: User) -> None:
+        if user.id not in self._users:
+            self._users.add(user.id)
+            self._write({"type": "user", "data": user.model_dump(mode="json")})
+
+    def _log_embedding(
+        self, embedding: typing.Optional[typing.Sequence[float]]
+    ) -> typing.Optional[int]:
+        if embedding is None:
+            return None
+
+        embedding = np.asarray(embedding, dtype=np.float32)
+        if self._dim is None:
+            self._dim = len(embedding)
+            self._write({"type": "embeddings", "dim": self._dim})
+        if embedding.shape != (self._dim,):
+            raise ValueError(
+                f"embedding of dimension {embedding.shape} does not fit log of dimension {self._dim}"
+            )
+
+        self._pending_embeddings.append(embedding.tobytes())
+        self._embedding_rows += 1
+        return self._embedding_rows - 1
+
+    def _log_posts(self, feed: Feed) -> None:
+        if len(feed.root) == len(self._posts):
+            return
+        # new posts are usually appended, so the tail holds exactly them; a post
+        # inserted out of order (see `Feed.append`) moves logged posts into the tail,
+        # then the feed is searched for the posts not logged yet
+        posts = feed.root[len(self._posts) :]
+        if any(post.id in self._posts for post in posts):
+            posts = [post for post in feed.root if post.id not in self._posts]
+
+        for post in posts:
+            self._posts.add(post.id)
+            self._track(post)
+            reads, likes = list(post.reads), list(post.likes)
+            for user in [post.user, *reads, *likes]:
+                self._log_user(user)
+
+            self._write(
+                {
+                    "type": "post",
+                    "id": post.id,
+                    "user": post.user.id,
+                    "content": post.content,
+                    "timestamp": post.timestamp,
+                    "reads": [user.id for user in reads],
+                    "likes": [user.id for user in likes],
+                    "embedding": self._log_embedding(post.embedding_array),
+                }
+            )
+
+    def _track(self, post: Post) -> None:
+        # read/like changes are logged from the store from here on
+        if id(post._store) not in self._stores:
+            post._store.track()
+            self._stores[id(post._store)] = post._store
+
+    def _log_changes(self) -> None:
+        for store in self._stores.values():
+            for field, row, index, added in store.changes():
+                user = store.users[index]
+                self._log_user(user)
+                self._write(
+                    {
+                        "type": field[:-1] if added else f"un{field[:-1]}",
+                        "post": store.ids[row],
+                        "user": user.id,
+                    }
+                )
+
+    def _log_agents(
+        self, individuals: typing.Mapping[User, pydantic.BaseModel]
+    ) -> None:
+        for user, agent in individuals.items():
+            self._log_user(user)
+            state = agent_state(agent)
+
+            if user.id not in self._agents:
+                self._write({"type": "agent", "user": user.id, "set": state})
+            else:
+                delta = _delta(self._agents[user.id], state)
+                if delta:
+                    self._write({"type": "agent", "user": user.id, **delta})
+            self._agents[user.id] = state
+
+
+def _read_committed(
+    path: pathlib.Path,
+) -> typing.Iterator[typing.Tuple[typing.Dict[str, typing.Any], int]]:
+    # events up to the last step event, with the byte offset of the end of their step
+    pending: typing.List[typing.Dict[str, typing.Any]] = []
+    offset = 0
+    with open(path / EVENTS, "rb") as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                # cut off by an interrupted run
+                break
+            offset += len(line)
+            pending.append(event)
+            if event["type"] == "step":
+                for event in pending:
+                    yield event, offset
+                pending = []
+
+
+def read_events(
+    path: typing.Union[str, pathlib.Path],
+) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+    """Events of the log in `path`, up to the last completed step."""
+    for event, _ in _read_committed(pathlib.Path(path)):
+        yield event
+
+
+def _resolve(value: typing.Any, post: typing.Callable[[str], typing.Any]) -> typing.Any:
+    # replaces the post references of an agent state
+    if isinstance(value, list):
+        return [_resolve(item, post) for item in value]
+    if isinstance(value, dict) and value.keys() == {"$post"}:
+        return post(value["$post"])
+    return value
+
+
+class LoggedRun:
+    """
+    State of a logged run as of its last completed step, replayed from the log by
+    `load`. Holds the logged JSON data and builds network, feed and agents from it to
+    resume the run.
+
+    Attributes:
+        path (pathlib.Path): Directory of the log files.
+        step (Optional[int]): Last completed step, None if only the initial state was
+            logged.
+        network (Dict[str, Any]): Graph with user ids as nodes in networkx node-link
+            format.
+        users (Dict[str, Dict[str, Any]]): User data by id.
+        posts (Dict[str, Dict[str, Any]]): Post events by id, in feed order; reads and
+            likes as ordered sets of ids.
+        agents (Dict[str, Dict[str, Any]]): Agent states by user id, see `agent_state`.
+        rng (Optional[Dict[str, Any]]): States of the `random` and `numpy.random`
+            generators after the last step.
+        seed (Optional[int]): Root seed of the run's random streams, None if not logged.
+        dim (Optional[int]): Dimension of the logged embeddings.
+        embedding_rows (int): Embedding rows referenced by logged posts.
+        size (int): Bytes of `events.jsonl` up to the last completed step.
+    """
+
+    def __init__(self, path: typing.Union[str, pathlib.Path]):
+        self.path = pathlib.Path(path)
+        self.step: typing.Optional[int] = None
+        self.network: typing.Dict[str, typing.Any] = {}
+        self.users: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+        self.posts: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+        self.agents: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+        self.rng: typing.Optional[typing.Dict[str, typing.Any]] = None
+        self.seed: typing.Optional[int] = None
+        self.dim: typing.Optional[int] = None
+        self.embedding_rows = 0
+        self.size = 0
+
+    def apply(self, event: typing.Dict[str, typing.Any]) -> None:
+        kind = event["type"]
+
+        if kind == "network":
+            self.network = event["data"]
+        elif kind == "user":
+            self.users[event["data"]["id"]] = event["data"]
+        elif kind == "embeddings":
+            self.dim = event["dim"]
+        elif kind == "post":
+            self.posts[event["id"]] = {
+                **event,
+                "reads": dict.fromkeys(event["reads"]),
+                "likes": dict.fromkeys(event["likes"]),
+            }
+            if event["embedding"] is not None:
+                self.embedding_rows = max(self.embedding_rows, event["embedding"] + 1)
+        elif kind in ("read", "like") and event["post"] in self.posts:
+            self.posts[event["post"]][f"{kind}s"][event["user"]] = None
+        elif kind in ("unread", "unlike") and event["post"] in self.posts:
+            self.posts[event["post"]][f"{kind[2:]}s"].pop(event["user"], None)
+        elif kind == "agent":
+            state = self.agents.setdefault(event["user"], {})
+            state.update(event.get("set", {}))
+            for name, items in event.get("extend", {}).items():
+                state[name] = state[name] + items
+        elif kind == "rng":
+            self.rng = {"random": event["random"], "numpy": event["numpy"]}
+            self.seed = event.get("seed", self.seed)
+        elif kind == "step":
+            self.step = event["step"]
+
+    def embeddings(self) -> np.ndarray:
+        """The logged embeddings, memory mapped."""
+        if not self.embedding_rows:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(
+            self.path / EMBEDDINGS,
+            dtype=np.float32,
+            mode="r",
+            shape=(self.embedding_rows, self.dim),
+        )
+
+    def build_users(self, known: typing.Iterable[User] = ()) -> typing.Dict[str, User]:
+        """Users by id, taken from `known` where possible."""
+        users = {user.id: user for user in known}
+        for user_id, data in self.users.items():
+            if user_id not in users:
+                users[user_id] = User.model_validate(data)
+        return users
+
+    def build_network(self, users: typing.Mapping[str, User]) -> Network:
+        graph = networkx.node_link_graph(self.network, edges="edges")
+        return Network(
+            networkx.relabel_nodes(graph, mapping=lambda user_id: users[user_id])
+        )
+
+    def build_feed(self, users: typing.Mapping[str, User]) -> Feed:
+        embeddings = self.embeddings()
+        return Feed(
+            [
+                Post(
+                    user=users[post["user"]],
+                    content=post["content"],
+                    reads={users[user_id] for user_id in post["reads"]},
+                    likes={users[user_id] for user_id in post["likes"]},
+                    id=post["id"],
+                    timestamp=post["timestamp"],
+                    embedding=embeddings[post["embedding"]].tolist()
+                    if post["embedding"] is not None
+                    else None,
+                )
+                for post in self.posts.values()
+            ]
+        )
+
+    def build_agents(
+        self, individuals: typing.Mapping[User, pydantic.BaseModel], feed: Feed
+    ) -> typing.Dict[User, pydantic.BaseModel]:
+        """
+        Copies of the agents of `individuals` with their logged state, posts taken from
+        `feed`. Fields that are not logged, like the LLM client, are kept; agents
+        without a logged state are returned as they are.
+        """
+        posts = {post.id: post for post in feed}
+        restored: typing.Dict[User, pydantic.BaseModel] = {}
+
+        for user, agent in individuals.items():
+            state = self.agents.get(user.id)
+            if state is None:
+                restored[user] = agent
+                continue
+
+            values = {
+                name: getattr(agent, name)
+                for name in type(agent).model_fields
+                if name not in state
+            }
+            values.update(
+                {
+                    name: _resolve(value, posts.__getitem__)
+                    for name, value in state.items()
+                }
+            )
+            restored[user] = type(agent).model_validate(values)
+        return restored
+
+    def restore_rng(self) -> None:
+        """
+        Sets the `random` and `numpy.random` generators to their state after the last
+        step.
+        """
+        if self.rng is None:
+            return
+
+        version, internal, gauss = self.rng["random"]
+        random.setstate((version, tuple(internal), gauss))
+        name, keys, pos, has_gauss, cached = self.rng["numpy"]
+        np.random.set_state(
+            (name, np.array(keys, dtype=np.uint32), pos, has_gauss, cached)
+        )
+
+
+def load(path: typing.Union[str, pathlib.Path]) -> LoggedRun:
+    """Replays the log in `path` up to its last completed step."""
+    run = LoggedRun(path)
+    for event, offset in _read_committed(run.path):
+        run.apply(event)
+        run.size = offset
+    return run
+
+
+def compact(
+    path: typing.Union[str, pathlib.Path],
+    output_path: typing.Optional[typing.Union[str, pathlib.Path]] = None,
+    rankings: bool = False,
+) -> None:
+    """
+    Writes `network.json`, `feed.json` and `individuals.json` as of the last completed
+    step of the run logged in `path` to `output_path` (default `path`); with `rankings`
+    also `rankings/step_{n}_ranking.json` of every step, from the log or from the
+    `RankingsSink` files in `path/rankings`.
+    """
+    path = pathlib.Path(path)
+    output_path = pathlib.Path(output_path or path)
+    if rankings:
+        (output_path / "rankings").mkdir(parents=True, exist_ok=True)
+
+    run = LoggedRun(path)
+    step_rankings: typing.List[typing.Dict[str, typing.Any]] = []
+
+    for event in read_events(path):
+        run.apply(event)
+        kind = event["type"]
+
+        if kind == "ranking" and rankings:
+            step_rankings.extend(
+                {"user": event["user"], "post": post_id, "score": score}
+                for post_id, score in zip(event["posts"], event["scores"], strict=True)
+            )
+        elif kind == "step" and step_rankings:
+            with open(
+                output_path / "rankings" / f"step_{event['step']}_ranking.json", "w"
+            ) as f:
+                json.dump(step_rankings, f, indent=4)
+            step_rankings = []
+
+    embeddings = run.embeddings()
+    users = run.users
+
+    def record(post: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Any]:
+        # the format of `Post.model_dump`
+        return {
+            "user": users[post["user"]],
+            "content": post["content"],
+            "reads": [users[user_id] for user_id in post["reads"]],
+            "likes": [users[user_id] for user_id in post["likes"]],
+            "id": post["id"],
+            "timestamp": post["timestamp"],
+            "embedding": embeddings[post["embedding"]].tolist()
+            if post["embedding"] is not None
+            else None,
+        }
+
+    def resolve(post_id: str) -> typing.Dict[str, typing.Any]:
+        return record(run.posts[post_id])
+
+    if rankings:
+        reader = RankingsReader(path / "rankings")
+        for step in reader.steps:
+            with open(output_path / "rankings" / f"step_{step}_ranking.json", "w") as f:
+                json.dump(
+                    reader.frame(step)[["user", "post", "score"]].to_dict(
+                        orient="records"
+                    ),
+                    f,
+                    indent=4,
+                )
+
+    with open(output_path / "network.json", "w") as f:
+        json.dump(run.network, f, indent=4)
+    with open(output_path / "feed.json", "w") as f:
+        json.dump([record(post) for post in run.posts.values()], f, indent=4)
+    with open(output_path / "individuals.json", "w") as f:
+        json.dump(
+            {
+                user_id: {
+                    name: _resolve(value, resolve) for name, value in state.items()
+                }
+                for user_id, state in run.agents.items()
+            },
+            f,
+            indent=4,
+        )
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m twon_lss compact",
+        description="Materializes the JSON output of a simulation run from its run log.",
+    )
+    parser.add_argument("path", type=pathlib.Path, help="output directory of the run")
+    parser.add_argument(
+        "--output",
+        type=pathlib.Path,
+        default=None,
+        help="directory to write to, default PATH",
+    )
+    parser.add_argument(
+        "--rankings", action="store_true", help="also write the rankings of every step"
+    )
+    args = parser.parse_args(argv)
+
+    compact(args.path, args.output, rankings=args.rankings)
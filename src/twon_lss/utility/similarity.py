@@ -0,0 +1,45 @@
+import typing
+
+import numpy as np
+
+
+def embedding_matrix(
+    embeddings: typing.Sequence[typing.Optional[typing.Sequence[float]]],
+) -> np.ndarray:
+    """
+    Stacks embeddings into a float matrix; missing embeddings become zero rows.
+    """
+    dim = next((len(emb) for emb in embeddings if emb is not None), 0)
+    matrix = np.zeros((len(embeddings), dim))
+
+    for idx, emb in enumerate(embeddings):
+        if emb is not None:
+            matrix[idx] = emb
+
+    return matrix
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return np.divide(
+        matrix, norms, out=np.zeros_like(matrix, dtype=float), where=norms > 0
+    )
+
+
+def mean_cosine_similarity(
+    profiles: typing.Sequence[np.ndarray], candidates: np.ndarray
+) -> np.ndarray:
+    """
+    Mean cosine similarity between each candidate row and the rows of every profile, as
+    a (profiles x candidates) matrix. The mean over profile rows is taken before the dot
+    product, so each profile costs one vector instead of one matrix. Empty profiles
+    score 0.0.
+    """
+    candidates = normalize(np.asarray(candidates, dtype=float))
+    centroids = np.zeros((len(profiles), candidates.shape[-1]))
+
+    for idx, profile in enumerate(profiles):
+        if len(profile):
+            centroids[idx] = normalize(np.asarray(profile, dtype=float)).mean(axis=0)
+
+    return centroids @ candidates.T
@@ -0,0 +1,80 @@
+import typing
+import threading
+import queue
+import atexit
+import logging
+import weakref
+
+
+class BackgroundWriter:
+    """
+    Runs output jobs (serialization, writes, fsync) on a dedicated thread, in the order
+    they were submitted. The queue is bounded: `submit` blocks while `max_pending` jobs
+    wait, so a simulation cannot outrun its storage. Jobs must only touch data that is
+    not changed afterwards, i.e. snapshots taken by the submitting thread.
+
+    `close` (also called at interpreter exit) runs all pending jobs before it returns. A
+    failed job is raised by the next `submit`, `flush` or `close`.
+
+    Attributes:
+        max_pending (int): Jobs that may wait before `submit` blocks.
+    """
+
+    def __init__(self, max_pending: int = 8, name: str = "background-writer"):
+        self.max_pending = max_pending
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._error: typing.Optional[BaseException] = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+        # pending output is written even if the owner never closes the writer
+        ref = weakref.ref(self)
+        self._atexit = lambda: ref() is not None and ref().close()
+        atexit.register(self._atexit)
+
+    def __enter__(self) -> "BackgroundWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def submit(self, fn: typing.Callable, *args: typing.Any) -> None:
+        if self._closed:
+            raise RuntimeError("writer is closed")
+        self._raise()
+        self._queue.put((fn, args))
+
+    def flush(self) -> None:
+        """Waits until every submitted job ran."""
+        self._queue.join()
+        self._raise()
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+            atexit.unregister(self._atexit)
+        self._raise()
+
+    def _raise(self) -> None:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("background write failed") from error
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                fn, args = job
+                fn(*args)
+            except BaseException as e:
+                logging.error(f"Background write failed: {e}")
+                if self._error is None:
+                    self._error = e
+            finally:
+                self._queue.task_done()
@@ -1,5 +1,9 @@
 import typing
 import datetime
+import json
+import time
+import threading
+import http.server
 
 import pytest
 
@@ -55,3 +59,81 @@ def ref_datetime() -> datetime.datetime:
 @pytest.fixture
 def ref_timedelta() -> datetime.timedelta:
     return datetime.timedelta(days=3)
+
+
+def _embed(text: str) -> typing.List[float]:
+    return [float(len(text)), 1.0]
+
+
+class StubLLMHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Answers chat completions on /chat by echoing the last message and feature extraction
+    on /embed with [len(text), 1.0] per text, after `delay` seconds. Records connections
+    and the peak number of requests in flight. The first `throttle` requests are
+    answered with 429 and `Retry-After: 0`.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+        with server.lock:
+            server.connections.add(self.client_address)
+            server.in_flight += 1
+            server.peak = max(server.peak, server.in_flight)
+        time.sleep(server.delay)
+        with server.lock:
+            server.in_flight -= 1
+            server.requests += 1
+            throttled = server.throttle > 0
+            server.throttle -= throttled
+
+        if throttled:
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if self.path == "/chat":
+            body = {
+                "choices": [
+                    {"message": {"content": payload["messages"][-1]["content"]}}
+                ]
+            }
+        else:
+            inputs = payload["inputs"]
+            body = (
+                _embed(inputs)
+                if isinstance(inputs, str)
+                else [_embed(text) for text in inputs]
+            )
+
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def llm_server() -> typing.Iterator[http.server.ThreadingHTTPServer]:
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubLLMHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = set()
+    server.in_flight = server.peak = server.requests = server.throttle = 0
+    server.delay = 0.0
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,154 @@
+import json
+
+import pytest
+
+import httpx
+import numpy as np
+
+from twon_lss.utility import LLM, Chat, Message, RetryPolicy
+from twon_lss.benchmarks import (
+    Scale,
+    data,
+    run,
+    compare,
+    e2e,
+    MockLLMServer,
+    MockServerConfig,
+    Latency,
+)
+from twon_lss.simulations.wp3_simulation import WP3LLM
+
+
+class TestBenchmarks:
+    def test_data(self):
+        users = data.users(50)
+        feed = data.feed(users, posts_per_user=3, steps=4, dim=8)
+
+        assert len(feed) == 150
+        assert [post.timestamp for post in feed] == sorted(
+            post.timestamp for post in feed
+        )
+        assert len(feed[0].embedding) == 8
+        for kind in data.NETWORKS:
+            assert len(data.network(users, kind, degree=4)) == 50
+
+    def test_run_and_compare(self):
+        scale = Scale(users=60, dim=8, sample=10, ranker_users=10)
+        report = run(
+            scale, patterns=["feed.*", "ranker.bcm.*.batched", "simulation.*"], repeat=1
+        )
+
+        names = [result["name"] for result in report["results"]]
+        assert names[:3] == [
+            "feed.get_items_by_user",
+            "feed.get_unread_items_by_user",
+            "feed.filter_by_timestamp",
+        ]
+        assert (
+            "ranker.bcm.positivity.batched" in names
+            and "simulation.filter_posts_by_user" in names
+        )
+        assert not any(
+            name.endswith(".pool") or name.startswith("network.") for name in names
+        )
+        assert all(
+            result["throughput"] > 0 and result["peak_memory"] >= 0
+            for result in report["results"]
+        )
+        json.dumps(report)
+
+        slower = {
+            **report,
+            "results": [
+                {**result, "throughput": result["throughput"] / 2}
+                for result in report["results"]
+            ],
+        }
+        assert not any(row["regression"] for row in compare(report, report))
+        assert all(row["regression"] for row in compare(report, slower))
+
+
+class TestMockLLMServer:
+    def _config(self, **update) -> MockServerConfig:
+        instant = Latency(distribution="constant", mean=0.0)
+        return MockServerConfig(
+            chat_latency=instant, embedding_latency=instant, dim=8, **update
+        )
+
+    def test_formats(self):
+        chat = Chat([Message(role="user", content="hello there")])
+
+        with MockLLMServer(self._config()) as server:
+            response = LLM(
+                api_key="x", url=f"{server.url}/v1/chat/completions"
+            ).generate(chat)
+            assert response in server.config.responses
+            assert (
+                WP3LLM(
+                    api_key="x",
+                    url=f"{server.url}/runsync",
+                    enforce_disabled_reasoning=False,
+                ).generate(chat)
+                == response
+            )
+
+            llm = LLM(api_key="x", url=f"{server.url}/embed")
+            embeddings = llm.extract(["a", "b", "a"])
+            assert np.allclose(embeddings[0], embeddings[2]) and not np.allclose(
+                embeddings[0], embeddings[1]
+            )
+            assert np.linalg.norm(embeddings[1]) == pytest.approx(1.0)
+
+            similarity = httpx.post(
+                f"{server.url}/embed",
+                json={"inputs": {"source_sentence": "a", "sentences": ["a"]}},
+            )
+            assert similarity.json() == [pytest.approx(1.0)]
+            assert (
+                llm.metrics.tokens == 0
+                and LLM(
+                    api_key="x", url=f"{server.url}/v1/chat/completions"
+                ).metrics.tokens
+                > 0
+            )
+
+        assert server.stats["chat"] == server.stats["runpod"] == 1
+
+    def test_failures(self):
+        config = self._config(
+            error_rate=0.3, burst_probability=0.2, burst_duration=0.01, retry_after=0.0
+        )
+
+        with MockLLMServer(config) as server:
+            llm = LLM(
+                api_key="x",
+                url=f"{server.url}/embed",
+                retry=RetryPolicy(base_delay=0.0),
+            )
+            assert len(llm.extract([str(i) for i in range(20)], max_retries=20)) == 20
+            for text in map(str, range(20)):
+                llm.extract(text, max_retries=20)
+
+        assert server.stats["errors"] > 0 and server.stats["throttled"] > 0
+        assert llm.metrics.retries == server.stats["errors"] + server.stats["throttled"]
+
+    def test_load_test(self, tmp_path):
+        config = self._config()
+        report = e2e.run(
+            "twon_base",
+            agents=6,
+            steps=2,
+            config=config,
+            workers=1,
+            output_path=tmp_path,
+        )
+
+        assert report["steps"] == 2 and report["steps_per_second"] > 0
+        assert {"rank", "agents", "embed", "feed_extend"} <= report["phases"].keys()
+        # at least one post per agent and step, the initial feed is embedded before the
+        # first step
+        assert report["server"]["chat"] >= 6 * 2
+        assert (
+            report["llm"]["calls"]
+            == report["server"]["chat"] + report["server"]["embedding"] - 1
+        )
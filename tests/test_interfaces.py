@@ -0,0 +1,354 @@
+import typing
+import types
+import pathlib
+import threading
+
+import pytest
+
+import numpy as np
+import networkx
+
+from twon_lss.schemas import Feed, Post, User, Network
+from twon_lss.utility import Noise, WorkerPool, RandomStreams
+from twon_lss.simulations.bcm import (
+    Ranker,
+    RankerArgs,
+    Agent,
+    Engine,
+    Simulation,
+    SimulationArgs,
+)
+from twon_lss.simulations.wp3_simulation import ActivationScheduler
+
+
+class _PairwiseRanker(Ranker):
+    # a ranker without snapshot support
+    supports_snapshot: typing.ClassVar[bool] = False
+
+
+class TestRanker:
+    @pytest.fixture
+    def network(self, users: typing.List[User]) -> Network:
+        graph = networkx.Graph()
+        graph.add_edges_from([(0, 1), (0, 2), (1, 3), (2, 3)])
+        return Network.from_graph(graph, users)
+
+    @pytest.fixture
+    def feed(self, users: typing.List[User]) -> Feed:
+        return Feed(
+            [
+                Post(user=users[0], content="0.1", reads=[users[1]]),
+                Post(user=users[1], content="0.4"),
+                Post(user=users[2], content="-0.3", reads=[users[0]]),
+                Post(user=users[3], content="0.9", timestamp=1),
+            ]
+        )
+
+    def _ranker(self, mode: str) -> Ranker:
+        return Ranker(
+            type="positivity",
+            args=RankerArgs(noise=Noise(low=1.0, high=1.0), mode=mode, batch_size=3),
+        )
+
+    def test_batched_matches_pairwise(
+        self, users: typing.List[User], feed: Feed, network: Network
+    ):
+        pairwise = self._ranker("pairwise")(users, feed, network)
+        batched = self._ranker("batched")(users, feed, network)
+
+        assert batched.keys() == pairwise.keys()
+        for key, score in pairwise.items():
+            assert batched[key] == pytest.approx(score)
+
+    def test_pool_matches_pairwise(
+        self, users: typing.List[User], feed: Feed, network: Network
+    ):
+        pairwise = self._ranker("pairwise")(users, feed, network)
+
+        with WorkerPool(max_workers=2) as pool:
+            # the second call replaces the snapshot published by the first
+            self._ranker("pairwise")(users, feed, network, pool)
+            pooled = self._ranker("pairwise")(users, feed, network, pool)
+
+        assert pooled.keys() == pairwise.keys()
+        for key, score in pairwise.items():
+            assert pooled[key] == pytest.approx(score)
+
+    def test_pool_without_snapshot(
+        self,
+        users: typing.List[User],
+        feed: Feed,
+        network: Network,
+        caplog: pytest.LogCaptureFixture,
+    ):
+        pairwise = self._ranker("pairwise")(users, feed, network)
+        ranker = _PairwiseRanker(**self._ranker("pairwise").model_dump())
+
+        with WorkerPool(max_workers=2) as pool, caplog.at_level("WARNING"):
+            ranker(users, feed, network, pool)
+            pooled = ranker(users, feed, network, pool)
+
+        assert dict(pooled.items()) == pytest.approx(dict(pairwise.items()))
+        assert (
+            sum("no snapshot support" in record.message for record in caplog.records)
+            == 1
+        )
+
+    def test_own_pool(self, users: typing.List[User], feed: Feed, network: Network):
+        ranker = self._ranker("pairwise")
+        first = ranker(users, feed, network)
+        pool = ranker._own_pool
+
+        # calls without a pool reuse the ranker's pool instead of starting processes
+        # every call
+        assert pool is not None and list(ranker(users, feed, network).items()) == list(
+            first.items()
+        )
+        assert ranker._own_pool is pool
+        ranker.close()
+        assert ranker._own_pool is None
+
+    def test_pool_streaming(
+        self, users: typing.List[User], feed: Feed, network: Network
+    ):
+        ranker = self._ranker("pairwise")
+        streamed = []
+
+        with WorkerPool(max_workers=2) as pool:
+            pooled = ranker(users, feed, network, pool)
+            with ranker.streaming(
+                lambda rankings, user: streamed.append((user, rankings.top(user)))
+            ):
+                rankings = ranker(users, feed, network, pool)
+
+        assert sorted(user.id for user, _ in streamed) == sorted(
+            user.id for user in users
+        )
+        assert all(top == rankings.top(user) for user, top in streamed)
+        assert list(rankings.items()) == list(pooled.items())
+        assert ranker._on_ranked is None
+
+    def test_seeded_modes_identical(
+        self, users: typing.List[User], feed: Feed, network: Network
+    ):
+        streams = RandomStreams(7)
+
+        def rank(mode: str, pool: typing.Optional[WorkerPool] = None, step: int = 2):
+            ranker = Ranker(type="random", args=RankerArgs(mode=mode))
+            with ranker.seeded(streams, step):
+                return dict(ranker(users, feed, network, pool).items())
+
+        pairwise = rank("pairwise")
+        with WorkerPool(max_workers=2) as pool:
+            pooled = rank("pairwise", pool)
+
+        # random network scores and noise are the same in every mode and process, not
+        # only close
+        assert rank("batched") == pairwise == pooled
+        assert rank("batched", step=3) != pairwise
+
+    def test_batched_visibility(
+        self, users: typing.List[User], feed: Feed, network: Network
+    ):
+        scores = self._ranker("batched")(users, feed, network)
+        visible = {(user.id, post.content) for user, post in scores}
+
+        # users[1] already read the post of users[0], users[0] the post of users[2]
+        assert visible == {
+            (users[0].id, "0.4"),
+            (users[1].id, "0.9"),
+            (users[2].id, "0.1"),
+            (users[2].id, "0.9"),
+            (users[3].id, "0.4"),
+            (users[3].id, "-0.3"),
+        }
+
+    def test_batched_empty_feed(self, users: typing.List[User], network: Network):
+        assert self._ranker("batched")(users, Feed(), network) == {}
+
+
+class TestEngine:
+    @pytest.fixture
+    def simulation(
+        self, users: typing.List[User], tmp_path: pathlib.Path
+    ) -> Simulation:
+        graph = networkx.Graph()
+        graph.add_edges_from([(0, 1), (0, 2), (1, 3), (2, 3), (0, 3)])
+        opinions = [-0.4, -0.1, 0.2, 0.35]
+
+        return Simulation(
+            args=SimulationArgs(num_steps=3, compact_on_finish=False, metrics=False),
+            ranker=Ranker(
+                type="positivity", args=RankerArgs(noise=Noise(low=1.0, high=1.0))
+            ),
+            individuals={
+                user: Agent(memory=[opinion], eps=0.4, delta=0.2)
+                for user, opinion in zip(users, opinions, strict=True)
+            },
+            network=Network.from_graph(graph, users),
+            feed=Feed(
+                [
+                    Post(user=user, content=str(opinion))
+                    for user, opinion in zip(users, opinions, strict=True)
+                ]
+            ),
+            output_path=tmp_path,
+        )
+
+    def test_matches_simulation(self, users: typing.List[User], simulation: Simulation):
+        engine = Engine.from_simulation(simulation)
+        simulation()
+        engine(3)
+
+        feed = engine.feed()
+        assert [(post.user, post.content, post.timestamp) for post in feed] == [
+            (post.user, post.content, post.timestamp) for post in simulation.feed
+        ]
+        assert engine.agents() == simulation.individuals
+        assert engine.opinions.tolist() == [
+            simulation.individuals[user].memory[-1] for user in users
+        ]
+        assert len(engine.history) == 4
+
+    def test_random_scores(self, simulation: Simulation):
+        simulation.ranker = Ranker(
+            type="random", args=RankerArgs(noise=Noise(low=1.0, high=1.0))
+        )
+        engine = Engine.from_simulation(simulation, seed=0)
+        _, posts = engine._pairs(engine._candidates(0))
+        scores = engine._network_scores(posts)
+
+        # as in the rankings of `Simulation`, a post has the same uniform score for
+        # every agent it is offered to
+        rankings = simulation.ranker(
+            users=simulation.individuals.keys(),
+            feed=simulation.feed,
+            network=simulation.network,
+        )
+        by_post: typing.Dict[str, typing.Set[float]] = {}
+        for (_, post), score in rankings.items():
+            by_post.setdefault(post.id, set()).add(score)
+        assert all(len(post_scores) == 1 for post_scores in by_post.values())
+
+        assert (
+            len(set(zip(posts.tolist(), scores.tolist(), strict=True)))
+            == len(set(posts.tolist()))
+            < len(posts)
+        )
+        assert np.all((-1.0 <= scores) & (scores <= 1.0))
+
+    def test_window(self, simulation: Simulation):
+        engine = Engine.from_simulation(simulation, window=0)
+        engine(3)
+
+        # posts written in a step are never candidates again, the agents only read the
+        # initial feed
+        assert engine.exposure.tolist() == [3, 2, 2, 3]
+        assert engine.num_posts_total == 4 + 10
+
+
+class TestSimulation:
+    def test_failed_start(self, users: typing.List[User], tmp_path: pathlib.Path):
+        simulation = Simulation(
+            args=SimulationArgs(
+                num_steps=1, metrics=False, resume_from=tmp_path / "missing"
+            ),
+            ranker=Ranker(),
+            individuals={
+                user: Agent(memory=[0.0], eps=0.4, delta=0.2) for user in users
+            },
+            network=Network.from_graph(networkx.path_graph(len(users)), users),
+            feed=Feed([]),
+            output_path=tmp_path,
+        )
+
+        with pytest.raises(FileNotFoundError):
+            simulation()
+
+        # a run that fails before its first step still shuts its pool and writer down
+        assert simulation._pool is None and simulation._writer is None
+        assert not any(
+            thread.name.startswith("simulation-writer")
+            for thread in threading.enumerate()
+        )
+
+
+class TestActivationScheduler:
+    def test_matches_bernoulli_activation(self):
+        np.random.seed(0)
+        probabilities = [0.007, 0.05, 0.5]
+        individuals = {
+            User(): types.SimpleNamespace(activation_probability=p)
+            for p in probabilities
+            for _ in range(300)
+        }
+        scheduler = ActivationScheduler(individuals, start=10)
+
+        steps = 2000
+        counts = {user: 0 for user in individuals}
+        for n in range(10, 10 + steps):
+            due = scheduler.due(n, individuals)
+            assert list(due) == [user for user in individuals if user in due]
+            for user in due:
+                counts[user] += 1
+
+        # activations per agent are binomial(steps, p) as with a draw per agent and step
+        for p in probabilities:
+            observed = np.array(
+                [
+                    counts[user]
+                    for user, agent in individuals.items()
+                    if agent.activation_probability == p
+                ]
+            )
+            assert abs(observed.mean() - steps * p) < 4 * np.sqrt(
+                steps * p * (1 - p) / len(observed)
+            )
+            assert abs(observed.var() / (steps * p * (1 - p)) - 1) < 0.25
+
+    def test_edge_probabilities(self):
+        always, never = User(), User()
+        individuals = {
+            never: types.SimpleNamespace(activation_probability=0.0),
+            always: types.SimpleNamespace(activation_probability=1.0),
+        }
+        scheduler = ActivationScheduler(individuals)
+
+        assert [list(scheduler.due(n, individuals)) for n in range(3)] == [[always]] * 3
+        assert len(scheduler) == 1
+
+        added = User()
+        individuals[added] = types.SimpleNamespace(activation_probability=1.0)
+        assert list(scheduler.due(3, individuals)) == [always, added]
+
+    def test_membership(self):
+        first, second, third = User(), User(), User()
+        individuals = {
+            user: types.SimpleNamespace(activation_probability=1.0)
+            for user in (first, second)
+        }
+        scheduler = ActivationScheduler(individuals)
+        assert list(scheduler.due(0, individuals)) == [first, second]
+
+        # one agent leaves and another joins in the same step
+        del individuals[first]
+        individuals[third] = types.SimpleNamespace(activation_probability=1.0)
+        scheduler.leave([first])
+        scheduler.join(individuals, 1)
+        assert list(scheduler.due(1, individuals)) == [second, third]
+        assert len(scheduler) == 2
+
+        # without join, an agent added is noticed by the changed number of agents
+        individuals[first] = types.SimpleNamespace(activation_probability=1.0)
+        assert list(scheduler.due(2, individuals)) == [second, third, first]
+
+    def test_idle_agents(self):
+        user = User()
+        individuals = {user: types.SimpleNamespace(activation_probability=0.0)}
+        scheduler = ActivationScheduler(individuals)
+        assert not scheduler.due(0, individuals) and len(scheduler) == 0
+
+        individuals[user].activation_probability = 1.0
+        assert not scheduler.due(1, individuals)
+        scheduler.join(individuals, 2)
+        assert list(scheduler.due(2, individuals)) == [user]
@@ -1,10 +1,14 @@
 import typing
+import pickle
 
 import pytest
 
+import numpy as np
+
 import networkx
 
-from twon_lss.schemas import Feed, Post, User, Network
+from twon_lss.schemas import Feed, FeedView, Post, PostStore, User, Network, Rankings
+from twon_lss.schemas.user import REGISTRY
 
 
 class TestFeed:
@@ -56,6 +60,158 @@ class TestFeed:
         for post in unread_feed:
             assert users[0] not in post.reads
 
+    def test_read_index_follows_reads(self, users: typing.List[User], feed: Feed):
+        assert feed.get_unread_indices(users[3]).tolist() == [0, 1, 2]
+
+        feed[1].reads.add(users[3])
+        assert feed.get_read_indices(users[3]).tolist() == [1]
+        assert list(feed.get_unread_items_by_user(users[3])) == [feed[0], feed[2]]
+
+        feed[1].reads.discard(users[3])
+        assert feed.get_read_indices(users[3]).tolist() == []
+
+    def test_get_unread_items_by_authors(self, users: typing.List[User], feed: Feed):
+        # users[0] has read the posts of users[1] and users[2]
+        assert feed.get_unread_items_by_authors(users[0], users[1:3]) == []
+        assert feed.get_unread_items_by_authors(users[3], users[:2]) == [
+            feed[0],
+            feed[1],
+        ]
+
+        feed.append(Post(user=users[1], content="New post"))
+        assert feed.get_unread_items_by_authors(users[0], users[1:3]) == [feed[-1]]
+
+    def test_view(self, feed: Feed, posts: typing.List[Post]):
+        view = feed.view([2, 0])
+        assert isinstance(view, FeedView)
+        assert len(view) == 2
+        assert list(view) == [posts[2], posts[0]]
+        assert view[0] == posts[2]
+        assert list(view[1:]) == [posts[0]]
+
+    def test_view_chaining(self, users: typing.List[User], feed: Feed):
+        feed.append(Post(user=users[1], content="Later post", timestamp=3))
+
+        recent = feed.filter_by_timestamp(3, 1)
+        assert list(recent) == [feed[-1]]
+        assert list(recent.get_unread_items_by_user(users[0])) == [feed[-1]]
+        assert list(recent.get_items_by_user(users[1])) == [feed[-1]]
+        assert len(feed.view().get_items_by_user(users[1])) == 2
+
+        # read state is shared with the viewed feed
+        feed[-1].reads.add(users[0])
+        assert len(recent.get_unread_items_by_user(users[0])) == 0
+        assert recent.get_read_indices(users[0]).tolist() == [0]
+
+    def test_append_keeps_order(self, users: typing.List[User], feed: Feed):
+        feed.append(Post(user=users[0], content="Newer", timestamp=2))
+        feed.append(Post(user=users[1], content="Older", timestamp=1))
+
+        assert [post.timestamp for post in feed] == [0, 0, 0, 1, 2]
+        assert feed.position(feed[-1]) == len(feed) - 1
+        assert list(feed.get_items_by_user(users[1]))[-1].content == "Older"
+
+        # the insert moves the indexes of the newer posts as a rebuild would
+        rebuilt = Feed._from_posts(list(feed))
+        assert all(feed.position(post) == rebuilt.position(post) for post in feed)
+        for user in users:
+            assert (
+                feed.get_items_by_user(user).indices.tolist()
+                == rebuilt.get_items_by_user(user).indices.tolist()
+            )
+            assert (
+                feed.get_read_indices(user).tolist()
+                == rebuilt.get_read_indices(user).tolist()
+            )
+
+        # reads after the insert update the new positions
+        feed[3].reads.add(users[3])
+        assert feed.get_read_indices(users[3]).tolist() == [3]
+
+    def test_filter_by_timestamp(self, users: typing.List[User], feed: Feed):
+        feed.extend(
+            [Post(user=users[0], content=str(t), timestamp=t) for t in (1, 2, 3)]
+        )
+
+        assert [post.timestamp for post in feed.filter_by_timestamp(3, 2)] == [2, 3]
+        assert [
+            post.timestamp
+            for post in feed.filter_by_timestamp(3, 2).filter_by_timestamp(3, 1)
+        ] == [3]
+
+    def test_window(self, users: typing.List[User], feed: Feed):
+        window = feed.window(persistence=2)
+        assert len(window(0)) == 3
+
+        feed.append(Post(user=users[0], content="1", timestamp=1))
+        assert [post.timestamp for post in window(1)] == [0, 0, 0, 1]
+
+        feed.append(Post(user=users[0], content="2", timestamp=2))
+        assert [post.timestamp for post in window(2)] == [1, 2]
+
+    def test_view_to_feed(self, feed: Feed, posts: typing.List[Post]):
+        materialized = feed.view([0, 1]).to_feed()
+        assert isinstance(materialized, Feed)
+        assert list(materialized) == posts[:2]
+
+
+class TestRankings:
+    @pytest.fixture
+    def rankings(self, users: typing.List[User], posts: typing.List[Post]) -> Rankings:
+        return Rankings.from_scores(
+            Feed(posts),
+            {
+                (users[0], posts[0]): 0.2,
+                (users[0], posts[1]): 0.7,
+                (users[0], posts[2]): 0.2,
+                (users[1], posts[2]): 0.5,
+            },
+        )
+
+    def test_mapping(
+        self, users: typing.List[User], posts: typing.List[Post], rankings: Rankings
+    ):
+        assert len(rankings) == 4
+        assert rankings[(users[0], posts[1])] == 0.7
+        assert (users[1], posts[0]) not in rankings
+        assert rankings.count(users[0]) == 3
+        assert rankings.count(users[3]) == 0
+
+    def test_top(
+        self, users: typing.List[User], posts: typing.List[Post], rankings: Rankings
+    ):
+        # equal scores keep candidate order
+        assert rankings.top(users[0]) == [
+            (posts[1], 0.7),
+            (posts[0], 0.2),
+            (posts[2], 0.2),
+        ]
+        assert rankings.top(users[0], 2) == [(posts[1], 0.7), (posts[0], 0.2)]
+        assert rankings.top(users[3], 2) == []
+
+    def test_view(
+        self, users: typing.List[User], posts: typing.List[Post], rankings: Rankings
+    ):
+        view = rankings.view(users[0], 2)
+        assert isinstance(view, FeedView)
+        assert list(view) == [posts[1], posts[0]]
+
+    def test_columns(self, users: typing.List[User], rankings: Rankings):
+        rows, positions, scores = rankings.columns()
+        assert rows.tolist() == [0, 0, 0, 1]
+        assert positions.tolist() == [0, 1, 2, 2]
+        assert scores.tolist() == [0.2, 0.7, 0.2, 0.5]
+
+        rows, positions, scores = rankings.columns([users[1], users[3], users[0]], k=1)
+        assert rows.tolist() == [0, 2]
+        assert positions.tolist() == [2, 1]
+
+    def test_on_feed_view(self, users: typing.List[User], posts: typing.List[Post]):
+        feed = Feed(posts)
+        rankings = Rankings(feed.view([2, 1]))
+        rankings.add(users[0], Rankings.positions_of(feed.view([2, 1])), [0.1, 0.9])
+        assert list(rankings.view(users[0])) == [posts[1], posts[2]]
+
 
 class TestUser:
     num_users: int = 100_000
@@ -84,6 +240,20 @@ class TestUser:
 
         assert user1.id == user2.id
         assert user1.id != user3.id
+        assert user1 == user2 and hash(user1) == hash(user2)
+        assert user1 != user3
+
+    def test_user_index(self):
+        user1 = User(id="index-1")
+        user2 = User(id="index-2")
+
+        assert user2.index == user1.index + 1
+        assert User(id="index-1").index == user1.index
+        assert REGISTRY.id(user1.index) == "index-1"
+        assert pickle.loads(pickle.dumps(user1)).index == user1.index
+        assert (
+            user1.model_copy().index == user1.model_copy(deep=True).index == user1.index
+        )
 
     def test_user_custom_id(self):
         custom_user = User(id="custom-123")
@@ -109,6 +279,110 @@ class TestPost:
         assert hash(basic_post) == post_hash
 
 
+class TestPostStore:
+    def test_post_facade(self, users: typing.List[User], posts: typing.List[Post]):
+        dumped = [post.model_dump() for post in posts]
+        feed = Feed(posts)
+
+        assert feed._store.ids == [post.id for post in posts]
+        assert [post.model_dump() for post in feed] == dumped
+        assert posts[1].reads == {users[0], users[2]}
+
+        posts[0].likes.add(users[3])
+        posts[0].timestamp = 5
+        assert users[3] in posts[0].likes
+        assert feed._store.timestamps[0] == 5
+
+    def test_embeddings(self, users: typing.List[User]):
+        store = PostStore()
+        post = Post(user=users[0], content="a", embedding=[1.0, 2.0])
+        store.add(post)
+        store.add(Post(user=users[1], content="a"))
+
+        assert post.embedding == [1.0, 2.0]
+        assert (
+            post.embedding_array.dtype == np.float32
+            and not post.embedding_array.flags.writeable
+        )
+        assert Post(
+            user=users[0], content="b", embedding=[0.5]
+        ).embedding_array.tolist() == [0.5]
+        assert store.embeddings.tolist() == [[1.0, 2.0], [0.0, 0.0]]
+        assert store.users == {users[0].index: users[0], users[1].index: users[1]}
+        with pytest.raises(ValueError):
+            post.embedding = [1.0]
+
+    def test_copy_is_unbound(self, users: typing.List[User]):
+        feed = Feed([Post(user=users[0], content="a", embedding=[1.0, 2.0])])
+        post = feed[0]
+
+        for copied in (
+            post.model_copy(),
+            post.model_copy(deep=True),
+            post.model_copy(update={"content": "b"}),
+        ):
+            assert copied._location() == (None, -1)
+            copied.likes.add(users[1])
+            copied.timestamp = 3
+        assert post.likes == set() and post.timestamp == 0 and post.content == "a"
+        assert post.model_copy(update={"content": "b"}).content == "b"
+        assert post.model_copy().model_dump() == post.model_dump()
+
+    def test_extend_matches_add(self, users: typing.List[User]):
+        def posts() -> typing.List[Post]:
+            return [
+                Post(
+                    user=users[i % 4],
+                    content=str(i % 3),
+                    reads=users[: i % 4],
+                    likes=users[:1],
+                    id=f"p{i}",
+                    timestamp=i,
+                    embedding=[float(i), 1.0] if i % 2 else None,
+                )
+                for i in range(6)
+            ]
+
+        added, extended = PostStore(), PostStore()
+        for post in posts():
+            added.add(post)
+        bound = posts()
+        assert extended.extend(bound) == range(6)
+
+        assert (
+            extended.records(range(6))
+            == added.records(range(6))
+            == [added.record(row) for row in range(6)]
+        )
+        assert extended.embeddings.tolist() == added.embeddings.tolist()
+        assert [post.content for post in bound] == ["0", "1", "2", "0", "1", "2"]
+        assert bound[3].reads == set(users[:3])
+
+    def test_dump(self, users: typing.List[User], posts: typing.List[Post]):
+        dumped = [post.model_dump() for post in posts]
+        feed = Feed(posts)
+
+        # plain dumps come from the store, dumps with options from a standalone copy
+        assert feed.model_dump() == feed.records() == dumped
+        assert feed.model_dump(mode="json") == dumped
+        assert posts[1].model_dump(exclude={"embedding", "likes"}) == {
+            key: value
+            for key, value in dumped[1].items()
+            if key not in ("embedding", "likes")
+        }
+
+    def test_reads_survive_compaction(self, users: typing.List[User]):
+        posts = [Post(user=users[0], content=str(i)) for i in range(3000)]
+        feed = Feed(posts)
+
+        for post in posts[::2]:
+            post.reads.add(users[1])
+        posts[0].reads.discard(users[1])
+
+        assert [len(post.reads) for post in posts[:4]] == [0, 0, 1, 0]
+        assert feed.get_read_indices(users[1]).tolist() == list(range(2, 3000, 2))
+
+
 class TestNetwork:
     @pytest.fixture
     def network(self, users: typing.List[User]) -> Network:
@@ -151,6 +425,54 @@ class TestNetwork:
             # In a 4-node cycle, each node should have 2 neighbors
             assert len(neighbors) == 2
 
+    def test_snapshot(self, small_network: Network):
+        users = list(small_network)
+        snapshot = small_network.snapshot()
+
+        assert snapshot.indptr.tolist() == [0, 2, 4, 6, 8]
+        assert small_network.degrees.tolist() == [2, 2, 2, 2]
+        assert snapshot.rows_of([users[2], User()]).tolist() == [2, -1]
+        assert snapshot.neighbor_mask(
+            np.array([0, -1]), np.array([1, 2, 3, -1])
+        ).tolist() == [
+            [True, False, True, False],
+            [False, False, False, False],
+        ]
+        assert small_network.snapshot() is snapshot
+
+    def test_snapshot_invalidation(self, small_network: Network):
+        users = list(small_network)
+        small_network.add_edge(users[0], users[2])
+        assert users[2] in small_network.get_neighbors(users[0])
+
+        small_network.remove_edge(users[0], users[2])
+        assert users[2] not in small_network.get_neighbors(users[0])
+
+        with pytest.raises(networkx.NetworkXError):
+            small_network.get_neighbors(User())
+
+    def test_snapshot_root_edits(self, small_network: Network):
+        users = list(small_network)
+        neighbors = small_network.get_neighbors(users[0])
+
+        # edits of root itself keep the node count, the snapshot still notices them
+        small_network.root.add_edge(users[0], users[2])
+        assert users[2] in small_network.get_neighbors(users[0])
+
+        small_network.root.remove_edges_from([(users[0], users[2])])
+        assert small_network.get_neighbors(users[0]) == neighbors
+        assert small_network.snapshot().indptr.tolist() == [0, 2, 4, 6, 8]
+
+        # the caller's graph is left as it is
+        assert (
+            type(small_network.root) is networkx.Graph
+            and type(Network().root) is networkx.Graph
+        )
+        assert (
+            pickle.loads(pickle.dumps(small_network)).get_neighbors(users[0])
+            == neighbors
+        )
+
     def test_network_relabeling(self, users: typing.List[User]):
         graph = networkx.path_graph(len(users))
         network = Network.from_graph(graph, users)
@@ -1,11 +1,40 @@
 import typing
+import random
+import asyncio
+import time
+import json
+import pickle
+import threading
 
+import httpx
 import pytest
+import numpy as np
+import pydantic
+import networkx
 import dotenv
 
 import huggingface_hub
 
-from twon_lss.utility import Noise, LLM, Message, Chat
+from twon_lss.schemas import Post, User, Feed, Network, Rankings
+from twon_lss.utility import (
+    Noise,
+    LLM,
+    Message,
+    Chat,
+    FeedSnapshot,
+    RateLimiter,
+    RetryPolicy,
+    EmbeddingCache,
+    EmbeddingBatcher,
+    RankingsSink,
+    RankingsReader,
+    BackgroundWriter,
+    RandomStreams,
+)
+from twon_lss.utility.ratelimit import parse_retry_after
+from twon_lss.utility.runlog import RunLog, compact, load, read_events
+from twon_lss.utility.metrics import Instrumentation, CProfileHook, TracemallocHook
+from twon_lss.utility.llm import _usage_tokens, _transient
 
 
 CFG = dotenv.dotenv_values(".env")
@@ -37,6 +66,494 @@ class TestLLM:
         print(llm.similarity(SAMPLES[0], SAMPLES))
 
 
+class TestLLMClient:
+    def test_generate_reuses_connection(self, llm_server):
+        llm = LLM(api_key="-", url=f"{llm_server.url}/chat")
+
+        for sample in SAMPLES:
+            assert llm.generate(Chat([Message(role="user", content=sample)])) == sample
+        assert len(llm_server.connections) == 1
+
+    def test_agenerate_concurrency(self, llm_server):
+        llm_server.delay = 0.05
+        llm = LLM(api_key="-", url=f"{llm_server.url}/chat", max_concurrency=3)
+
+        async def run():
+            chats = [Chat([Message(role="user", content=str(i))]) for i in range(12)]
+            responses = await asyncio.gather(*(llm.agenerate(chat) for chat in chats))
+            await llm.aclose()
+            return responses
+
+        assert asyncio.run(run()) == [str(i) for i in range(12)]
+        assert llm_server.peak == 3
+
+    def test_extract_chunks(self, llm_server):
+        llm = LLM(api_key="-", url=f"{llm_server.url}/embed")
+        texts = [str(i) for i in range(250)]
+
+        assert llm.extract(texts) == [[float(len(text)), 1.0] for text in texts]
+        assert llm.extract("abc") == [3.0, 1.0]
+        assert llm_server.requests == 4
+
+
+class TestEmbeddingCache:
+    def test_round_trip(self, tmp_path):
+        cache = EmbeddingCache(tmp_path, "model", "url")
+        cache.put(["a", "b"], [[1.0, 2.0], [3.0, 4.0]])
+        cache.put(["b", "c"], [[0.0, 0.0], [5.0, 6.0]])
+
+        hits = EmbeddingCache(tmp_path, "model", "url").get(["c", "a", "d", "b"])
+        assert [hit.tolist() if hit is not None else None for hit in hits] == [
+            [5.0, 6.0],
+            [1.0, 2.0],
+            None,
+            [3.0, 4.0],
+        ]
+        assert len(EmbeddingCache(tmp_path, "other", "url")) == 0
+
+        with pytest.raises(ValueError):
+            cache.put(["e"], [[1.0, 2.0, 3.0]])
+
+    def test_extract_misses_only(self, llm_server, tmp_path):
+        llm = LLM(api_key="-", url=f"{llm_server.url}/embed", cache_dir=tmp_path)
+        texts = [str(i) for i in range(150)]
+
+        assert llm.extract(texts) == [[float(len(text)), 1.0] for text in texts]
+        assert llm_server.requests == 2
+
+        llm = LLM(api_key="-", url=f"{llm_server.url}/embed", cache_dir=tmp_path)
+        assert llm.extract(texts[:10] + ["new"]) == [
+            [float(len(text)), 1.0] for text in texts[:10] + ["new"]
+        ]
+        assert llm.extract("new") == [3.0, 1.0]
+        assert llm_server.requests == 3
+
+
+class TestEmbeddingBatcher:
+    def test_batches(self, llm_server, users: typing.List[User]):
+        llm = LLM(api_key="-", url=f"{llm_server.url}/embed")
+        posts = [Post(user=users[0], content="x" * i) for i in range(25)]
+
+        with EmbeddingBatcher(llm, max_batch_size=10, max_delay=60.0) as batcher:
+            for start in range(0, len(posts), 5):
+                batcher.submit(posts[start : start + 5])
+
+        assert [list(post.embedding) for post in posts] == [
+            [float(i), 1.0] for i in range(25)
+        ]
+        assert llm_server.requests == 3
+
+    def test_delay(self, llm_server, users: typing.List[User]):
+        batcher = EmbeddingBatcher(
+            LLM(api_key="-", url=f"{llm_server.url}/embed"),
+            max_batch_size=10,
+            max_delay=0.01,
+        )
+        post = Post(user=users[0], content="abc")
+
+        batcher.submit([post])
+        time.sleep(0.5)
+        assert list(post.embedding) == [3.0, 1.0]
+        batcher.join()
+        assert llm_server.requests == 1
+
+
+class TestResponseStore:
+    def test_record_replay(self, llm_server, tmp_path):
+        chats = [
+            Chat([Message(role="user", content=content)]) for content in ["a", "b", "a"]
+        ]
+
+        llm = LLM(
+            api_key="-",
+            url=f"{llm_server.url}/chat",
+            response_store=tmp_path / "responses.jsonl",
+        )
+        assert [llm.generate(chat) for chat in chats] == ["a", "b", "a"]
+        assert llm_server.requests == 3
+
+        replay = LLM(
+            api_key="-",
+            url="http://127.0.0.1:1/chat",
+            response_store=tmp_path / "responses.jsonl",
+            response_mode="replay",
+        )
+        assert [replay.generate(chat) for chat in chats + chats] == ["a", "b", "a"] * 2
+        with pytest.raises(RuntimeError):
+            replay.generate(Chat([Message(role="user", content="c")]), max_retries=0)
+
+        cached = LLM(
+            api_key="-",
+            url=f"{llm_server.url}/chat",
+            response_store=tmp_path / "responses.jsonl",
+            response_mode="cached",
+        )
+        assert [cached.generate(chat) for chat in chats + chats] == ["a", "b", "a"] * 2
+        assert llm_server.requests == 6
+        assert len(cached.responses) == 6
+
+
+class TestRateLimiter:
+    def test_token_bucket(self):
+        limiter = RateLimiter(max_rate=50.0, burst=2)
+
+        async def run():
+            start = time.monotonic()
+            for _ in range(7):
+                await limiter.acquire()
+            return time.monotonic() - start
+
+        # two requests pass at once, the other five wait for refills at 50/s
+        assert 0.09 <= asyncio.run(run()) < 0.5
+        assert limiter.metrics.requests == 7
+
+    def test_adaptive_rate(self):
+        limiter = RateLimiter(max_rate=10.0, burst=1)
+        limiter.throttled()
+        limiter.throttled()
+        assert limiter.rate == 2.5
+
+        for _ in range(10):
+            limiter.succeeded()
+        assert limiter.rate == pytest.approx(3.5)
+        assert limiter.metrics.throttled == 2
+
+    def test_retry_delay(self):
+        policy = RetryPolicy(base_delay=1.0, max_delay=3.0)
+
+        assert all(0 <= policy.delay(attempt) <= 3.0 for attempt in range(10))
+        assert policy.delay(5, retry_after=0.5) == 0.5
+        assert parse_retry_after("2") == 2.0
+        assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+        assert parse_retry_after(None) is None
+
+        request = httpx.Request("POST", "http://llm")
+
+        def status(code: int) -> httpx.HTTPStatusError:
+            return httpx.HTTPStatusError(
+                "", request=request, response=httpx.Response(code, request=request)
+            )
+
+        assert (
+            _transient(status(429))
+            and _transient(status(503))
+            and _transient(httpx.ReadTimeout("", request=request))
+        )
+        assert (
+            not _transient(status(401))
+            and not _transient(status(404))
+            and not _transient(KeyError("output"))
+        )
+
+    def test_retries_throttled_requests(self, llm_server):
+        llm_server.throttle = 2
+        llm = LLM(
+            api_key="-", url=f"{llm_server.url}/chat", max_requests_per_second=50.0
+        )
+
+        assert llm.generate(Chat([Message(role="user", content="hi")])) == "hi"
+        assert llm.metrics.throttled == 2
+        assert llm.metrics.retries == 2
+        assert llm.metrics.rate < llm.max_requests_per_second
+
+        # clients with other limits do not share the adapted rate, clients without a
+        # limit are admitted at once
+        assert (
+            LLM(
+                api_key="-", url=f"{llm_server.url}/chat", max_requests_per_second=5.0
+            ).metrics.rate
+            == 5.0
+        )
+        assert LLM(api_key="-", url=f"{llm_server.url}/chat").metrics.rate is None
+
+    def test_max_retries(self, llm_server):
+        llm_server.throttle = 3
+        llm = LLM(api_key="-", url=f"{llm_server.url}/chat")
+
+        with pytest.raises(RuntimeError) as error:
+            llm.generate(Chat([Message(role="user", content="hi")]), max_retries=1)
+        assert isinstance(error.value.__cause__, httpx.HTTPStatusError)
+        assert llm.metrics.retries == 1 and llm.metrics.failures == 1
+
+
+class TestRunLog:
+    class Individual(pydantic.BaseModel):
+        memory: typing.List[str] = pydantic.Field(default_factory=list)
+        posts: typing.List[Post] = pydantic.Field(default_factory=list)
+        activations: int = 0
+
+    def test_compact(
+        self, tmp_path, posts: typing.List[Post], users: typing.List[User]
+    ):
+        graph = networkx.Graph()
+        graph.add_edges_from([(0, 1), (1, 2), (2, 3)])
+        network = Network.from_graph(graph, users)
+        feed = Feed(posts)
+        individuals = {user: self.Individual() for user in users}
+
+        with RunLog(tmp_path) as log:
+            log.begin(network, feed, individuals)
+
+            new = [
+                Post(user=users[3], content="new", timestamp=1, embedding=[0.5, 0.25])
+            ]
+            feed[0].reads.add(users[1])
+            feed[1].likes.add(users[3])
+            feed[1].reads.discard(users[0])
+            individuals[users[3]].memory.append("thought")
+            individuals[users[3]].posts.extend(new)
+            individuals[users[3]].activations += 1
+            feed.extend(new)
+            log.step(0, feed, individuals)
+
+            # an unfinished step is not part of the log
+            feed[2].reads.add(users[3])
+            log._log_changes()
+
+        assert [
+            event["step"] for event in read_events(tmp_path) if event["type"] == "step"
+        ] == [None, 0]
+
+        compact(tmp_path)
+        feed.root[2].reads.discard(users[3])
+        feed.to_json(tmp_path / "expected.json")
+
+        def as_sets(
+            records: typing.List[typing.Dict[str, typing.Any]],
+        ) -> typing.List[typing.Dict[str, typing.Any]]:
+            return [
+                {
+                    **record,
+                    "reads": {u["id"] for u in record["reads"]},
+                    "likes": {u["id"] for u in record["likes"]},
+                }
+                for record in records
+            ]
+
+        assert as_sets(json.load(open(tmp_path / "feed.json"))) == as_sets(
+            json.load(open(tmp_path / "expected.json"))
+        )
+        assert json.load(open(tmp_path / "network.json")) == network.node_link_data()
+        assert json.load(open(tmp_path / "individuals.json")) == {
+            user.id: individual.model_dump(mode="json")
+            for user, individual in individuals.items()
+        }
+
+    def test_stepped(
+        self, tmp_path, posts: typing.List[Post], users: typing.List[User]
+    ):
+        network = Network.from_graph(networkx.path_graph(len(users)), users)
+        individuals = {user: self.Individual() for user in users[:3]}
+
+        with RunLog(tmp_path) as log:
+            log.begin(network, Feed(posts), individuals)
+            individuals[users[0]].activations += 1
+            individuals[users[1]].activations += 1
+            individuals[users[3]] = self.Individual(activations=1)
+            log.step(0, Feed(posts), individuals, stepped={users[0]})
+
+        # agents that did not step are not compared, new agents are logged in any case
+        events = list(read_events(tmp_path))
+        step = [event["type"] for event in events].index("step")
+        assert [
+            event["user"] for event in events[step:] if event["type"] == "agent"
+        ] == [users[0].id, users[3].id]
+
+    def test_out_of_order(self, tmp_path, users: typing.List[User]):
+        network = Network.from_graph(networkx.path_graph(len(users)), users)
+        feed = Feed(
+            [
+                Post(user=users[0], content="a", timestamp=0),
+                Post(user=users[1], content="b", timestamp=2),
+            ]
+        )
+
+        with RunLog(tmp_path) as log:
+            log.begin(network, feed, {})
+            # inserted before the newest post, which moves a logged post into the tail
+            # of the feed
+            feed.append(Post(user=users[2], content="c", timestamp=1))
+            log.step(0, feed, {})
+            log.step(1, feed, {})
+            feed.append(Post(user=users[3], content="d", timestamp=3))
+            log.step(2, feed, {})
+
+        posts = [
+            event["id"] for event in read_events(tmp_path) if event["type"] == "post"
+        ]
+        assert sorted(posts) == sorted(post.id for post in feed) and len(posts) == len(
+            feed
+        )
+        run = load(tmp_path)
+        assert [post.id for post in run.build_feed(run.build_users(users))] == [
+            post.id for post in feed
+        ]
+
+    def test_resume(self, tmp_path, posts: typing.List[Post], users: typing.List[User]):
+        graph = networkx.Graph()
+        graph.add_edges_from([(0, 1), (1, 2), (2, 3)])
+        network = Network.from_graph(graph, users)
+        feed = Feed(
+            [
+                Post(user=post.user, content=post.content, embedding=[0.5, 0.25])
+                for post in posts
+            ]
+        )
+        individuals = {user: self.Individual() for user in users}
+
+        with RunLog(tmp_path) as log:
+            log.begin(network, feed, individuals)
+            individuals[users[0]].posts.append(feed[0])
+            individuals[users[0]].activations += 1
+            feed[0].likes.add(users[2])
+            log.step(0, feed, individuals)
+            expected = random.random()
+
+            # an interrupted step is dropped
+            feed.extend(
+                [Post(user=users[1], content="lost", timestamp=1, embedding=[1.0, 1.0])]
+            )
+            log.step(1, feed, individuals)
+        with open(tmp_path / "events.jsonl", "r+b") as f:
+            f.truncate(f.seek(0, 2) - 10)
+
+        run = load(tmp_path)
+        assert run.step == 0
+
+        restored_users = run.build_users(users)
+        restored_feed = run.build_feed(restored_users)
+        restored = run.build_agents(
+            {user: self.Individual() for user in users}, restored_feed
+        )
+        assert [post.id for post in restored_feed] == [post.id for post in feed][
+            : len(posts)
+        ]
+        assert restored_feed[0].likes == {users[2]} and restored_feed[0].embedding == [
+            0.5,
+            0.25,
+        ]
+        assert (
+            restored[users[0]].posts == [restored_feed[0]]
+            and restored[users[0]].activations == 1
+        )
+        assert (
+            run.build_network(restored_users).node_link_data()
+            == network.node_link_data()
+        )
+
+        random.random()
+        run.restore_rng()
+        assert random.random() == expected
+
+        with RunLog(tmp_path) as log:
+            log.resume(run, restored_feed)
+            restored_feed.extend(
+                [Post(user=users[1], content="new", timestamp=1, embedding=[0.0, 1.0])]
+            )
+            restored_feed[1].reads.add(users[3])
+            log.step(1, restored_feed, restored)
+
+        assert [
+            event["step"] for event in read_events(tmp_path) if event["type"] == "step"
+        ] == [None, 0, 1]
+        resumed = load(tmp_path)
+        assert [post["content"] for post in resumed.posts.values()][-1] == "new"
+        assert list(resumed.posts.values())[1]["reads"].keys() == {users[3].id}
+        assert resumed.embeddings().tolist()[-1] == [0.0, 1.0]
+
+
+class TestRankingsSink:
+    @pytest.fixture
+    def rankings(self, users: typing.List[User], posts: typing.List[Post]) -> Rankings:
+        rankings = Rankings(Feed(posts))
+        rankings.add(users[0], [0, 1, 2], [0.2, 0.7, 0.4])
+        rankings.add(users[1], [2], [0.5])
+        rankings.add(users[2], [1, 0], [0.1, 0.3])
+        return rankings
+
+    def test_round_trip(
+        self,
+        tmp_path,
+        rankings: Rankings,
+        users: typing.List[User],
+        posts: typing.List[Post],
+    ):
+        RankingsSink(tmp_path).write(3, rankings)
+        RankingsSink(tmp_path, top_k=1).write(4, rankings)
+
+        reader = RankingsReader(tmp_path)
+        assert reader.steps == [3, 4]
+        assert reader.arrays(3)["score"].dtype == np.float32
+
+        frame = reader.frame(3)
+        assert [(row.user, row.post, row.position) for row in frame.itertuples()] == [
+            (user.id, posts[pos].id, pos)
+            for (user, _), pos in zip(rankings, [0, 1, 2, 2, 1, 0], strict=True)
+        ]
+        assert frame["score"].tolist() == pytest.approx(
+            [score for _, score in rankings.items()]
+        )
+        assert reader.frame(4)["post"].tolist() == [
+            posts[1].id,
+            posts[2].id,
+            posts[0].id,
+        ]
+
+    def test_sample(self, tmp_path, rankings: Rankings):
+        sink = RankingsSink(tmp_path, sample=0.5, seed=0)
+        assert len(set(sink.columns(rankings)["user_ids"])) == 2
+
+        # the sample only depends on seed and step, also in a resumed run
+        def sampled(sink: RankingsSink) -> typing.List[typing.List[str]]:
+            return [sink.columns(rankings, n)["user_ids"].tolist() for n in range(8)]
+
+        drawn = sampled(sink)
+        assert drawn == sampled(RankingsSink(tmp_path, sample=0.5, seed=0))
+        assert drawn == sampled(
+            RankingsSink(tmp_path, sample=0.5, streams=RandomStreams(0))
+        )
+        assert len({tuple(users) for users in drawn}) > 1
+
+        with pytest.raises(ValueError):
+            RankingsSink(tmp_path, sample=0.0)
+
+
+class TestBackgroundWriter:
+    def test_order_and_flush(self):
+        written = []
+        with BackgroundWriter(max_pending=2) as writer:
+            for i in range(20):
+                writer.submit(written.append, i)
+            writer.flush()
+            assert written == list(range(20))
+
+            writer.submit(time.sleep, 0.05)
+            writer.submit(written.append, 20)
+        assert written == list(range(21))
+
+    def test_backpressure(self):
+        release = threading.Event()
+        writer = BackgroundWriter(max_pending=1)
+        writer.submit(release.wait)
+        writer.submit(lambda: None)
+
+        blocked = threading.Thread(target=writer.submit, args=(lambda: None,))
+        blocked.start()
+        blocked.join(0.1)
+        assert blocked.is_alive()
+
+        release.set()
+        blocked.join()
+        writer.close()
+
+    def test_error(self):
+        writer = BackgroundWriter()
+        writer.submit(lambda: 1 / 0)
+        with pytest.raises(RuntimeError):
+            writer.flush()
+        writer.close()
+
+
 class TestNoise:
     @pytest.fixture
     def noise(self) -> Noise:
@@ -64,3 +581,117 @@ class TestNoise:
         samples = noise.draw_samples(100)
         assert len(samples) == 100
         assert all(isinstance(s, float) for s in samples)
+
+
+class TestRandomStreams:
+    def test_streams(self, users: typing.List[User]):
+        streams = RandomStreams(42)
+        draws = streams.generator(3, users[0], "noise").random(4)
+
+        # a stream only depends on seed and key, also across pickling into workers
+        assert np.array_equal(
+            RandomStreams(42).generator(3, users[0].id, "noise").random(4), draws
+        )
+        assert np.array_equal(
+            pickle.loads(pickle.dumps(streams))
+            .generator(3, users[0], "noise")
+            .random(4),
+            draws,
+        )
+        assert np.allclose(
+            Noise().draw_array(4, streams.generator(3, users[0], "noise")),
+            0.8 + 0.4 * draws,
+        )
+
+        others = [
+            RandomStreams(43).generator(3, users[0], "noise"),
+            streams.generator(4, users[0], "noise"),
+            streams.generator(3, users[1], "noise"),
+            streams.generator(3, users[0], "like"),
+            streams.generator(3, None, "noise"),
+        ]
+        assert all(not np.array_equal(rng.random(4), draws) for rng in others)
+
+    def test_fresh_seed(self):
+        assert RandomStreams().seed != RandomStreams().seed
+
+        with pytest.raises(ValueError):
+            RandomStreams(0).generator(-1)
+
+
+class TestFeedSnapshot:
+    def test_publish_attach(self, posts: typing.List[Post], users: typing.List[User]):
+        posts[0].embedding = [1.0, 0.0]
+        snapshot = FeedSnapshot.publish(
+            posts, {user: idx for idx, user in enumerate(users)}, scores=[0.5, 1.0, 1.5]
+        )
+
+        try:
+            attached = FeedSnapshot.attach(snapshot.handle)
+            assert len(attached) == len(posts)
+            assert attached.ids.tolist() == [post.id.encode() for post in posts]
+            assert attached.authors.tolist() == [0, 1, 2]
+            assert attached.embeddings.tolist() == [[1.0, 0.0], [0.0, 0.0], [0.0, 0.0]]
+            assert attached.scores.tolist() == [0.5, 1.0, 1.5]
+            assert not attached.embeddings.flags.writeable
+            attached.close()
+
+        finally:
+            snapshot.unlink()
+
+
+class TestInstrumentation:
+    def test_step_record(self, tmp_path):
+        limiter = RateLimiter(max_rate=100.0, burst=10)
+        metrics = Instrumentation(
+            [limiter, limiter],
+            hooks=[CProfileHook(tmp_path, [0]), TracemallocHook([0], top=3)],
+        )
+
+        metrics.begin(0)
+        with metrics.phase("rank"):
+            time.sleep(0.01)
+        for seconds in (0.1, 0.2, 0.3):
+            metrics.duration("agent_step", seconds)
+        metrics.count("new_posts", 2)
+        for latency in (0.5, 1.5):
+            asyncio.run(limiter.acquire())
+            limiter.completed(latency, tokens=20)
+        record = metrics.end(feed_size=7)
+
+        assert record["step"] == 0 and record["phases"]["rank"] >= 0.01
+        assert record["durations"]["agent_step"]["count"] == 3
+        assert record["durations"]["agent_step"]["p50"] == pytest.approx(0.2)
+        assert record["counts"] == {"new_posts": 2, "feed_size": 7}
+        assert record["llm"]["calls"] == 2 and record["llm"]["tokens"] == 40
+        assert record["llm"]["latency"]["max"] == pytest.approx(1.5)
+        assert (tmp_path / "step_0.prof").exists() and record["memory"]["peak"] > 0
+        json.dumps(record)
+
+        # only the selected steps are profiled
+        metrics.begin(1)
+        record = metrics.end()
+        assert (
+            "profile" not in record
+            and "memory" not in record
+            and record["llm"]["calls"] == 0
+        )
+
+        metrics.close()
+        assert limiter._watchers == []
+
+    def test_usage_tokens(self):
+        assert (
+            _usage_tokens(
+                {
+                    "usage": {
+                        "prompt_tokens": 10,
+                        "completion_tokens": 5,
+                        "total_tokens": 15,
+                    }
+                }
+            )
+            == 15
+        )
+        assert _usage_tokens({"output": [{"usage": {"input": 10, "output": 7}}]}) == 17
+        assert _usage_tokens([[0.1, 0.2]]) == 0